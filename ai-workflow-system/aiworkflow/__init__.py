@@ -0,0 +1 @@
+"""Modules of the multi-agent orchestrator; ``orchestrator.py`` is the CLI."""
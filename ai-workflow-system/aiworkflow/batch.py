@@ -0,0 +1,128 @@
+"""Batch mode: several workflows from one file."""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+from .telemetry import METRICS, log
+from .cancellation import SHUTDOWN
+from .policy import nearest_rank
+from .workflow import WorkflowOrchestrator
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BATCH MODE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_batch(path: Path) -> List[Dict[str, str]]:
+    """Read a JSONL batch file: one ``{"request": ..., "id": ...}`` object or bare
+    JSON string per line. Blank lines and lines starting with # are skipped."""
+    batch = []
+    for number, line in enumerate(path.read_text().splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{path}:{number}: invalid JSON: {e}")
+        if isinstance(item, str):
+            item = {"request": item}
+        if not isinstance(item, dict) or not str(item.get("request") or "").strip():
+            raise ValueError(f"{path}:{number}: expected a request string or an object with 'request'")
+        batch.append({"id": str(item.get("id") or number), "request": str(item["request"])})
+    return batch
+
+
+class BatchRunner:
+    """Runs many workflows at once, each in its own isolated workspace.
+    
+    At most ``max_workflows`` run at a time, each on its own thread and event
+    loop as in the daemon. Their agents share the host-wide slots and rate
+    limit, and concurrent agents with the same cache key are coalesced into
+    one claude run by ``IN_FLIGHT``.
+    """
+    
+    def __init__(self, config: Dict, max_workflows: int = 4, distributed: Optional[bool] = None):
+        self.config = config
+        self.max_workflows = max(1, max_workflows)
+        self.distributed = distributed
+    
+    def run_one(self, item: Dict[str, str]) -> Dict[str, Any]:
+        started = time.time()
+        if SHUTDOWN.requested:
+            return {"id": item["id"], "workflow_id": None, "success": False, "duration_seconds": 0.0,
+                    "agents": 0, "cache_hits": 0, "error": f"skipped, interrupted by {SHUTDOWN.name}"}
+        try:
+            orchestrator = WorkflowOrchestrator(
+                item["request"], isolated=True, distributed=self.distributed, config=self.config
+            )
+        except Exception as e:
+            log("ERROR", f"Batch item {item['id']} could not start: {e}")
+            return {"id": item["id"], "workflow_id": None, "success": False,
+                    "duration_seconds": 0.0, "agents": 0, "cache_hits": 0, "error": str(e)}
+        try:
+            success = orchestrator.run_full_workflow()
+            error = None
+        except Exception as e:
+            log("ERROR", f"Batch item {item['id']} crashed: {e}")
+            success, error = False, str(e)
+        finally:
+            orchestrator.store.close()
+        return {
+            "id": item["id"],
+            "workflow_id": orchestrator.state.workflow_id,
+            "success": success,
+            "duration_seconds": round(time.time() - started, 3),
+            "agents": len(orchestrator.state.completed_agents),
+            "cache_hits": orchestrator.executor.cache.stats()["hits"],
+            "error": error,
+        }
+    
+    def run(self, batch: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Run the batch and return its summary."""
+        log("INFO", f"Running {len(batch)} workflows, {self.max_workflows} at a time")
+        coalesced_before = METRICS.get("orchestrator_coalesced_runs_total")
+        started = time.time()
+        with ThreadPoolExecutor(self.max_workflows, thread_name_prefix="batch") as pool:
+            results = list(pool.map(self.run_one, batch))
+        wall = time.time() - started
+        
+        succeeded = [r for r in results if r["success"]]
+        durations = sorted(r["duration_seconds"] for r in succeeded)
+        return {
+            "workflows": len(results),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "wall_seconds": round(wall, 3),
+            "workflows_per_hour": round(len(succeeded) * 3600 / wall, 2) if wall > 0 else 0.0,
+            "p50_seconds": nearest_rank(durations, 0.50),
+            "p95_seconds": nearest_rank(durations, 0.95),
+            "agents_completed": sum(r["agents"] for r in results),
+            "cache_hits": sum(r["cache_hits"] for r in results),
+            "coalesced": int(METRICS.get("orchestrator_coalesced_runs_total") - coalesced_before),
+            "results": results,
+        }
+
+
+def print_batch_summary(summary: Dict[str, Any]):
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:.1f}s" if value is not None else "-"
+    
+    print()
+    header = f"{'id':<12} {'workflow':<24} {'ok':>3} {'time':>9} {'agents':>7} {'cached':>7}"
+    print(header)
+    print("─" * len(header))
+    for r in summary["results"]:
+        print(f"{r['id'][:12]:<12} {(r['workflow_id'] or '-'):<24} "
+              f"{'✓' if r['success'] else '✗':>3} {seconds(r['duration_seconds']):>9} "
+              f"{r['agents']:>7} {r['cache_hits']:>7}")
+    print()
+    print(f"{summary['succeeded']}/{summary['workflows']} workflows succeeded in "
+          f"{summary['wall_seconds']:.1f}s: {summary['workflows_per_hour']:.1f} workflows/hour")
+    print(f"Workflow time p50 {seconds(summary['p50_seconds'])}, "
+          f"p95 {seconds(summary['p95_seconds'])}")
+    print(f"{summary['agents_completed']} agent runs completed, {summary['cache_hits']} served "
+          f"from the cache, {summary['coalesced']} of them coalesced with a concurrent run")
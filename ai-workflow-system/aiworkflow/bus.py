@@ -0,0 +1,333 @@
+"""Messages exchanged between agents and their on-disk bus."""
+
+import os
+import json
+import mmap
+import uuid
+import re
+import threading
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any
+
+from .core import AGENTS, atomic_write_text
+from .telemetry import log
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MESSAGE BUS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class Message:
+    message_id: str
+    timestamp: str
+    from_agent: str
+    to_agent: str
+    message_type: str  # handoff, request, response, error, clarification
+    payload: Dict[str, Any]
+    workflow_id: str = ""
+    
+    @classmethod
+    def handoff(
+        cls,
+        from_agent: str,
+        to_agent: str,
+        payload: Dict,
+        workflow_id: str = "",
+        timestamp: Optional[str] = None,
+    ) -> "Message":
+        return cls(
+            message_id=str(uuid.uuid4()),
+            timestamp=timestamp or datetime.utcnow().isoformat() + "Z",
+            from_agent=from_agent,
+            to_agent=to_agent,
+            message_type="handoff",
+            payload=payload,
+            workflow_id=workflow_id
+        )
+
+# Prompts ask agents to put their messages in fenced JSON blocks of their output
+MESSAGE_BLOCK = re.compile(r"```json\s*\n(.*?)```", re.S)
+# Only the end of a long output log is searched for messages
+MESSAGE_SCAN_BYTES = 4 * 1024 * 1024
+
+
+def extract_messages(output_log: Path) -> List[Dict]:
+    """Messages an agent addressed to other agents in its captured output."""
+    try:
+        with open(output_log, "rb") as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - MESSAGE_SCAN_BYTES))
+            text = f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return []
+    
+    messages = []
+    for block in MESSAGE_BLOCK.findall(text):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get("to_agent") in AGENTS and data.get("message_type"):
+            messages.append(data)
+    return messages
+
+
+@dataclass
+class MessageRef:
+    """Where a message lives in the log, with the fields it is indexed by."""
+    segment: int
+    offset: int
+    length: int
+    workflow_id: str
+    from_agent: str
+    to_agent: str
+    message_type: str
+    timestamp: str
+    artifact: Optional[str] = None  # state file carried by an orchestrator handoff
+
+
+class MessageBus:
+    """Append-only log of the messages agents exchange within a workspace.
+    
+    Messages are JSON lines appended to numbered segment files. When the
+    active segment reaches ``segment_bytes`` it is closed and its index is
+    written next to it, so reopening the bus only scans the active segment.
+    An in-memory index maps recipient, message type and workflow to message
+    locations, and messages are read back through ``mmap``. Once more than
+    ``max_segments`` segments are closed they are compacted into one: only
+    the latest ``retain_workflows`` workflows are kept and, within them,
+    only the latest batch each agent sent to each recipient. The
+    orchestrator owning the workspace is the only writer.
+    """
+    
+    def __init__(
+        self,
+        root: Path,
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_segments: int = 8,
+        retain_workflows: int = 5,
+        fields: Optional[Dict[str, Dict[str, List[str]]]] = None,
+    ):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(1, max_segments)
+        self.retain_workflows = max(1, retain_workflows)
+        self.fields = fields or {}  # recipient -> state file -> top-level keys it receives
+        self.lock = threading.Lock()
+        self.refs: Optional[List[MessageRef]] = None  # loaded on first use
+        self.by_agent: Dict[str, List[MessageRef]] = {}
+        self.by_type: Dict[str, List[MessageRef]] = {}
+        self.by_workflow: Dict[str, List[MessageRef]] = {}
+        self.maps: Dict[int, mmap.mmap] = {}
+        self.active = 1
+    
+    @classmethod
+    def from_config(cls, config: Dict, root: Path) -> Optional["MessageBus"]:
+        bus_config = config.get("messages", {})
+        if not bus_config.get("enabled", True):
+            return None
+        return cls(
+            root,
+            segment_bytes=int(bus_config.get("segment_size_mb", 4) * 1024 * 1024),
+            max_segments=bus_config.get("max_segments", 8),
+            retain_workflows=bus_config.get("retain_workflows", 5),
+            fields=bus_config.get("fields"),
+        )
+    
+    def segment_path(self, n: int) -> Path:
+        return self.root / f"{n:08d}.log"
+    
+    def segments(self) -> List[int]:
+        if not self.root.exists():
+            return []
+        return sorted(int(p.stem) for p in self.root.glob("*.log") if p.stem.isdigit())
+    
+    def publish(self, messages: List[Message]):
+        """Append a batch of messages to the active segment."""
+        if not messages:
+            return
+        lines = [json.dumps(asdict(m), ensure_ascii=False).encode() + b"\n" for m in messages]
+        
+        with self.lock:
+            self._load()
+            self.root.mkdir(parents=True, exist_ok=True)
+            path = self.segment_path(self.active)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(b"".join(lines))
+            for message, line in zip(messages, lines):
+                self._add(self._ref(self.active, offset, len(line) - 1, asdict(message)))
+                offset += len(line)
+            if offset >= self.segment_bytes:
+                self._roll()
+    
+    def query(
+        self,
+        to_agent: Optional[str] = None,
+        message_type: Optional[str] = None,
+        workflow_id: Optional[str] = None,
+    ) -> List[Message]:
+        """Messages matching every given field, oldest first."""
+        with self.lock:
+            self._load()
+            filters = [(self.by_agent, "to_agent", to_agent),
+                       (self.by_type, "message_type", message_type),
+                       (self.by_workflow, "workflow_id", workflow_id)]
+            filters = [f for f in filters if f[2] is not None]
+            refs = min((index.get(value, []) for index, _, value in filters), key=len,
+                       default=self.refs)
+            return [
+                self._read(r) for r in refs
+                if all(getattr(r, name) == value for _, name, value in filters)
+            ]
+    
+    def inbox(self, workflow_id: str, to_agent: str) -> List[Message]:
+        """The latest batch each agent sent to ``to_agent`` in a workflow."""
+        with self.lock:
+            self._load()
+            refs = [r for r in self.by_agent.get(to_agent, []) if r.workflow_id == workflow_id]
+            latest = {(r.from_agent, r.artifact): r.timestamp for r in refs}
+            return [self._read(r) for r in refs if latest[(r.from_agent, r.artifact)] == r.timestamp]
+    
+    def compact(self):
+        """Rewrite the closed segments without superseded messages."""
+        with self.lock:
+            self._load()
+            self._compact()
+    
+    def close(self):
+        with self.lock:
+            for m in self.maps.values():
+                m.close()
+            self.maps.clear()
+    
+    # Callers of the methods below hold self.lock
+    
+    def _load(self):
+        if self.refs is not None:
+            return
+        self.refs, self.by_agent, self.by_type, self.by_workflow = [], {}, {}, {}
+        segments = self.segments()
+        self.active = segments[-1] if segments else 1
+        for n in segments:
+            if n == self.active or not self._load_index(n):
+                self._scan(n)
+    
+    def _load_index(self, n: int) -> bool:
+        try:
+            rows = json.loads(self.segment_path(n).with_suffix(".idx").read_text())
+        except (OSError, ValueError):
+            return False
+        for row in rows:
+            self._add(MessageRef(n, *row))
+        return True
+    
+    def _scan(self, n: int):
+        """Index a segment by reading it; a torn last line is cut off."""
+        data = self._map(n)
+        offset = 0
+        while data is not None and offset < len(data):
+            end = data.find(b"\n", offset)
+            try:
+                record = json.loads(data[offset:end]) if end >= 0 else None
+            except ValueError:
+                record = None
+            if record is None:
+                break
+            self._add(self._ref(n, offset, end - offset, record))
+            offset = end + 1
+        
+        if data is not None and offset < len(data):
+            log("WARN", f"Truncating torn message log {self.segment_path(n).name} at byte {offset}")
+            self.maps.pop(n).close()
+            os.truncate(self.segment_path(n), offset)
+    
+    def _map(self, n: int, need: int = 0) -> Optional[mmap.mmap]:
+        """Map a segment, remapping the active one once it has grown past ``need``."""
+        current = self.maps.get(n)
+        if current is not None and len(current) >= need:
+            return current
+        if current is not None:
+            current.close()
+            del self.maps[n]
+        with open(self.segment_path(n), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            self.maps[n] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[n]
+    
+    def _read(self, ref: MessageRef) -> Message:
+        data = self._map(ref.segment, ref.offset + ref.length)
+        return Message(**json.loads(data[ref.offset:ref.offset + ref.length]))
+    
+    @staticmethod
+    def _ref(n: int, offset: int, length: int, record: Dict) -> MessageRef:
+        payload = record.get("payload")
+        return MessageRef(
+            n, offset, length,
+            record.get("workflow_id", ""),
+            record["from_agent"],
+            record["to_agent"],
+            record["message_type"],
+            record["timestamp"],
+            payload.get("artifact") if isinstance(payload, dict) else None,
+        )
+    
+    def _add(self, ref: MessageRef):
+        self.refs.append(ref)
+        self.by_agent.setdefault(ref.to_agent, []).append(ref)
+        self.by_type.setdefault(ref.message_type, []).append(ref)
+        self.by_workflow.setdefault(ref.workflow_id, []).append(ref)
+    
+    def _write_index(self, n: int):
+        rows = [asdict(r) for r in self.refs if r.segment == n]
+        atomic_write_text(
+            self.segment_path(n).with_suffix(".idx"),
+            json.dumps([[row[k] for k in list(row)[1:]] for row in rows]),
+        )
+    
+    def _roll(self):
+        self._write_index(self.active)
+        self.active += 1
+        if len(self.segments()) > self.max_segments:
+            self._compact()
+    
+    def _compact(self):
+        closed = [n for n in self.segments() if n != self.active]
+        if not closed:
+            return
+        
+        # Later entries win: the last batch per sender and recipient, the most recent workflows
+        latest = {(r.workflow_id, r.from_agent, r.to_agent, r.artifact): r.timestamp for r in self.refs}
+        last_seen = {r.workflow_id: i for i, r in enumerate(self.refs)}
+        retained = set(sorted(last_seen, key=last_seen.get)[-self.retain_workflows:])
+        
+        def keep(r: MessageRef) -> bool:
+            return (r.workflow_id in retained
+                    and latest[(r.workflow_id, r.from_agent, r.to_agent, r.artifact)] == r.timestamp)
+        
+        target = self.segment_path(closed[0])
+        tmp = target.with_suffix(".compact")
+        before = sum(self.segment_path(n).stat().st_size for n in closed)
+        with open(tmp, "wb") as out:
+            for r in self.refs:
+                if r.segment in closed and keep(r):
+                    out.write(self._map(r.segment)[r.offset:r.offset + r.length] + b"\n")
+        
+        for n in closed:
+            if n in self.maps:
+                self.maps.pop(n).close()
+        os.replace(tmp, target)
+        for n in closed[1:]:
+            self.segment_path(n).unlink(missing_ok=True)
+        for n in closed:
+            self.segment_path(n).with_suffix(".idx").unlink(missing_ok=True)
+        
+        active, self.refs = self.active, None
+        self._load()
+        self.active = active
+        self._write_index(closed[0])
+        log("INFO", f"Compacted {len(closed)} message segments: "
+                    f"{before / 1024:.0f} KB -> {target.stat().st_size / 1024:.0f} KB")
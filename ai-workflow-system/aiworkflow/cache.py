@@ -0,0 +1,557 @@
+"""Cache keys, the local artifact cache and workspace snapshots."""
+
+import os
+import io
+import json
+import time
+import uuid
+import math
+import hashlib
+import unicodedata
+import tarfile
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple, Collection
+import shutil
+
+from .core import (
+    HISTORY_DB,
+    HISTORY_FILE,
+    QUEUE_FILE,
+    RATE_LIMIT_FILE,
+    Workspace,
+    clone_file,
+    file_digest,
+)
+from .telemetry import log
+from .context import ContextSection
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CACHE KEYS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Bump when the prompt layout or the key derivation changes, so older entries miss
+CACHE_KEY_VERSION = 3
+# Agent settings (agents.<name>.config) that change what a run produces
+CACHE_CONFIG_KEYS = ("model", "max_tokens", "temperature")
+
+
+def canonical_text(text: str) -> str:
+    """JSON re-serialized with sorted keys and no whitespace; other text in NFC,
+    with unified newlines and no trailing spaces."""
+    try:
+        return json.dumps(json.loads(text), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except ValueError:
+        text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+        return "\n".join(line.rstrip() for line in text.strip().split("\n"))
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def tree_digest(directory: Path) -> str:
+    """Digest of every file's path, relative to ``directory``, and contents."""
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(d for d in dirnames if d not in SNAPSHOT_EXCLUDES)
+        for name in sorted(filenames):
+            path = Path(dirpath, name)
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue
+            h.update(f"{path.relative_to(directory).as_posix()}\0{digest}\n".encode())
+    return h.hexdigest()
+
+
+def cache_key_inputs(
+    agent_name: str,
+    template: str,
+    sections: List["ContextSection"],
+    settings: Dict[str, Any],
+    trees: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """Named digests of everything a cached run depends on: ``trees`` maps the
+    project directories the agent reads to their ``tree_digest``. Paths are left
+    out so entries restore into any workspace."""
+    inputs = {
+        "schema": str(CACHE_KEY_VERSION),
+        "agent": agent_name,
+        "template": text_digest(canonical_text(template)),
+        "config": text_digest(json.dumps(settings, sort_keys=True, default=str)),
+    }
+    for index, section in enumerate(sections):
+        inputs[f"context:{index}:{section.label or 'text'}"] = text_digest(canonical_text(section.text))
+    for name, digest in (trees or {}).items():
+        inputs[f"tree:{name}"] = digest
+    return inputs
+
+
+def compute_cache_key(inputs: Dict[str, str]) -> str:
+    """Compute a cache key for an agent execution from its ``cache_key_inputs``."""
+    return text_digest(json.dumps(inputs, sort_keys=True))
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ARTIFACT CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+SNAPSHOT_EXCLUDES = {".git", "node_modules", "__pycache__"}
+# Bookkeeping written by the orchestrator itself, never an agent output
+SNAPSHOT_SKIP_FILES = {
+    "workflow_state.json", "workflow_state.journal", "fingerprints.json", HISTORY_FILE.name,
+    QUEUE_FILE.name, f"{QUEUE_FILE.name}-journal", RATE_LIMIT_FILE.name,
+    HISTORY_DB.name, f"{HISTORY_DB.name}-journal",
+}
+
+
+def snapshot_tree(root: Path, ignore: Collection[Path] = ()) -> Dict[str, Tuple[int, int]]:
+    """Map every file under ``root``, outside ``ignore`` and the snapshot
+    excludes, to (mtime_ns, size)."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            d for d in dirnames
+            if d not in SNAPSHOT_EXCLUDES and Path(dirpath, d) not in ignore
+        ]
+        for name in filenames:
+            if name in SNAPSHOT_SKIP_FILES:
+                continue
+            path = Path(dirpath, name)
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files[str(path.relative_to(root))] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def contained(base: Path, rel: Any) -> Optional[Path]:
+    """``base / rel`` when ``rel`` is a relative path that stays inside ``base``,
+    symlinks included, else None."""
+    if not isinstance(rel, str) or not rel or os.path.isabs(rel):
+        return None
+    norm = os.path.normpath(rel)
+    if norm in (".", "..") or norm.startswith(".." + os.sep):
+        return None
+    path = base / norm
+    try:
+        path.resolve().relative_to(base.resolve())
+    except (OSError, ValueError, RuntimeError):
+        return None
+    return path
+
+
+class ArtifactCache:
+    """LRU cache of agent runs: the captured output log plus every file the agent wrote.
+    
+    Each entry lives in its own directory under the cache dir, with an
+    ``entry.json`` manifest and a ``files/`` tree mirroring paths relative to
+    the workspace root, so one cache directory can serve every workspace on
+    the host. The manifest's mtime is the LRU clock.
+    """
+    
+    def __init__(
+        self,
+        cache_dir: Path,
+        root: Path,
+        ignore: List[Path],
+        max_bytes: int,
+        ttl_hours: float = 24,
+    ):
+        self.cache_dir = cache_dir
+        self.root = root
+        self.ignore = set(ignore)
+        self.max_bytes = max_bytes
+        self.ttl_hours = ttl_hours
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """Map every workspace file to (mtime_ns, size)."""
+        return snapshot_tree(self.root, self.ignore)
+    
+    def changed_since(self, before: Dict[str, Tuple[int, int]]) -> List[str]:
+        """Files created or modified since ``before`` was taken."""
+        after = self.snapshot()
+        return sorted(rel for rel, sig in after.items() if before.get(rel) != sig)
+    
+    def entry_dir(self, agent_name: str, key: str) -> Path:
+        return self.cache_dir / f"{agent_name}_{key}"
+    
+    def peek(self, agent_name: str, key: str) -> Optional[Dict]:
+        """An entry's manifest, without restoring or touching it."""
+        try:
+            return json.loads((self.entry_dir(agent_name, key) / "entry.json").read_text())
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def age_hours(manifest: Dict) -> Optional[float]:
+        """Hours since the entry was stored, or None when the manifest does not say."""
+        created_at = manifest.get("created_at")
+        if isinstance(created_at, bool) or not isinstance(created_at, (int, float)):
+            return None
+        if not math.isfinite(created_at):
+            return None
+        return (time.time() - created_at) / 3600
+    
+    def latest(self, agent_name: str) -> Optional[Dict]:
+        """The most recently used entry of an agent."""
+        best, best_mtime = None, -1.0
+        for manifest_file in self.cache_dir.glob(f"{agent_name}_*/entry.json"):
+            try:
+                mtime = manifest_file.stat().st_mtime
+                manifest = json.loads(manifest_file.read_text())
+            except (OSError, ValueError):
+                continue
+            if isinstance(manifest, dict) and manifest.get("agent") == agent_name and mtime > best_mtime:
+                best, best_mtime = manifest, mtime
+        return best
+    
+    def get(
+        self,
+        agent_name: str,
+        key: str,
+        output_log: Optional[Path] = None,
+        skip: Collection[str] = (),
+    ) -> Optional[Dict]:
+        """Restore a cached run into the workspace. Returns its manifest, with
+        ``files`` listing what was restored, or None.
+        
+        The run's captured output is copied to ``output_log`` when given.
+        Paths in ``skip``, written by other agents of the current run, are
+        left alone.
+        """
+        entry = self.entry_dir(agent_name, key)
+        manifest_file = entry / "entry.json"
+        
+        try:
+            manifest = json.loads(manifest_file.read_text())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        
+        # A manifest with no valid creation time is as unusable as unparseable JSON
+        age_hours = self.age_hours(manifest) if isinstance(manifest, dict) else None
+        if age_hours is None or age_hours >= self.ttl_hours:
+            shutil.rmtree(entry, ignore_errors=True)
+            self.misses += 1
+            return None
+        
+        unsafe = self.unsafe_files(manifest, entry)
+        if unsafe:
+            log("WARN", f"Discarding cache entry {key[:12]} for {agent_name}: "
+                        f"path outside the workspace: {unsafe}")
+            shutil.rmtree(entry, ignore_errors=True)
+            self.misses += 1
+            return None
+        
+        restored = []
+        try:
+            for rel in manifest["files"]:
+                if rel in skip:
+                    continue
+                target = self.root / os.path.normpath(rel)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(entry / "files" / os.path.normpath(rel), target)
+                restored.append(rel)
+            if output_log is not None and (entry / "output.log").exists():
+                output_log.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(entry / "output.log", output_log)
+            os.utime(manifest_file)
+        except OSError:
+            # Evicted by another workflow sharing the cache while we read it
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return {**manifest, "files": restored}
+    
+    def unsafe_files(self, manifest: Dict, entry: Path) -> Optional[str]:
+        """The first manifest file that would be read or written outside the
+        entry or the workspace, if any."""
+        files = manifest.get("files")
+        if not isinstance(files, list):
+            return repr(files)
+        for rel in files:
+            if contained(self.root, rel) is None or contained(entry / "files", rel) is None:
+                return repr(rel)
+        return None
+    
+    def put(
+        self,
+        agent_name: str,
+        key: str,
+        output_log: Optional[Path],
+        files: List[str],
+        inputs: Optional[Dict[str, str]] = None,
+    ):
+        """Store a run's output log and files, then evict down to budget. ``inputs``
+        are the digests the key was derived from, kept to explain later misses."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.cache_dir / f".tmp-{uuid.uuid4().hex}"
+        staging.mkdir(parents=True)
+        size = 0
+        stored = []
+        
+        if output_log is not None and output_log.is_file():
+            shutil.copyfile(output_log, staging / "output.log")
+            size += output_log.stat().st_size
+        
+        for rel in files:
+            source = self.root / rel
+            if not source.is_file():
+                continue
+            target = staging / "files" / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, target)
+            size += target.stat().st_size
+            stored.append(rel)
+        
+        manifest = {
+            "agent": agent_name,
+            "key": key,
+            "created_at": time.time(),
+            "size_bytes": size,
+            "files": stored,
+            "inputs": inputs or {},
+        }
+        (staging / "entry.json").write_text(json.dumps(manifest))
+        
+        entry = self.entry_dir(agent_name, key)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            staging.rename(entry)
+        except OSError:
+            # Another workflow stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+        
+        self.evict()
+    
+    def export_entry(self, agent_name: str, key: str) -> Optional[bytes]:
+        """An entry packed as a gzipped tar, for the remote tier."""
+        entry = self.entry_dir(agent_name, key)
+        if not (entry / "entry.json").exists():
+            return None
+        buffer = io.BytesIO()
+        try:
+            with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+                tar.add(entry, arcname=".")
+        except OSError:
+            return None  # evicted while packing
+        return buffer.getvalue()
+    
+    def import_entry(self, agent_name: str, key: str, data: bytes) -> bool:
+        """Unpack an entry fetched from the remote tier into this cache."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.cache_dir / f".tmp-{uuid.uuid4().hex}"
+        try:
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+                for member in tar.getmembers():
+                    name = os.path.normpath(member.name)
+                    if not (member.isfile() or member.isdir()) or os.path.isabs(name) \
+                            or name.split(os.sep)[0] == "..":
+                        raise ValueError(f"unsafe path in entry: {member.name}")
+                # Members are checked above; the "data" filter also drops modes and owners
+                tar.extractall(staging, **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}))
+            manifest = json.loads((staging / "entry.json").read_text())
+            if not isinstance(manifest, dict):
+                raise ValueError("manifest is not an object")
+            if manifest.get("agent") != agent_name or manifest.get("key") != key:
+                raise ValueError("entry does not match its key")
+            if self.age_hours(manifest) is None:
+                raise ValueError("manifest has no valid creation time")
+            unsafe = self.unsafe_files(manifest, staging)
+            if unsafe:
+                raise ValueError(f"path outside the workspace in manifest: {unsafe}")
+        except (OSError, ValueError, tarfile.TarError) as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            log("WARN", f"Discarding remote cache entry {key[:12]} for {agent_name}: {e}")
+            return False
+        
+        entry = self.entry_dir(agent_name, key)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            staging.rename(entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+        return True
+    
+    def evict(self):
+        """Drop least recently used entries until the cache fits its budget."""
+        entries = []
+        for entry in self.cache_dir.iterdir():
+            manifest_file = entry / "entry.json"
+            if not manifest_file.exists():
+                continue
+            try:
+                size = json.loads(manifest_file.read_text())["size_bytes"]
+                entries.append((manifest_file.stat().st_mtime, size, entry))
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+    
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class WriteTracker:
+    """Attributes workspace writes to the agents of a run that made them.
+    
+    The workspace is snapshotted whenever an agent starts or finishes, and
+    the files changed between two snapshots are credited to the agents
+    running in between. Agents running alone are credited exactly; agents
+    overlapping are each credited with the shared interval's writes, and
+    ``written`` remembers every agent that may have written a path, so a
+    cache restore never overwrites a path another agent wrote in this run.
+    Files restored from the cache are credited to no one.
+    """
+    
+    def __init__(self, cache: ArtifactCache):
+        self.cache = cache
+        self.last: Optional[Dict[str, Tuple[int, int]]] = None
+        self.active: Dict[str, set] = {}  # running agent -> paths credited so far
+        self.written: Dict[str, set] = {}  # path -> agents of this run that wrote it
+    
+    def reset(self):
+        """Forget the previous run's writes."""
+        self.written = {}
+    
+    def advance(self):
+        """Credit the files changed since the last snapshot to the running agents."""
+        now = self.cache.snapshot()
+        if self.last is not None and self.active:
+            for rel, sig in now.items():
+                if self.last.get(rel) != sig:
+                    for paths in self.active.values():
+                        paths.add(rel)
+                    self.written.setdefault(rel, set()).update(self.active)
+        self.last = now
+    
+    def start(self, agent_name: str):
+        self.advance()
+        self.active[agent_name] = set()
+    
+    def finish(self, agent_name: str) -> List[str]:
+        """Stop tracking an agent and return the files credited to it."""
+        self.advance()
+        return sorted(self.active.pop(agent_name, set()))
+    
+    def restored(self, files: List[str]):
+        """Keep files just restored from the cache from being credited to the
+        running agents. Restores never protect a path: only fresh writes do."""
+        if self.last is None:
+            return
+        for rel in files:
+            try:
+                st = (self.cache.root / rel).stat()
+            except OSError:
+                continue
+            self.last[rel] = (st.st_mtime_ns, st.st_size)
+    
+    def written_by_others(self, agent_name: str) -> set:
+        return {rel for rel, agents in self.written.items() if agents - {agent_name}}
+
+
+class Scratch:
+    """A disposable copy of the workspace for one claude call, so that a call
+    and its hedged duplicate never write the same files.
+    
+    Files are cloned (reflinked where the filesystem allows); directories left
+    out of snapshots, such as node_modules, are symlinked instead. ``promote``
+    moves the files the call created or changed into the workspace. Deletions
+    are not carried over.
+    """
+    
+    def __init__(self, cache: ArtifactCache, workspace: "Workspace"):
+        self.cache = cache
+        self.workspace = workspace
+        self.root = workspace.scratch_dir / uuid.uuid4().hex
+        self.base: Dict[str, Tuple[int, int]] = {}
+    
+    def create(self):
+        for dirpath, dirnames, filenames in os.walk(self.workspace.root):
+            relative = Path(dirpath).relative_to(self.workspace.root)
+            (self.root / relative).mkdir(parents=True, exist_ok=True)
+            kept = []
+            for d in dirnames:
+                if Path(dirpath, d) in self.cache.ignore:
+                    continue
+                if d in SNAPSHOT_EXCLUDES:
+                    os.symlink(Path(dirpath, d), self.root / relative / d)
+                else:
+                    kept.append(d)
+            dirnames[:] = kept
+            for name in filenames:
+                try:
+                    clone_file(Path(dirpath, name), self.root / relative / name)
+                except OSError:
+                    pass  # removed while we walked
+        self.base = snapshot_tree(self.root)
+    
+    def rewrite(self, prompt: str) -> str:
+        """``prompt`` with workspace paths pointing into the copy."""
+        return prompt.replace(str(self.workspace.root), str(self.root))
+    
+    def promote(self) -> List[str]:
+        changed = sorted(rel for rel, sig in snapshot_tree(self.root).items() if self.base.get(rel) != sig)
+        for rel in changed:
+            target = self.workspace.root / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.root / rel, target)
+        return changed
+    
+    def discard(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class SingleFlight:
+    """Coalesces concurrent runs of the same cache key within this process.
+    
+    The first caller for a key leads and runs the agent; later callers wait
+    for it to land, then restore its outputs from the cache instead of
+    launching a duplicate subprocess. Waiters may be on other threads' event
+    loops, as with concurrent workflows in the daemon or a batch.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+    
+    async def join(self, key: str) -> bool:
+        """True if the caller leads the key; otherwise waits for the leader and returns False."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            waiters = self.flights.get(key)
+            if waiters is None:
+                self.flights[key] = []
+                return True
+            waiters.append((loop, future))
+        await future
+        return False
+    
+    def land(self, key: str):
+        """Release the key's waiters once its leader has finished, successfully or not."""
+        with self.lock:
+            waiters = self.flights.pop(key, [])
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+            except RuntimeError:  # the waiter's loop is already closed
+                pass
+
+
+IN_FLIGHT = SingleFlight()
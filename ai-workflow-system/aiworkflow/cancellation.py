@@ -0,0 +1,99 @@
+"""Shutdown on SIGINT/SIGTERM and cleanup of agent process groups."""
+
+import os
+import atexit
+import signal
+import asyncio
+import threading
+from typing import Dict, Optional
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CANCELLATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+SIGKILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+
+class Shutdown:
+    """Cooperative cancellation on SIGINT and SIGTERM.
+    
+    Running schedulers register their task. The first signal cancels them:
+    their agents kill their claude process groups and each workflow flushes
+    its state before returning. With no scheduler running, or on a second
+    signal, every claude process group is killed at once and
+    KeyboardInterrupt is raised. The handler takes no locks, since it runs
+    between two bytecodes of whatever the main thread was doing.
+    """
+    
+    def __init__(self):
+        self.signum: Optional[int] = None
+        self.tasks: Dict[asyncio.Task, asyncio.AbstractEventLoop] = {}
+        self.groups: set = set()  # process group ids of running claude processes
+    
+    @property
+    def requested(self) -> bool:
+        return self.signum is not None
+    
+    @property
+    def name(self) -> str:
+        return signal.Signals(self.signum).name if self.signum else ""
+    
+    def install(self):
+        """Handle SIGINT and SIGTERM in this process; a no-op off the main thread."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self.handle)
+        atexit.register(self.kill_groups)
+    
+    def handle(self, signum: int, frame):
+        tasks = list(self.tasks.items())
+        if self.signum is not None or not tasks:
+            self.signum = self.signum or signum
+            self.kill_groups()
+            raise KeyboardInterrupt
+        self.signum = signum
+        for task, loop in tasks:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:  # its loop already closed
+                pass
+    
+    def watch(self, task: asyncio.Task):
+        self.tasks[task] = asyncio.get_running_loop()
+    
+    def unwatch(self, task: asyncio.Task):
+        self.tasks.pop(task, None)
+    
+    def kill_groups(self):
+        for pgid in list(self.groups):
+            signal_group(pgid, SIGKILL)
+
+
+SHUTDOWN = Shutdown()
+
+
+def signal_group(pgid: int, signum: int) -> bool:
+    """Signal a process group, or the single process where groups don't exist."""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pgid, signum)
+        else:
+            os.kill(pgid, signum)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+async def terminate_process_group(proc: asyncio.subprocess.Process, grace: float):
+    """Stop a child started in its own session, and everything it spawned:
+    SIGTERM to its process group, then SIGKILL after ``grace`` seconds."""
+    signal_group(proc.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        signal_group(proc.pid, SIGKILL)  # grandchildren may outlive the child
+    await proc.wait()
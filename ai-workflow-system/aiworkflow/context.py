@@ -0,0 +1,222 @@
+"""Assembly of agent contexts within a token budget, and fan-out shards."""
+
+import json
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Tuple
+
+from .core import CONTEXT_SOURCES
+from .telemetry import log
+from .bus import Message, MessageBus
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONTEXT ASSEMBLY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for context budgets."""
+    return len(text) // 4 + 1
+
+
+def summarize_json(data: Any, max_items: int = 3, max_chars: int = 200) -> Any:
+    """Shrink a JSON value: truncate long lists and strings, keep the structure."""
+    if isinstance(data, dict):
+        return {k: summarize_json(v, max_items, max_chars) for k, v in data.items()}
+    if isinstance(data, list):
+        head = [summarize_json(v, max_items, max_chars) for v in data[:max_items]]
+        if len(data) > max_items:
+            head.append(f"... {len(data) - max_items} more")
+        return head
+    if isinstance(data, str) and len(data) > max_chars:
+        return data[:max_chars] + "..."
+    return data
+
+
+@dataclass
+class ContextSection:
+    label: str
+    text: str
+    priority: int = 1
+    data: Any = None  # parsed JSON, when the section came from a JSON file
+
+
+class ContextBuilder:
+    """Assembles agent contexts from state files within a token budget.
+    
+    File reads are memoized by (path, mtime, size), so rebuilding a context
+    only touches files that changed. With a message bus, a state file is
+    taken from the handoff addressed to the agent while the file is
+    unchanged since, and the agent's other messages are appended. JSON is
+    re-serialized without whitespace. When the estimated size exceeds the
+    agent's budget, lower-priority sections are summarized, then dropped,
+    until it fits.
+    """
+    
+    def __init__(self, state_dir: Path, config: Dict, bus: Optional[MessageBus] = None):
+        self.state_dir = state_dir
+        self.bus = bus
+        context_config = config.get("context", {})
+        self.default_budget = context_config.get("budget_tokens", 24000)
+        self.agent_budgets = context_config.get("agent_budgets", {}) or {}
+        self._reads: Dict[Path, Tuple[int, int, str]] = {}
+    
+    def read_text(self, path: Path) -> Optional[str]:
+        """Read a file, reusing the previous read if its stat is unchanged."""
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        cached = self._reads.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        text = path.read_text()
+        self._reads[path] = (st.st_mtime_ns, st.st_size, text)
+        return text
+    
+    def file_section(self, file: str, priority: int, label: Optional[str] = None) -> Optional[ContextSection]:
+        text = self.read_text(self.state_dir / file)
+        if text is None:
+            return None
+        try:
+            data = json.loads(text)
+            text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        except ValueError:
+            data = None
+        return ContextSection(label or file.upper(), text, priority, data)
+    
+    def message_section(
+        self, message: Optional[Message], file: str, priority: int, label: Optional[str] = None
+    ) -> Optional[ContextSection]:
+        """A section from the copy of ``file`` handed over on the bus, if the file is
+        unchanged since."""
+        if message is None:
+            return None
+        try:
+            st = (self.state_dir / file).stat()
+        except OSError:
+            return None
+        if (st.st_mtime_ns, st.st_size) != (message.payload.get("mtime_ns"), message.payload.get("size")):
+            return None
+        data = message.payload.get("data")
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        return ContextSection(label or file.upper(), text, priority, data)
+    
+    def budget(self, agent_name: str) -> int:
+        return self.agent_budgets.get(agent_name, self.default_budget)
+    
+    def build(self, agent_name: str, user_request: str, workflow_id: Optional[str] = None) -> str:
+        """Build the context for an agent based on previous outputs."""
+        return self.join(self.fitted(agent_name, user_request, workflow_id))
+    
+    def fitted(
+        self, agent_name: str, user_request: str, workflow_id: Optional[str] = None
+    ) -> List[ContextSection]:
+        """The agent's context sections, cut down to its budget."""
+        sections = self.sections(agent_name, user_request, workflow_id)
+        return self.fit(sections, self.budget(agent_name), agent_name)
+    
+    def sections(
+        self, agent_name: str, user_request: str, workflow_id: Optional[str] = None
+    ) -> List[ContextSection]:
+        sections: List[ContextSection] = []
+        inbox = self.bus.inbox(workflow_id, agent_name) if self.bus and workflow_id else []
+        handed = {m.payload["artifact"]: m for m in inbox if m.payload.get("artifact")}
+        notes = [
+            {"from": m.from_agent, "type": m.message_type, "payload": m.payload}
+            for m in inbox if not m.payload.get("artifact")
+        ]
+        
+        if agent_name == "product_manager":
+            sections.append(ContextSection("USER REQUEST", user_request))
+        elif agent_name == "code_reviewer":
+            sections.append(ContextSection("", "Review all code in src/ and tests/ directories."))
+        elif agent_name == "integration":
+            sections.append(ContextSection("", "Integrate all modules and prepare for deployment."))
+        
+        labels = {"test_report.json": "TEST REPORT", "review_report.json": "REVIEW REPORT"}
+        for file, priority in CONTEXT_SOURCES.get(agent_name, []):
+            section = (self.message_section(handed.get(file), file, priority, labels.get(file))
+                       or self.file_section(file, priority, labels.get(file)))
+            if section:
+                sections.append(section)
+        
+        if notes:
+            sections.append(ContextSection(
+                "MESSAGES", json.dumps(notes, separators=(",", ":"), ensure_ascii=False), 2, notes
+            ))
+        return sections
+    
+    def render(self, sections: List[ContextSection], agent_name: str) -> str:
+        return self.join(self.fit(sections, self.budget(agent_name), agent_name))
+    
+    @staticmethod
+    def join(sections: List[ContextSection]) -> str:
+        return "\n\n".join(f"{s.label}:\n{s.text}" if s.label else s.text for s in sections)
+    
+    def fit(self, sections: List[ContextSection], budget: int, agent_name: str) -> List[ContextSection]:
+        """Summarize, then drop, low-priority sections until the context fits."""
+        def total() -> int:
+            return sum(estimate_tokens(s.text) for s in sections)
+        
+        if total() <= budget:
+            return sections
+        
+        for section in sorted(sections, key=lambda s: -s.priority):
+            if total() <= budget:
+                break
+            if section.data is not None:
+                section.text = json.dumps(summarize_json(section.data), separators=(",", ":"),
+                                          ensure_ascii=False)
+                section.label += " (summarized)"
+        
+        for section in sorted(sections, key=lambda s: -s.priority):
+            if total() <= budget:
+                break
+            if section.priority > 1:
+                log("WARN", f"Context for {agent_name} over budget: dropping {section.label}")
+                sections.remove(section)
+        
+        return sections
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FAN-OUT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class Shard:
+    """A slice of api_design.json handled by one sub-agent call."""
+    index: int
+    resources: List[str]
+    spec: Dict[str, Any]  # api_design.json with only this shard's endpoints
+
+
+def endpoint_resource(path: str, base_url: str = "") -> str:
+    """First literal path segment after the base URL: /api/v1/users/{id} -> users."""
+    if base_url and path.startswith(base_url):
+        path = path[len(base_url):]
+    for segment in path.split("/"):
+        if segment and not segment.startswith((":", "{", "[")):
+            return segment
+    return "root"
+
+
+def partition_endpoints(api_design: Dict, max_shards: int) -> List[Shard]:
+    """Group endpoints by resource, then spread the groups over at most
+    ``max_shards`` shards of roughly equal size, largest groups first."""
+    groups: Dict[str, List[Dict]] = {}
+    for endpoint in api_design.get("endpoints") or []:
+        resource = endpoint_resource(endpoint.get("path", ""), api_design.get("base_url", ""))
+        groups.setdefault(resource, []).append(endpoint)
+    
+    sizes = {r: len(json.dumps(eps)) for r, eps in groups.items()}
+    bins: List[Tuple[int, List[str]]] = [(0, []) for _ in range(min(max_shards, len(groups)))]
+    for resource in sorted(groups, key=lambda r: -sizes[r]):
+        i = min(range(len(bins)), key=lambda b: bins[b][0])
+        bins[i] = (bins[i][0] + sizes[resource], bins[i][1] + [resource])
+    
+    common = {k: v for k, v in api_design.items() if k != "endpoints"}
+    return [
+        Shard(index, resources, {**common, "endpoints": [e for r in resources for e in groups[r]]})
+        for index, (_, resources) in enumerate(bins)
+    ]
@@ -0,0 +1,319 @@
+"""Paths, agent definitions and small helpers shared by every module."""
+
+import os
+import gzip
+import yaml
+import uuid
+import hashlib
+import asyncio
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONFIGURATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+SCRIPT_DIR = Path(__file__).parent.parent
+WORKFLOW_DIR = SCRIPT_DIR / ".ai-workflow"
+STATE_DIR = WORKFLOW_DIR / "state"
+LOGS_DIR = WORKFLOW_DIR / "logs"
+CHECKPOINTS_DIR = WORKFLOW_DIR / "checkpoints"
+CACHE_DIR = WORKFLOW_DIR / "cache"
+REMOTE_CACHE_DIR = WORKFLOW_DIR / "remote-cache"  # default --cache-server storage
+PROMPTS_DIR = WORKFLOW_DIR / "prompts"
+CONFIG_FILE = WORKFLOW_DIR / "config.yaml"
+WORKSPACES_DIR = WORKFLOW_DIR / "workspaces"
+QUEUE_FILE = WORKFLOW_DIR / "queue.db"
+SLOTS_DIR = WORKFLOW_DIR / "slots"
+RATE_LIMIT_FILE = WORKFLOW_DIR / "rate_limit.json"
+HISTORY_FILE = WORKFLOW_DIR / "agent_durations.json"
+HISTORY_DB = WORKFLOW_DIR / "history.db"
+
+# Agent definitions with their phases and dependencies
+AGENTS = {
+    "product_manager": {"phase": 1, "emoji": "📋", "deps": []},
+    "architect": {"phase": 2, "emoji": "🏗️", "deps": ["product_manager"]},
+    "frontend_developer": {"phase": 3, "emoji": "🎨", "deps": ["architect"]},
+    "backend_developer": {"phase": 3, "emoji": "⚙️", "deps": ["architect"]},
+    "devops": {"phase": 3, "emoji": "🚀", "deps": ["architect"]},
+    "qa_tester": {"phase": 4, "emoji": "🧪", "deps": ["frontend_developer", "backend_developer"]},
+    "code_reviewer": {"phase": 4, "emoji": "🔍", "deps": ["qa_tester"]},
+    "integration": {"phase": 5, "emoji": "🔗", "deps": ["code_reviewer", "devops"]},
+}
+
+# State files each agent reads, with their priority when the context is over
+# budget: 1 is always kept, higher numbers are summarized and then dropped first.
+CONTEXT_SOURCES = {
+    "architect": [("specs.json", 1), ("user_stories.json", 2)],
+    "frontend_developer": [("architecture.json", 1), ("api_design.json", 1), ("tech_stack.json", 2)],
+    "backend_developer": [("architecture.json", 1), ("api_design.json", 1), ("tech_stack.json", 2)],
+    "devops": [("architecture.json", 1), ("tech_stack.json", 1), ("api_design.json", 3)],
+    "qa_tester": [("user_stories.json", 1), ("acceptance_criteria.json", 1)],
+    "code_reviewer": [("test_report.json", 1)],
+    "integration": [("review_report.json", 1)],
+}
+
+# Project directories an agent's prompt tells it to read itself, outside its
+# context. Their contents are part of its cache key.
+TREE_INPUTS = {
+    "qa_tester": ["src"],
+    "code_reviewer": ["src", "tests"],
+    "integration": ["src", "tests"],
+}
+
+PHASE_NAMES = {
+    1: "ANALYSIS",
+    2: "DESIGN",
+    3: "DEVELOPMENT",
+    4: "QUALITY",
+    5: "INTEGRATION",
+}
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DATA CLASSES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class AgentResult:
+    agent_name: str
+    success: bool
+    duration_seconds: float
+    output_files: List[str]
+    error_message: Optional[str] = None
+    cached: bool = False
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# UTILITIES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    PURPLE = '\033[0;35m'
+    CYAN = '\033[0;36m'
+    NC = '\033[0m'
+
+
+def rotate_file(path: Path, backup_count: int):
+    """Move ``path`` aside as ``path.1.gz``, shifting older backups up by one."""
+    if not path.exists():
+        return
+    if backup_count <= 0:
+        path.unlink()
+        return
+    
+    for i in range(backup_count - 1, 0, -1):
+        older = path.with_name(f"{path.name}.{i}.gz")
+        if older.exists():
+            os.replace(older, path.with_name(f"{path.name}.{i + 1}.gz"))
+    
+    with open(path, "rb") as src, gzip.open(path.with_name(f"{path.name}.1.gz"), "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    path.unlink()
+
+
+def print_banner():
+    """Print the application banner."""
+    print(f"{Colors.CYAN}")
+    print("╔═══════════════════════════════════════════════════════════════════════════════╗")
+    print("║                                                                               ║")
+    print("║   🤖  AI MULTI-AGENT DEVELOPMENT SYSTEM (Python)                              ║")
+    print("║                                                                               ║")
+    print("║   Orchestrating: Product Manager → Architect → Developers → QA → Integration ║")
+    print("║                                                                               ║")
+    print("╚═══════════════════════════════════════════════════════════════════════════════╝")
+    print(f"{Colors.NC}")
+
+
+def print_phase(phase_name: str, phase_num: int):
+    """Print phase header."""
+    print()
+    print(f"{Colors.PURPLE}━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━{Colors.NC}")
+    print(f"{Colors.PURPLE}  PHASE {phase_num}: {phase_name}{Colors.NC}")
+    print(f"{Colors.PURPLE}━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━{Colors.NC}")
+    print()
+
+
+def load_config() -> Dict:
+    """Load configuration from YAML file."""
+    if CONFIG_FILE.exists():
+        with open(CONFIG_FILE) as f:
+            return yaml.safe_load(f)
+    return {}
+
+
+def atomic_write_text(path: Path, text: str):
+    """Write a file via a fsynced temp file and rename, so readers never see a partial write."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+async def feed_stream(stdin: asyncio.StreamWriter, data: bytes):
+    """Write ``data`` to a child's stdin and close it."""
+    try:
+        stdin.write(data)
+        await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # the child exited early; its return code says why
+    finally:
+        stdin.close()
+
+
+async def tail_stream(stream: asyncio.StreamReader, limit: int = 64 * 1024) -> str:
+    """Drain a stream, keeping only its last ``limit`` bytes."""
+    tail = b""
+    while True:
+        chunk = await stream.read(64 * 1024)
+        if not chunk:
+            break
+        tail = (tail + chunk)[-limit:]
+    return tail.decode(errors="replace")
+
+
+FICLONE = 0x40049409  # Linux ioctl: share extents between two files (reflink)
+
+
+def clone_file(src: Path, dst: Path):
+    """Copy a file, sharing its data blocks via reflink when the filesystem allows."""
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# WORKSPACES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class Workspace:
+    """Directory layout for one workflow's state, logs, checkpoints and generated code.
+    
+    The default workspace is the script directory itself. Isolated
+    workspaces live under ``WORKSPACES_DIR/<workflow_id>`` and mirror the
+    same relative layout, so cache entries recorded in one workspace restore
+    cleanly into another. Prompts, config and the cache stay shared.
+    """
+    root: Path
+    
+    @classmethod
+    def default(cls) -> "Workspace":
+        return cls(SCRIPT_DIR)
+    
+    @classmethod
+    def isolated(cls, workflow_id: str) -> "Workspace":
+        return cls(WORKSPACES_DIR / workflow_id)
+    
+    @property
+    def state_dir(self) -> Path:
+        return self.root / ".ai-workflow" / "state"
+    
+    @property
+    def logs_dir(self) -> Path:
+        return self.root / ".ai-workflow" / "logs"
+    
+    @property
+    def checkpoints_dir(self) -> Path:
+        return self.root / ".ai-workflow" / "checkpoints"
+    
+    @property
+    def messages_dir(self) -> Path:
+        return self.root / ".ai-workflow" / "messages"
+    
+    @property
+    def scratch_dir(self) -> Path:
+        return self.root / ".ai-workflow" / "scratch"
+    
+    @property
+    def src_dir(self) -> Path:
+        return self.root / "src"
+    
+    @property
+    def state_file(self) -> Path:
+        return self.state_dir / "workflow_state.json"
+    
+    def create(self):
+        for d in [self.state_dir, self.logs_dir, self.checkpoints_dir]:
+            d.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def list_isolated() -> List[str]:
+        if not WORKSPACES_DIR.exists():
+            return []
+        return sorted(d.name for d in WORKSPACES_DIR.iterdir() if d.is_dir())
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DEPENDENCY GRAPH
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def downstream_depth(agents: Dict[str, Dict] = AGENTS) -> Dict[str, int]:
+    """Length of the longest dependency chain starting at each agent."""
+    children: Dict[str, List[str]] = {name: [] for name in agents}
+    for name, info in agents.items():
+        for dep in info["deps"]:
+            children[dep].append(name)
+    
+    depth: Dict[str, int] = {}
+    
+    def visit(name: str) -> int:
+        if name not in depth:
+            depth[name] = 1 + max((visit(c) for c in children[name]), default=0)
+        return depth[name]
+    
+    for name in agents:
+        visit(name)
+    return depth
+
+
+def topological_order(agents: Dict[str, Dict] = AGENTS) -> List[str]:
+    """Agents ordered so that every agent comes after its dependencies."""
+    order: List[str] = []
+    
+    def visit(name: str):
+        if name not in order:
+            for dep in agents[name]["deps"]:
+                visit(dep)
+            order.append(name)
+    
+    for name in agents:
+        visit(name)
+    return order
+
+
+def ancestors(agent_name: str, agents: Dict[str, Dict] = AGENTS) -> set:
+    """Every agent that ``agent_name`` depends on, directly or not."""
+    found: set = set()
+    stack = list(agents[agent_name]["deps"])
+    while stack:
+        dep = stack.pop()
+        if dep not in found:
+            found.add(dep)
+            stack.extend(agents[dep]["deps"])
+    return found
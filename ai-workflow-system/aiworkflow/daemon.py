@@ -0,0 +1,231 @@
+"""Long-lived orchestrator serving CLI clients over a Unix socket."""
+
+import os
+import json
+import asyncio
+import threading
+from pathlib import Path
+from dataclasses import asdict
+from typing import Dict, Optional, Any
+
+from orchestrator_client import DAEMON_SOCKET, DaemonClient
+
+from .core import AGENTS, Workspace, load_config
+from .telemetry import LOG_SINK, configure_logging, log, start_metrics_server
+from .jobqueue import JobQueue
+from .workflow import WorkflowOrchestrator
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DAEMON
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Daemon:
+    """Long-running orchestrator serving CLI clients over a Unix socket.
+    
+    The config and one orchestrator per workspace, with its workflow state,
+    cache and checkpoint manager, stay in memory between requests. A request
+    is one JSON line; the reply streams the log lines it produces, then a
+    final result line. Commands that change a workspace run one at a time
+    per workspace, while status queries are answered from memory at once.
+    The workflow state and fingerprints are reloaded from disk before each
+    command, so runs made outside the daemon (``--no-daemon``) are seen.
+    """
+    
+    def __init__(self, path: Path = DAEMON_SOCKET):
+        self.path = path
+        self.config = load_config()
+        configure_logging(self.config)
+        start_metrics_server(self.config)
+        self.orchestrators: Dict[Path, WorkflowOrchestrator] = {}
+        self.has_state: set = set()
+        self.locks: Dict[Path, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.stopping: Optional[asyncio.Event] = None
+    
+    def lock(self, root: Path) -> threading.Lock:
+        return self.locks.setdefault(root, threading.Lock())
+    
+    @staticmethod
+    def workspace(workflow_id: Optional[str]) -> Workspace:
+        if not workflow_id:
+            return Workspace.default()
+        workspace = Workspace.isolated(workflow_id)
+        if not workspace.root.exists():
+            raise ValueError(f"Workspace not found: {workflow_id}")
+        return workspace
+    
+    def orchestrator(self, workflow_id: Optional[str]) -> WorkflowOrchestrator:
+        workspace = self.workspace(workflow_id)
+        with self._lock:  # not the workspace lock, so status never waits for a run
+            orchestrator = self.orchestrators.get(workspace.root)
+            if orchestrator is None:
+                orchestrator = WorkflowOrchestrator(workspace=workspace, config=self.config)
+                if orchestrator.load_existing_state():
+                    self.has_state.add(workspace.root)
+                self.orchestrators[workspace.root] = orchestrator
+            return orchestrator
+    
+    def refresh(self, orchestrator: WorkflowOrchestrator):
+        """Reload what a run outside the daemon may have changed on disk.
+        Caller holds the workspace lock, so no command of ours is writing it."""
+        if orchestrator.load_existing_state():
+            self.has_state.add(orchestrator.workspace.root)
+        orchestrator.fingerprints.reload()
+    
+    def adopt(self, orchestrator: WorkflowOrchestrator):
+        previous = self.orchestrators.get(orchestrator.workspace.root)
+        if previous is not None and previous is not orchestrator:
+            previous.store.close()
+        self.orchestrators[orchestrator.workspace.root] = orchestrator
+        self.has_state.add(orchestrator.workspace.root)
+    
+    def handle(self, command: str, args: Dict[str, Any]) -> Any:
+        """Run one client command on this thread and return its JSON result."""
+        workflow_id = args.get("workspace")
+        
+        if command == "ping":
+            return {"pid": os.getpid()}
+        
+        if command == "workspaces":
+            return Workspace.list_isolated()
+        
+        if command == "run":
+            isolated = args.get("isolated") or (
+                not workflow_id and self.config.get("workspaces", {}).get("isolated", False)
+            )
+            workspace = None if isolated else self.workspace(workflow_id)
+            if workspace is None:
+                orchestrator = WorkflowOrchestrator(
+                    args["request"], isolated=True, distributed=args.get("distributed"),
+                    config=self.config,
+                )
+                self.adopt(orchestrator)
+                with self.lock(orchestrator.workspace.root):
+                    return orchestrator.run_full_workflow()
+            with self.lock(workspace.root):
+                orchestrator = WorkflowOrchestrator(
+                    args["request"], workspace=workspace, distributed=args.get("distributed"),
+                    config=self.config,
+                )
+                self.adopt(orchestrator)
+                return orchestrator.run_full_workflow()
+        
+        orchestrator = self.orchestrator(workflow_id)
+        root = orchestrator.workspace.root
+        
+        if command == "status":
+            lock = self.lock(root)
+            if lock.acquire(blocking=False):  # else our own run is current, and in memory
+                try:
+                    self.refresh(orchestrator)
+                finally:
+                    lock.release()
+            return asdict(orchestrator.state) if root in self.has_state else None
+        
+        if command == "checkpoints":
+            return orchestrator.checkpoint_manager.list_all()
+        
+        with self.lock(root):
+            self.refresh(orchestrator)
+            if command == "restore":
+                orchestrator.store.flush()
+                restored = orchestrator.checkpoint_manager.restore(args["checkpoint_id"])
+                if orchestrator.load_existing_state():
+                    self.has_state.add(root)
+                return restored
+            
+            jobs = orchestrator.jobs
+            if args.get("distributed") and jobs is None:
+                jobs = JobQueue.from_config(self.config)
+            orchestrator.executor.jobs = jobs
+            try:
+                if command == "agent":
+                    if args["agent"] not in AGENTS:
+                        raise ValueError(f"Unknown agent: {args['agent']}")
+                    if root not in self.has_state and args.get("request"):
+                        orchestrator.store.update(user_request=args["request"])
+                    self.has_state.add(root)
+                    return asdict(orchestrator.run_agent(args["agent"]))
+                
+                if command == "full":
+                    self.has_state.add(root)
+                    return orchestrator.run_full_workflow()
+                
+                if command == "rebuild":
+                    if root not in self.has_state:
+                        raise ValueError("No workflow state found")
+                    return orchestrator.rebuild(args.get("request"), dry_run=args.get("dry_run", False))
+            finally:
+                orchestrator.executor.jobs = orchestrator.jobs
+        
+        raise ValueError(f"Unknown command: {command}")
+    
+    def run(self):
+        asyncio.run(self.serve())
+    
+    async def serve(self):
+        if self.path.exists():
+            if DaemonClient(self.path).call("ping") is not None:
+                log("ERROR", f"A daemon is already listening on {self.path}")
+                return
+            self.path.unlink()
+        
+        self.stopping = asyncio.Event()
+        # Created owner-only, rather than chmod'ed after other users could connect
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self.on_client, path=str(self.path))
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o600)
+        log("INFO", f"Daemon listening on {self.path} (pid {os.getpid()})")
+        try:
+            async with server:
+                await self.stopping.wait()
+        finally:
+            self.path.unlink(missing_ok=True)
+            for orchestrator in self.orchestrators.values():
+                orchestrator.store.close()
+            log("INFO", "Daemon stopped")
+    
+    async def on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue()
+        connected = True
+        
+        async def send(message: Dict[str, Any]):
+            nonlocal connected
+            if not connected:
+                return
+            try:
+                writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode())
+                await writer.drain()
+            except (ConnectionError, OSError):
+                connected = False  # the command keeps running without its client
+        
+        def call(command: str, args: Dict[str, Any]) -> Any:
+            LOG_SINK.set(lambda line: loop.call_soon_threadsafe(lines.put_nowait, line))
+            return self.handle(command, args)
+        
+        try:
+            request = json.loads(await reader.readline() or "{}")
+            command = request.get("command")
+            if command == "shutdown":
+                await send({"ok": True, "result": None})
+                self.stopping.set()
+                return
+            
+            task = asyncio.ensure_future(asyncio.to_thread(call, command, request.get("args", {})))
+            while not task.done() or not lines.empty():
+                getter = asyncio.ensure_future(lines.get())
+                done, _ = await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await send({"log": getter.result()})
+                else:
+                    getter.cancel()
+            await send({"ok": True, "result": task.result()})
+        except Exception as e:
+            await send({"ok": False, "error": str(e)})
+        finally:
+            writer.close()
@@ -0,0 +1,950 @@
+"""Runs one agent through claude, with caching, retries and hedging."""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from .core import (
+    AGENTS,
+    CACHE_DIR,
+    CONTEXT_SOURCES,
+    PROMPTS_DIR,
+    REMOTE_CACHE_DIR,
+    SLOTS_DIR,
+    TREE_INPUTS,
+    WORKSPACES_DIR,
+    AgentResult,
+    Workspace,
+    downstream_depth,
+    feed_stream,
+    rotate_file,
+    tail_stream,
+)
+from .telemetry import LOG_CONTEXT, METRICS, get_log_writer, log, set_log_context, trace_span
+from .cancellation import SHUTDOWN, terminate_process_group
+from .policy import CircuitBreaker, HostSlots, RateLimiter, RetryPolicy, get_rate_limiter
+from .history import RunHistory
+from .state import StateStore, WorkflowState
+from .cache import (
+    CACHE_CONFIG_KEYS,
+    IN_FLIGHT,
+    ArtifactCache,
+    Scratch,
+    WriteTracker,
+    cache_key_inputs,
+    compute_cache_key,
+    tree_digest,
+)
+from .remote_cache import get_remote_cache
+from .bus import Message, MessageBus, extract_messages
+from .context import ContextBuilder, ContextSection, Shard, estimate_tokens, partition_endpoints
+from .jobqueue import JobQueue, expected_artifacts
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# AGENT EXECUTION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class AgentExecutor:
+    """Executes individual agents with Claude Code."""
+    
+    def __init__(
+        self,
+        store: Optional[StateStore],
+        config: Dict,
+        workspace: Optional[Workspace] = None,
+        slots: Optional[HostSlots] = None,
+        jobs: Optional["JobQueue"] = None,
+    ):
+        self.store = store  # None on workers, which only run prompts
+        self.jobs = jobs  # set when distributed: prompts go to the worker pool
+        self.config = config
+        self.workspace = workspace or Workspace.default()
+        self.slots = slots
+        self.bus = MessageBus.from_config(config, self.workspace.messages_dir)
+        self.context_builder = ContextBuilder(self.workspace.state_dir, config, self.bus)
+        self.progress_interval = config.get("system", {}).get("progress_interval_seconds", 15)
+        self.policy = RetryPolicy(config)
+        self.breaker = CircuitBreaker(self.policy.breaker_threshold)
+        self.limiter = get_rate_limiter(config)
+        self.history = RunHistory.from_config(config)
+        cancellation = config.get("cancellation", {})
+        self.fail_fast = cancellation.get("on_failure", "cancel") == "cancel"
+        self.kill_grace = cancellation.get("kill_grace_seconds", 5)
+        cache_config = config.get("cache", {})
+        self.cache_enabled = cache_config.get("enabled", True)
+        self.cache_bypass: set = set()  # agents that must rerun even on a cache hit
+        self.explain_cache_lookups = False  # log why each lookup hit or missed
+        self.cache = ArtifactCache(
+            CACHE_DIR,
+            self.workspace.root,
+            ignore=[
+                self.workspace.logs_dir,
+                self.workspace.checkpoints_dir,
+                self.workspace.messages_dir,
+                self.workspace.scratch_dir,
+                CACHE_DIR,
+                REMOTE_CACHE_DIR,
+                PROMPTS_DIR,
+                WORKSPACES_DIR,
+                SLOTS_DIR,
+            ],
+            max_bytes=int(cache_config.get("max_size_mb", 512) * 1024 * 1024),
+            ttl_hours=cache_config.get("ttl_hours", 24),
+        )
+        self.remote_cache = get_remote_cache(config) if self.cache_enabled else None
+        self.tracker = WriteTracker(self.cache)
+    
+    @property
+    def state(self) -> WorkflowState:
+        return self.store.state
+    
+    def context_sections(self, agent_name: str) -> List[ContextSection]:
+        return self.context_builder.fitted(
+            agent_name, self.state.user_request, self.state.workflow_id
+        )
+    
+    def build_context(self, agent_name: str) -> str:
+        """Build the context for an agent based on previous outputs."""
+        return ContextBuilder.join(self.context_sections(agent_name))
+    
+    def publish_handoff(self, agent_name: str, output_files: List[str]):
+        """Send every agent that reads a state file this agent wrote its copy of the
+        file, then the messages the agent addressed to others in its output."""
+        if self.bus is None:
+            return
+        state_dir = self.workspace.state_dir
+        written = {
+            Path(rel).name for rel in output_files
+            if (self.workspace.root / rel).parent == state_dir
+        }
+        stamp = datetime.utcnow().isoformat() + "Z"
+        workflow_id = self.state.workflow_id
+        messages = []
+        
+        for recipient, sources in CONTEXT_SOURCES.items():
+            for file, _ in sources:
+                if file not in written or recipient == agent_name:
+                    continue
+                path = state_dir / file
+                try:
+                    st = path.stat()
+                    data = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                keys = self.bus.fields.get(recipient, {}).get(file)
+                if keys and isinstance(data, dict):
+                    data = {k: data[k] for k in keys if k in data}
+                messages.append(Message.handoff(agent_name, recipient, {
+                    "artifact": file, "data": data, "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                }, workflow_id, stamp))
+        
+        for raw in extract_messages(self.workspace.logs_dir / f"{agent_name}_output.log"):
+            messages.append(Message(
+                message_id=str(uuid.uuid4()),
+                timestamp=stamp,
+                from_agent=agent_name,
+                to_agent=raw["to_agent"],
+                message_type=str(raw["message_type"]),
+                payload=raw.get("payload") if isinstance(raw.get("payload"), dict) else {},
+                workflow_id=workflow_id,
+            ))
+        
+        with trace_span("publish_messages", count=len(messages)):
+            self.bus.publish(messages)
+    
+    def build_prompt(self, agent_name: str, context: Optional[str] = None) -> str:
+        """Build the full prompt for an agent."""
+        prompt_file = PROMPTS_DIR / f"{agent_name}.md"
+        
+        system_prompt = self.context_builder.read_text(prompt_file)
+        if system_prompt is None:
+            raise FileNotFoundError(f"Prompt file not found: {prompt_file}")
+        
+        if context is None:
+            context = self.build_context(agent_name)
+        
+        full_prompt = f"""{system_prompt}
+
+═══════════════════════════════════════════════════════════════════════════════
+CURRENT CONTEXT
+═══════════════════════════════════════════════════════════════════════════════
+
+{context}
+
+═══════════════════════════════════════════════════════════════════════════════
+INSTRUCTIONS
+═══════════════════════════════════════════════════════════════════════════════
+
+Execute your role as defined above.
+- Create all necessary files in the appropriate directories
+- Output your results in the format specified in your prompt
+- Save any JSON outputs to the {self.workspace.state_dir}/ directory
+- Report any issues or blockers immediately
+
+Working directory: {self.workspace.root}
+State directory: {self.workspace.state_dir}
+
+Begin your work now."""
+        
+        return full_prompt
+    
+    def cache_inputs(self, agent_name: str, sections: List[ContextSection]) -> Dict[str, str]:
+        """Digests of the prompt template, the agent's model settings, each
+        context section and the project directories the agent reads, which its
+        cache key is derived from."""
+        agent_config = (self.config.get("agents", {}).get(agent_name) or {}).get("config") or {}
+        settings = {k: agent_config.get(k) for k in CACHE_CONFIG_KEYS}
+        fanout = self.config.get("fanout", {})
+        if fanout.get("enabled", False) and agent_name in fanout.get("agents", []):
+            settings["fanout"] = {k: fanout.get(k) for k in ("max_shards", "min_endpoints")}
+        template = self.context_builder.read_text(PROMPTS_DIR / f"{agent_name}.md") or ""
+        trees = {d: tree_digest(self.workspace.root / d) for d in TREE_INPUTS.get(agent_name, [])}
+        return cache_key_inputs(agent_name, template, sections, settings, trees)
+    
+    def explain_cache(self, agent_name: str, inputs: Optional[Dict[str, str]] = None) -> str:
+        """Why a cache lookup for the agent, as things stand, hits or misses."""
+        if not self.cache_enabled:
+            return "skipped: cache disabled"
+        if agent_name in self.cache_bypass:
+            return "skipped: agent is being rebuilt"
+        if inputs is None:
+            inputs = self.cache_inputs(agent_name, self.context_sections(agent_name))
+        key = compute_cache_key(inputs)
+        
+        manifest = self.cache.peek(agent_name, key)
+        if manifest is not None:
+            age_hours = self.cache.age_hours(manifest) if isinstance(manifest, dict) else None
+            if age_hours is None:
+                return f"miss: entry {key[:12]} has no valid creation time"
+            if age_hours >= self.cache.ttl_hours:
+                return f"miss: entry {key[:12]} expired ({age_hours:.1f}h old)"
+            return f"hit: entry {key[:12]} ({len(manifest.get('files') or [])} files, {age_hours:.1f}h old)"
+        if self.remote_cache is not None and self.remote_cache.exists(key):
+            return f"hit: remote entry {key[:12]}"
+        
+        previous = self.cache.latest(agent_name)
+        if previous is None:
+            return "miss: no entry for this agent"
+        old = previous.get("inputs")
+        previous_key = str(previous.get("key", "?"))[:12]
+        if not old or not isinstance(old, dict):
+            return f"miss: latest entry {previous_key} predates canonical cache keys"
+        
+        reasons = []
+        for name in sorted(set(inputs) | set(old)):
+            if inputs.get(name) == old.get(name):
+                continue
+            if name == "schema":
+                reasons.append(f"cache key version {old.get(name)} -> {inputs.get(name)}")
+            elif name == "template":
+                reasons.append(f"prompt template {agent_name}.md changed")
+            elif name == "config":
+                reasons.append("model settings or fan-out changed")
+            else:
+                kind, label = name.split(":", 1)
+                if kind == "tree":
+                    label = f"{label}/"
+                elif label.split(":", 1)[0].isdigit():
+                    label = label.split(":", 1)[1]
+                state = "added" if name not in old else "removed" if name not in inputs else "changed"
+                reasons.append(f"{label} {state}")
+        return f"miss: {', '.join(reasons)} since entry {previous_key}"
+    
+    def check_cache(self, agent_name: str, inputs: Dict[str, str]) -> Optional[Dict]:
+        """Restore a cached execution's outputs. Returns the cache entry on a hit."""
+        if self.explain_cache_lookups:
+            log("INFO", f"Cache {agent_name}: {self.explain_cache(agent_name, inputs)}")
+        if not self.cache_enabled or agent_name in self.cache_bypass:
+            return None
+        
+        cache_key = compute_cache_key(inputs)
+        if self.tracker.active and self.cache.peek(agent_name, cache_key) is not None:
+            self.tracker.advance()  # credit running agents' writes before restoring over them
+        entry = self.cache.get(
+            agent_name, cache_key, output_log=self.workspace.logs_dir / f"{agent_name}_output.log",
+            skip=self.tracker.written_by_others(agent_name),
+        )
+        if entry is not None:
+            self.tracker.restored(entry["files"])
+        METRICS.inc("orchestrator_cache_hits_total" if entry else "orchestrator_cache_misses_total")
+        hits = METRICS.get("orchestrator_cache_hits_total")
+        METRICS.set("orchestrator_cache_hit_ratio",
+                    hits / (hits + METRICS.get("orchestrator_cache_misses_total")))
+        if entry is not None:
+            log("INFO", f"Cache hit for {agent_name} ({len(entry['files'])} files restored)")
+        return entry
+    
+    def save_cache(
+        self, agent_name: str, inputs: Dict[str, str], output_log: Path, files: List[str]
+    ):
+        """Save the agent's captured stdout and output files to cache."""
+        if not self.cache_enabled:
+            return
+        
+        cache_key = compute_cache_key(inputs)
+        self.cache.put(agent_name, cache_key, output_log, files, inputs)
+        if self.remote_cache is not None:
+            self.remote_cache.upload(self.cache, agent_name, cache_key)
+    
+    def execute(self, agent_name: str, max_retries: Optional[int] = None) -> AgentResult:
+        """Execute an agent, blocking until it finishes."""
+        return asyncio.run(self.execute_async(agent_name, max_retries))
+    
+    async def run_claude(
+        self,
+        prompt: str,
+        timeout: float,
+        output_path: Path,
+        label: str = "claude",
+        priority: int = 0,
+        cwd: Optional[Path] = None,
+    ) -> Tuple[int, int, str, float]:
+        """Run the claude CLI once, streaming the prompt to its stdin and its stdout to disk.
+        
+        Waits for rate limit budget, then for a host slot. Returns
+        (returncode, bytes of output written, tail of stderr, seconds the
+        child ran), the last excluding both waits. Kills the child's process
+        group on timeout or cancellation.
+        """
+        if self.limiter:
+            with trace_span("wait_for_rate_limit", lane=label):
+                await self.limiter.acquire(estimate_tokens(prompt), priority, label)
+        with trace_span("wait_for_slot", lane=label):
+            METRICS.inc("orchestrator_host_slot_waiters")
+            try:
+                slot = await self.slots.acquire() if self.slots else None
+            finally:
+                METRICS.inc("orchestrator_host_slot_waiters", -1)
+        try:
+            await asyncio.to_thread(rotate_file, output_path, get_log_writer().backup_count)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            started = time.time()
+            proc = await asyncio.create_subprocess_exec(
+                "claude", "--print",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd or self.workspace.root,
+                start_new_session=hasattr(os, "setsid"),  # own process group, killed as one
+            )
+            SHUTDOWN.groups.add(proc.pid)
+            METRICS.inc("orchestrator_subprocesses_in_flight")
+            
+            async def pump(out) -> Tuple[int, str]:
+                _, written, stderr = await asyncio.gather(
+                    feed_stream(proc.stdin, prompt.encode()),
+                    self.tee_stream(proc.stdout, out, label),
+                    tail_stream(proc.stderr),
+                )
+                await proc.wait()
+                return written, stderr
+            
+            try:
+                with trace_span("claude", category="subprocess", lane=label, pid=proc.pid) as span, \
+                        open(output_path, "wb") as out:
+                    written, stderr = await asyncio.wait_for(pump(out), timeout)
+                    runtime = time.time() - started
+                    if span:
+                        span.args.update(returncode=proc.returncode, bytes=written)
+            except BaseException:
+                if proc.returncode is None:
+                    await terminate_process_group(proc, self.kill_grace)
+                raise
+            finally:
+                SHUTDOWN.groups.discard(proc.pid)
+                METRICS.inc("orchestrator_subprocesses_in_flight", -1)
+        finally:
+            if self.slots:
+                self.slots.release(slot)
+        return proc.returncode, written, stderr, runtime
+    
+    async def tee_stream(self, stream: asyncio.StreamReader, out, label: str) -> int:
+        """Copy a stream to ``out`` chunk by chunk, logging progress periodically."""
+        started = last_report = time.time()
+        written = 0
+        while True:
+            chunk = await stream.read(64 * 1024)
+            if not chunk:
+                break
+            out.write(chunk)
+            written += len(chunk)
+            METRICS.inc("orchestrator_agent_output_bytes_total", len(chunk), agent=label)
+            if time.time() - last_report >= self.progress_interval:
+                out.flush()
+                last_report = time.time()
+                log("INFO", f"{label}: {written / 1024:.0f} KB received "
+                            f"after {last_report - started:.0f}s")
+        return written
+    
+    async def run_attempt(
+        self,
+        agent_name: str,
+        prompt: str,
+        timeout: float,
+        output_log: Path,
+        label: Optional[str] = None,
+        priority: int = 0,
+    ) -> Tuple[int, str, float]:
+        """One attempt at an agent, hedged with a duplicate call once it runs
+        past the agent's p95 when hedging is enabled. Returns (returncode,
+        stderr, runtime) of the call that settled the attempt.
+        
+        When the attempt may be hedged, each call runs in its own ``Scratch``
+        copy of the workspace and only the winner's files are promoted.
+        """
+        label = label or agent_name
+        hedge_after = self.policy.hedge_after(agent_name)
+        if hedge_after is None or hedge_after >= timeout:
+            returncode, _, stderr, runtime = await self.run_claude(
+                prompt, timeout, output_log, label, priority
+            )
+            return returncode, stderr, runtime
+        
+        scratches: Dict[asyncio.Future, Scratch] = {}
+        
+        async def launch(log_path: Path, call_label: str) -> asyncio.Future:
+            scratch = Scratch(self.cache, self.workspace)
+            try:
+                with trace_span("copy_workspace", lane=call_label):
+                    await asyncio.to_thread(scratch.create)
+            except BaseException:
+                await asyncio.to_thread(scratch.discard)
+                raise
+            task = asyncio.ensure_future(self.run_claude(
+                scratch.rewrite(prompt), timeout, log_path, call_label, priority, cwd=scratch.root
+            ))
+            scratches[task] = scratch
+            return task
+        
+        try:
+            primary = await launch(output_log, label)
+            hedge_log = output_log.with_name(f"{label}_output.hedge.log")
+            
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if not done:
+                log("WARN", f"{label} passed its p95 of {hedge_after:.0f}s, "
+                            f"launching a hedged attempt")
+                try:
+                    await launch(hedge_log, f"{label} (hedge)")
+                except OSError as e:
+                    log("WARN", f"Could not copy the workspace for a hedge, keeping {label} alone: {e}")
+            
+            pending = set(scratches)
+            failure: Any = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        failure = failure or task.exception()
+                        continue
+                    returncode, _, stderr, runtime = task.result()
+                    if returncode == 0:
+                        for other in pending:
+                            other.cancel()  # stop the loser before taking the winner's files
+                        await asyncio.gather(*pending, return_exceptions=True)
+                        await asyncio.to_thread(scratches[task].promote)
+                        if task is not primary:
+                            os.replace(hedge_log, output_log)
+                        return returncode, stderr, runtime
+                    failure = (returncode, stderr, runtime)
+            
+            if isinstance(failure, BaseException):
+                raise failure
+            return failure
+        finally:
+            for task in scratches:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*scratches, return_exceptions=True)
+            for scratch in scratches.values():
+                await asyncio.to_thread(scratch.discard)
+    
+    def record_result(self, result: AgentResult, started_at: float, prompt: str):
+        """Add an agent's result to the run history."""
+        if self.history is None:
+            return
+        output_bytes = 0
+        paths = [self.workspace.root / rel for rel in result.output_files]
+        for path in paths + [self.workspace.logs_dir / f"{result.agent_name}_output.log"]:
+            try:
+                output_bytes += path.stat().st_size
+            except OSError:
+                pass
+        self.history.record_agent(
+            workflow_id=self.state.workflow_id,
+            agent=result.agent_name,
+            started_at=started_at,
+            duration_seconds=round(result.duration_seconds, 3),
+            success=int(result.success),
+            cached=int(result.cached),
+            prompt_hash=hashlib.sha256(prompt.encode()).hexdigest()[:16],
+            prompt_bytes=len(prompt.encode()),
+            output_bytes=output_bytes,
+            output_files=len(result.output_files),
+            error=(result.error_message or "")[:500] or None,
+        )
+    
+    async def execute_async(self, agent_name: str, max_retries: Optional[int] = None) -> AgentResult:
+        """Execute an agent on the running event loop."""
+        emoji = AGENTS[agent_name]["emoji"]
+        start_time = time.time()
+        
+        log("AGENT", f"{emoji} Starting {agent_name}...")
+        
+        # Update state
+        self.store.update(current_agent=agent_name)
+        
+        # Build prompt
+        try:
+            with trace_span("build_context"):
+                sections = self.context_sections(agent_name)
+                context = ContextBuilder.join(sections)
+            with trace_span("build_prompt"):
+                prompt = self.build_prompt(agent_name, context)
+            cache_inputs = self.cache_inputs(agent_name, sections)
+        except Exception as e:
+            return AgentResult(
+                agent_name=agent_name,
+                success=False,
+                duration_seconds=time.time() - start_time,
+                output_files=[],
+                error_message=str(e)
+            )
+        
+        # Check cache, fetching the entry from the remote tier on a local miss
+        cache_key = compute_cache_key(cache_inputs)
+        if self.remote_cache is not None and agent_name not in self.cache_bypass:
+            with trace_span("fetch_remote_cache"):
+                await asyncio.to_thread(self.remote_cache.fetch, self.cache, agent_name, cache_key)
+        with trace_span("check_cache") as span:
+            cached = self.check_cache(agent_name, cache_inputs)
+            if span:
+                span.args["hit"] = cached is not None
+        
+        # On a miss, wait for a concurrent run of the same key rather than duplicate it
+        leading = False
+        coalesced = False
+        while cached is None and self.cache_enabled and agent_name not in self.cache_bypass:
+            with trace_span("wait_for_coalesced_run"):
+                leading = await IN_FLIGHT.join(cache_key)
+            if leading:
+                break
+            cached = self.check_cache(agent_name, cache_inputs)
+            coalesced = cached is not None
+        
+        if cached is not None:
+            duration = time.time() - start_time
+            if coalesced:
+                METRICS.inc("orchestrator_coalesced_runs_total")
+                log("AGENT", f"{emoji} {agent_name} completed (coalesced with a concurrent run) "
+                             f"in {duration:.1f}s")
+            else:
+                log("AGENT", f"{emoji} {agent_name} completed (cached) in {duration:.1f}s")
+            self.store.append("completed_agents", agent_name)
+            self.publish_handoff(agent_name, cached["files"])
+            result = AgentResult(
+                agent_name=agent_name,
+                success=True,
+                duration_seconds=duration,
+                output_files=cached["files"],
+                cached=True
+            )
+            self.record_result(result, start_time, prompt)
+            return result
+        
+        # Execute Claude Code, fanned out over API shards when configured
+        output_files: List[str] = []
+        try:
+            with trace_span("snapshot"):
+                self.tracker.start(agent_name)
+            
+            shards = self.plan_shards(agent_name)
+            if shards:
+                success, error_message, executed = await self.run_fanout(agent_name, shards, max_retries)
+            else:
+                # Save prompt for debugging/manual execution
+                get_log_writer().write_file(f"{agent_name}_prompt.md", prompt, self.workspace.logs_dir)
+                success, error_message, executed = await self.run_prompt(
+                    agent_name, prompt, self.workspace.logs_dir / f"{agent_name}_output.log",
+                    max_retries=max_retries,
+                )
+            
+            with trace_span("snapshot"):
+                written = self.tracker.finish(agent_name)
+            if success:
+                output_files = written
+            # Nothing ran when claude is missing: an empty result must not be served later
+            if success and executed:
+                with trace_span("save_cache"):
+                    self.save_cache(
+                        agent_name, cache_inputs, self.workspace.logs_dir / f"{agent_name}_output.log",
+                        output_files,
+                    )
+        finally:
+            self.tracker.active.pop(agent_name, None)  # cancelled before finish()
+            if leading:
+                IN_FLIGHT.land(cache_key)
+        
+        duration = time.time() - start_time
+        
+        if success:
+            log("AGENT", f"{emoji} {agent_name} completed in {duration:.1f}s")
+            self.store.append("completed_agents", agent_name)
+            self.publish_handoff(agent_name, output_files)
+        else:
+            log("ERROR", f"{emoji} {agent_name} failed: {error_message}")
+            self.store.append("failed_agents", agent_name)
+        
+        result = AgentResult(
+            agent_name=agent_name,
+            success=success,
+            duration_seconds=duration,
+            output_files=output_files,
+            error_message=error_message
+        )
+        self.record_result(result, start_time, prompt)
+        return result
+    
+    async def run_prompt(
+        self,
+        agent_name: str,
+        prompt: str,
+        output_log: Path,
+        label: Optional[str] = None,
+        history_key: Optional[str] = None,
+        max_retries: Optional[int] = None,
+    ) -> Tuple[bool, Optional[str], bool]:
+        """Run one prompt here, or hand it to the worker pool when distributed."""
+        if self.jobs is None:
+            return await self.run_with_retries(
+                agent_name, prompt, output_log, label, history_key, max_retries
+            )
+        return await self.run_remote(agent_name, prompt, output_log, label, history_key, max_retries)
+    
+    async def run_remote(
+        self,
+        agent_name: str,
+        prompt: str,
+        output_log: Path,
+        label: Optional[str] = None,
+        history_key: Optional[str] = None,
+        max_retries: Optional[int] = None,
+    ) -> Tuple[bool, Optional[str], bool]:
+        """Enqueue a prompt as a job and wait for a worker to report its result."""
+        label = label or agent_name
+        job_id = await asyncio.to_thread(self.jobs.enqueue, {
+            "workflow_id": self.state.workflow_id,
+            "workspace": str(self.workspace.root),
+            "agent": agent_name,
+            "label": label,
+            "history_key": history_key or agent_name,
+            "prompt": prompt,
+            "prompt_digest": hashlib.sha256(prompt.encode()).hexdigest()[:16],
+            "output_log": str(output_log),
+            "expected": json.dumps(expected_artifacts(agent_name, self.workspace.state_dir)),
+            "max_retries": max_retries or 0,
+            "priority": downstream_depth()[agent_name],
+        })
+        log("INFO", f"Queued {label} as job {job_id}")
+        
+        queued_at = time.time()
+        warned = False
+        try:
+            while True:
+                job = await asyncio.to_thread(self.jobs.get, job_id)
+                if job["status"] in ("done", "failed"):
+                    result = json.loads(job["result"])
+                    if result.get("missing_artifacts"):
+                        log("WARN", f"{label} did not produce {', '.join(result['missing_artifacts'])}")
+                    log("INFO", f"{label} ran on worker {job['worker']} "
+                                f"in {result.get('duration_seconds', 0):.1f}s")
+                    return result["success"], result.get("error_message"), result.get("executed", True)
+                
+                if (not warned and job["status"] == "queued"
+                        and time.time() - queued_at > self.jobs.lease_seconds):
+                    warned = True
+                    if not await asyncio.to_thread(self.jobs.live_workers):
+                        log("WARN", f"Job {job_id} is waiting and no worker is alive. "
+                                    f"Start one with: python3 orchestrator.py --worker")
+                await asyncio.sleep(self.jobs.poll_interval)
+        except BaseException:
+            self.jobs.cancel(job_id)
+            raise
+    
+    def record_attempt(
+        self,
+        agent_name: str,
+        label: str,
+        attempt: int,
+        started_at: float,
+        outcome: str,
+        returncode: Optional[int],
+        prompt: str,
+        output_log: Path,
+    ):
+        if self.history is None:
+            return
+        try:
+            output_bytes = output_log.stat().st_size
+        except OSError:
+            output_bytes = None
+        self.history.record_attempt(
+            workflow_id=LOG_CONTEXT.get().get("workflow_id"),
+            agent=agent_name,
+            label=label,
+            attempt=attempt,
+            started_at=started_at,
+            duration_seconds=round(time.time() - started_at, 3),
+            outcome=outcome,
+            returncode=returncode,
+            prompt_hash=hashlib.sha256(prompt.encode()).hexdigest()[:16],
+            prompt_bytes=len(prompt.encode()),
+            output_bytes=output_bytes,
+        )
+    
+    async def run_with_retries(
+        self,
+        agent_name: str,
+        prompt: str,
+        output_log: Path,
+        label: Optional[str] = None,
+        history_key: Optional[str] = None,
+        max_retries: Optional[int] = None,
+    ) -> Tuple[bool, Optional[str], bool]:
+        """Run one prompt through claude under the retry policy.
+        
+        ``label`` names the call in logs and output files (the agent name by
+        default); ``history_key`` is the duration history it times against.
+        Returns (success, error_message, executed), ``executed`` being False
+        when claude is not installed and the prompt was only saved.
+        """
+        label = label or agent_name
+        history_key = history_key or agent_name
+        error_message = None
+        max_retries = max_retries or self.policy.max_retries
+        timeout = self.policy.timeout_for(history_key)
+        priority = downstream_depth().get(agent_name, 0)
+        
+        attempt = requeues = 0
+        while attempt < max_retries:
+            if self.breaker.is_open:
+                error_message = (f"Circuit breaker open after {self.breaker.failures} "
+                                 f"consecutive claude failures")
+                break
+            
+            set_log_context(attempt=attempt + 1)
+            log("INFO", f"Executing {label} (attempt {attempt + 1}/{max_retries}, "
+                        f"timeout {timeout:.0f}s)...")
+            retryable = True
+            
+            try:
+                # Try to run claude CLI, streaming its output to the log
+                attempt_start = time.time()
+                returncode, outcome = None, "error"
+                try:
+                    with trace_span(f"attempt {attempt + 1}", category="attempt", lane=label,
+                                    timeout=round(timeout)) as span:
+                        returncode, stderr, runtime = await self.run_attempt(
+                            history_key, prompt, timeout, output_log, label, priority
+                        )
+                        if span:
+                            span.args["returncode"] = returncode
+                    outcome = ("success" if returncode == 0
+                               else "rate_limited" if RateLimiter.is_rate_limited(stderr) else "error")
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    raise
+                except asyncio.CancelledError:
+                    outcome = "cancelled"
+                    raise
+                finally:
+                    self.record_attempt(agent_name, label, attempt + 1, attempt_start, outcome,
+                                        returncode, prompt, output_log)
+                
+                if returncode == 0:
+                    self.breaker.record_success()
+                    # Only the child's own runtime: queueing for tokens or a
+                    # slot would inflate the p95 that timeouts and hedging use
+                    self.policy.history.record(history_key, runtime)
+                    return True, None, True
+                else:
+                    error_message = stderr.strip() or f"claude exited with code {returncode}"
+                    retryable = self.policy.is_retryable(returncode, stderr)
+                    if RateLimiter.is_rate_limited(stderr):
+                        METRICS.inc("orchestrator_rate_limited_total", agent=agent_name)
+                    if self.limiter and RateLimiter.is_rate_limited(stderr):
+                        log("WARN", f"{label} was rate limited, pausing calls for "
+                                    f"{self.limiter.cooldown:.0f}s")
+                        self.limiter.pause(self.limiter.cooldown)
+                        # Queue again behind the limiter rather than spend an attempt
+                        if requeues < self.limiter.max_requeues:
+                            requeues += 1
+                            continue
+                    
+            except FileNotFoundError:
+                # Claude CLI not found - save for manual execution
+                log("WARN", "Claude CLI not found. Prompt saved for manual execution.")
+                self.workspace.logs_dir.mkdir(parents=True, exist_ok=True)
+                (self.workspace.logs_dir / f"{label}_execute_me.md").write_text(prompt)
+                return True, None, False  # Consider it a "success" for demo purposes
+                
+            except asyncio.TimeoutError:
+                error_message = f"Execution timed out after {timeout:.0f}s"
+                METRICS.inc("orchestrator_agent_timeouts_total", agent=agent_name)
+                
+            except Exception as e:
+                error_message = str(e)
+            
+            self.breaker.record_failure()
+            if self.breaker.is_open:
+                error_message = (f"Circuit breaker open after {self.breaker.failures} "
+                                 f"consecutive claude failures ({error_message})")
+                break
+            if not retryable:
+                log("ERROR", f"{label} hit a non-retryable error")
+                break
+            
+            if attempt < max_retries - 1:
+                delay = self.policy.backoff(attempt)
+                log("WARN", f"Retry in {delay:.1f} seconds... ({error_message})")
+                METRICS.inc("orchestrator_agent_retries_total", agent=agent_name)
+                with trace_span("retry_sleep", category="retry", lane=label, delay=round(delay, 3)):
+                    await asyncio.sleep(delay)
+            attempt += 1
+        
+        return False, error_message, True
+    
+    def plan_shards(self, agent_name: str) -> List[Shard]:
+        """API shards to fan ``agent_name`` out over, or [] to run it as one call."""
+        fanout = self.config.get("fanout", {})
+        if not fanout.get("enabled", False) or agent_name not in fanout.get("agents", []):
+            return []
+        
+        text = self.context_builder.read_text(self.workspace.state_dir / "api_design.json")
+        try:
+            api_design = json.loads(text) if text else {}
+        except ValueError:
+            return []
+        if len(api_design.get("endpoints") or []) < fanout.get("min_endpoints", 8):
+            return []
+        
+        shards = partition_endpoints(api_design, fanout.get("max_shards", 4))
+        return shards if len(shards) > 1 else []
+    
+    def shard_notes(self, agent_name: str, shard: Shard) -> Path:
+        return self.workspace.state_dir / f"{agent_name}_shard_{shard.index + 1}.json"
+    
+    def build_shard_prompt(self, agent_name: str, shard: Shard, total: int) -> str:
+        """The agent's prompt with api_design.json cut down to one shard."""
+        sections = [
+            s for s in self.context_builder.sections(
+                agent_name, self.state.user_request, self.state.workflow_id
+            )
+            if s.label != "API_DESIGN.JSON"
+        ]
+        notes = self.shard_notes(agent_name, shard)
+        sections.insert(0, ContextSection("SCOPE", f"""You are shard {shard.index + 1} of {total} parallel {agent_name} runs. \
+Your shard owns these API resources: {", ".join(shard.resources)}.
+- Implement only the endpoints in API_DESIGN.JSON below, and the code specific to them.
+- Do not edit shared files (entry points, route or navigation registries, shared types, \
+package.json, config). Describe the changes they need instead; a merge step applies them.
+- Finish by writing {notes} as {{"files": [files you created], \
+"shared_changes": [{{"file": "...", "change": "..."}}]}}."""))
+        sections.append(ContextSection(
+            "API_DESIGN.JSON", json.dumps(shard.spec, separators=(",", ":"), ensure_ascii=False),
+            1, shard.spec,
+        ))
+        return self.build_prompt(agent_name, self.context_builder.render(sections, agent_name))
+    
+    def build_merge_prompt(self, agent_name: str, shards: List[Shard], files: List[str]) -> str:
+        """The reduce step: reconcile what the shards wrote into one codebase."""
+        notes = []
+        for shard in shards:
+            text = self.context_builder.read_text(self.shard_notes(agent_name, shard))
+            try:
+                shard_notes = json.loads(text) if text is not None else "missing"
+            except ValueError:
+                shard_notes = text
+            notes.append({"shard": shard.index + 1, "resources": shard.resources,
+                          "notes": shard_notes})
+        
+        sections = [
+            s for s in self.context_builder.sections(
+                agent_name, self.state.user_request, self.state.workflow_id
+            )
+            if s.label != "API_DESIGN.JSON"
+        ]
+        sections.insert(0, ContextSection("MERGE STEP", f"""{len(shards)} parallel {agent_name} runs \
+each implemented a slice of the API. Reconcile their work into one coherent codebase in src/:
+- Apply every shared_changes entry from the shard notes to the shared files.
+- Merge duplicated helpers, types and components, and fix imports between shards.
+- Do not reimplement the shards' modules; only change what integration requires."""))
+        sections.append(ContextSection("SHARD NOTES", json.dumps(notes, ensure_ascii=False)))
+        shown = files[:500]
+        more = f"\n... {len(files) - len(shown)} more" if len(files) > len(shown) else ""
+        sections.append(ContextSection("FILES WRITTEN BY SHARDS", "\n".join(shown) + more, 2))
+        return self.build_prompt(agent_name, self.context_builder.render(sections, agent_name))
+    
+    async def run_fanout(
+        self, agent_name: str, shards: List[Shard], max_retries: Optional[int] = None
+    ) -> Tuple[bool, Optional[str], bool]:
+        """Map: one scoped claude call per shard, in parallel. Reduce: one merge call."""
+        log("INFO", f"Fanning {agent_name} out over {len(shards)} shards: "
+                    f"{'; '.join(', '.join(s.resources) for s in shards)}")
+        logs_dir = self.workspace.logs_dir
+        for shard in shards:
+            self.shard_notes(agent_name, shard).unlink(missing_ok=True)  # never merge stale notes
+        before = await asyncio.to_thread(self.cache.snapshot)
+        
+        async def run_shard(shard: Shard) -> Tuple[bool, Optional[str], bool]:
+            label = f"{agent_name}.{shard.index + 1}"
+            with trace_span(f"shard {shard.index + 1}", category="shard", lane=label,
+                            resources=", ".join(shard.resources)):
+                prompt = self.build_shard_prompt(agent_name, shard, len(shards))
+                get_log_writer().write_file(f"{label}_prompt.md", prompt, logs_dir)
+                return await self.run_prompt(
+                    agent_name, prompt, logs_dir / f"{label}_output.log", label,
+                    history_key=f"{agent_name}:shard", max_retries=max_retries,
+                )
+        
+        # Without a merge step the other shards' work is wasted once one fails
+        tasks = [asyncio.ensure_future(run_shard(shard)) for shard in shards]
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if self.fail_fast and any(t.exception() or not t.result()[0] for t in done):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        errors = []
+        executed = True
+        for shard, task in zip(shards, tasks):
+            if task.cancelled():
+                continue
+            ok, error, ran = task.result()
+            executed = executed and ran
+            if not ok:
+                errors.append(f"shard {shard.index + 1}: {error}")
+        if errors:
+            return False, "; ".join(errors), executed
+        
+        files = await asyncio.to_thread(self.cache.changed_since, before)
+        with trace_span("merge", category="merge", lane=f"{agent_name}.merge"):
+            prompt = self.build_merge_prompt(agent_name, shards, files)
+            get_log_writer().write_file(f"{agent_name}_prompt.md", prompt, logs_dir)
+            success, error_message, merged = await self.run_prompt(
+                agent_name, prompt, logs_dir / f"{agent_name}_output.log", f"{agent_name}.merge",
+                history_key=f"{agent_name}:merge", max_retries=max_retries,
+            )
+        return success, error_message, executed and merged
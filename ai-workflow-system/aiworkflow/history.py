@@ -0,0 +1,190 @@
+"""Per-run statistics in SQLite, for ``--history`` reports."""
+
+import time
+import socket
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+from .core import AGENTS, HISTORY_DB, SCRIPT_DIR
+from .telemetry import log
+from .policy import nearest_rank
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RUN HISTORY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class RunHistory:
+    """Every workflow run, agent run and claude attempt on the host, in SQLite.
+    
+    Unlike ``DurationHistory``, which keeps the last few durations per agent
+    to size timeouts, this keeps rows for ``retention_days``, with prompt
+    hashes, cache outcomes and byte counts, for latency analytics and
+    capacity planning. Orchestrators and workers write to the same file;
+    recording never fails a run.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            workflow_id TEXT, kind TEXT, workspace TEXT,
+            started_at REAL, duration_seconds REAL, success INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+        CREATE TABLE IF NOT EXISTS agent_runs (
+            id INTEGER PRIMARY KEY,
+            workflow_id TEXT, agent TEXT, started_at REAL, duration_seconds REAL,
+            success INTEGER, cached INTEGER, prompt_hash TEXT, prompt_bytes INTEGER,
+            output_bytes INTEGER, output_files INTEGER, error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS agent_runs_agent ON agent_runs (agent, started_at);
+        CREATE INDEX IF NOT EXISTS agent_runs_workflow ON agent_runs (workflow_id);
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY,
+            workflow_id TEXT, agent TEXT, label TEXT, attempt INTEGER, host TEXT,
+            started_at REAL, duration_seconds REAL, outcome TEXT, returncode INTEGER,
+            prompt_hash TEXT, prompt_bytes INTEGER, output_bytes INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS attempts_agent ON attempts (agent, started_at);
+        CREATE INDEX IF NOT EXISTS attempts_workflow ON attempts (workflow_id);
+    """
+    
+    def __init__(self, path: Path = HISTORY_DB, retention_days: float = 90):
+        self.path = path
+        self.retention_days = retention_days
+        self.ready = False
+        self.warned = False
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["RunHistory"]:
+        history = config.get("history", {})
+        if not history.get("enabled", True):
+            return None
+        return cls(
+            SCRIPT_DIR / history["path"] if history.get("path") else HISTORY_DB,
+            retention_days=history.get("retention_days", 90),
+        )
+    
+    @contextmanager
+    def _connect(self):
+        # Rollback journal, as for the job queue, so workers on a shared mount can write
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            if not self.ready:
+                db.executescript(self.SCHEMA)
+                cutoff = time.time() - self.retention_days * 86400
+                for table in ("runs", "agent_runs", "attempts"):
+                    db.execute(f"DELETE FROM {table} WHERE started_at < ?", (cutoff,))
+                self.ready = True
+            yield db
+        finally:
+            db.close()
+    
+    def _insert(self, table: str, row: Dict[str, Any]):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as db:
+                db.execute(f"INSERT INTO {table} ({', '.join(row)}) "
+                           f"VALUES ({', '.join('?' * len(row))})", tuple(row.values()))
+        except (OSError, sqlite3.Error) as e:
+            if not self.warned:
+                self.warned = True
+                log("WARN", f"Could not record run history in {self.path}: {e}")
+    
+    def record_run(self, **row):
+        self._insert("runs", row)
+    
+    def record_agent(self, **row):
+        self._insert("agent_runs", row)
+    
+    def record_attempt(self, **row):
+        self._insert("attempts", {"host": socket.gethostname(), **row})
+    
+    def durations(self, since: float, until: float) -> Dict[str, List[float]]:
+        """Sorted durations of successful, uncached agent runs in a time range."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT agent, duration_seconds FROM agent_runs "
+                "WHERE success = 1 AND cached = 0 AND started_at >= ? AND started_at < ? "
+                "ORDER BY agent, duration_seconds", (since, until),
+            ).fetchall()
+        durations: Dict[str, List[float]] = {}
+        for row in rows:
+            durations.setdefault(row["agent"], []).append(row["duration_seconds"])
+        return durations
+    
+    def report(
+        self,
+        window_days: float = 7,
+        baseline_days: float = 28,
+        threshold: float = 0.25,
+        min_samples: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """Per-agent latency over the last ``window_days``, against the
+        ``baseline_days`` before it. An agent regressed when its p50 or p95
+        grew by more than ``threshold`` with ``min_samples`` runs on each side."""
+        now = time.time()
+        window_start = now - window_days * 86400
+        recent = self.durations(window_start, now + 1)
+        baseline = self.durations(window_start - baseline_days * 86400, window_start)
+        
+        with self._connect() as db:
+            counts = {row["agent"]: row for row in db.execute(
+                "SELECT agent, COUNT(*) AS runs, SUM(success = 0) AS failures, "
+                "SUM(cached) AS cached, AVG(prompt_bytes) AS prompt_bytes FROM agent_runs "
+                "WHERE started_at >= ? GROUP BY agent", (window_start,),
+            )}
+            attempts = {row["agent"]: row["attempts"] for row in db.execute(
+                "SELECT agent, COUNT(*) AS attempts FROM attempts "
+                "WHERE started_at >= ? GROUP BY agent", (window_start,),
+            )}
+        
+        report = []
+        for agent_name in sorted(set(counts) | set(baseline), key=lambda a: list(AGENTS).index(a)
+                                 if a in AGENTS else len(AGENTS)):
+            samples, base = recent.get(agent_name, []), baseline.get(agent_name, [])
+            row = counts.get(agent_name)
+            entry = {
+                "agent": agent_name,
+                "runs": row["runs"] if row else 0,
+                "failures": row["failures"] if row else 0,
+                "cached": row["cached"] if row else 0,
+                "attempts": attempts.get(agent_name, 0),
+                "avg_prompt_bytes": round(row["prompt_bytes"] or 0) if row else 0,
+                "p50": nearest_rank(samples, 0.50),
+                "p95": nearest_rank(samples, 0.95),
+                "p99": nearest_rank(samples, 0.99),
+                "baseline_runs": len(base),
+                "baseline_p50": nearest_rank(base, 0.50),
+                "baseline_p95": nearest_rank(base, 0.95),
+                "regressions": [],
+            }
+            if len(samples) >= min_samples and len(base) >= min_samples:
+                for q in ("p50", "p95"):
+                    if entry[q] > entry[f"baseline_{q}"] * (1 + threshold):
+                        entry["regressions"].append(q)
+            report.append(entry)
+        return report
+
+
+def print_history_report(report: List[Dict[str, Any]], window_days: float, baseline_days: float):
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:.1f}" if value is not None else "-"
+    
+    print(f"Agent latency over the last {window_days:g} days "
+          f"(baseline: the {baseline_days:g} days before), seconds")
+    header = (f"{'agent':<20} {'runs':>5} {'fail':>5} {'cached':>6} {'tries':>6} "
+              f"{'p50':>7} {'p95':>7} {'p99':>7} {'base p50':>9} {'base p95':>9}")
+    print(header)
+    print("─" * len(header))
+    for r in report:
+        flag = f"  ⚠ regression ({', '.join(r['regressions'])})" if r["regressions"] else ""
+        print(f"{r['agent']:<20} {r['runs']:>5} {r['failures']:>5} {r['cached']:>6} "
+              f"{r['attempts']:>6} {seconds(r['p50']):>7} {seconds(r['p95']):>7} "
+              f"{seconds(r['p99']):>7} {seconds(r['baseline_p50']):>9} "
+              f"{seconds(r['baseline_p95']):>9}{flag}")
+    if not report:
+        print("No runs recorded")
@@ -0,0 +1,193 @@
+"""SQLite queue of claude jobs leased to distributed workers."""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+from .core import AGENTS, CONTEXT_SOURCES, QUEUE_FILE, SCRIPT_DIR, ancestors
+from .telemetry import log
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# JOB QUEUE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def expected_artifacts(agent_name: str, state_dir: Path) -> List[str]:
+    """State files the agent is expected to write: those read by a dependent
+    whose only dependency it is, and by none of its own ancestors."""
+    upstream = ancestors(agent_name) | {agent_name}
+    expected = []
+    for child, info in AGENTS.items():
+        if info["deps"] != [agent_name]:
+            continue
+        for file, _ in CONTEXT_SOURCES.get(child, []):
+            read_upstream = any(file in (f for f, _ in CONTEXT_SOURCES.get(a, [])) for a in upstream)
+            if file not in expected and not read_upstream and not (state_dir / file).exists():
+                expected.append(file)
+    return expected
+
+
+class JobQueue:
+    """Durable queue of claude jobs in SQLite, shared by a coordinator and its workers.
+    
+    A worker claims a job by taking a lease on it and renews the lease while
+    the job runs. A job whose lease expires goes back to the queue, its
+    worker presumed lost; after ``max_expiries`` lost leases it fails.
+    Workers on other machines need the workspace and this file on a shared
+    filesystem with working POSIX locks, mounted at the same path.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            workflow_id TEXT, workspace TEXT, agent TEXT, label TEXT, history_key TEXT,
+            prompt TEXT, prompt_digest TEXT, output_log TEXT, expected TEXT,
+            max_retries INTEGER, priority INTEGER DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            worker TEXT, lease_expires REAL, expiries INTEGER DEFAULT 0,
+            enqueued_at REAL, started_at REAL, finished_at REAL, result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, enqueued_at);
+        CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, host TEXT, pid INTEGER, last_seen REAL);
+    """
+    
+    def __init__(
+        self,
+        path: Path = QUEUE_FILE,
+        lease_seconds: float = 60,
+        max_expiries: int = 3,
+        poll_interval: float = 0.5,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_expiries = max_expiries
+        self.poll_interval = poll_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(self.SCHEMA)
+            # Keep a week of finished jobs for inspection
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') "
+                       "AND finished_at < ?", (time.time() - 7 * 86400,))
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> "JobQueue":
+        workers = config.get("workers", {})
+        return cls(
+            SCRIPT_DIR / workers["queue"] if workers.get("queue") else QUEUE_FILE,
+            lease_seconds=workers.get("lease_seconds", 60),
+            max_expiries=workers.get("max_lease_expiries", 3),
+            poll_interval=workers.get("poll_interval_seconds", 0.5),
+        )
+    
+    @contextmanager
+    def _connect(self):
+        # Rollback journal rather than WAL, which needs shared memory and
+        # does not work over network filesystems
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+    
+    def enqueue(self, job: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        row = {**job, "id": job_id, "enqueued_at": time.time()}
+        with self._connect() as db:
+            db.execute(f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                       tuple(row.values()))
+        return job_id
+    
+    def get(self, job_id: str) -> Dict[str, Any]:
+        with self._connect() as db:
+            return dict(db.execute(
+                "SELECT id, status, worker, result FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone())
+    
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the most urgent runnable job to ``worker_id``, or return None."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)",
+                           (worker_id, socket.gethostname(), os.getpid(), now))
+                while True:
+                    row = db.execute(
+                        "SELECT * FROM jobs WHERE status = 'queued' "
+                        "OR (status = 'leased' AND lease_expires < ?) "
+                        "ORDER BY priority DESC, enqueued_at LIMIT 1", (now,)
+                    ).fetchone()
+                    if row is None:
+                        db.execute("COMMIT")
+                        return None
+                    if row["status"] == "leased":
+                        expiries = row["expiries"] + 1
+                        log("WARN", f"Job {row['id']} ({row['label']}) lost worker {row['worker']}")
+                        if expiries >= self.max_expiries:
+                            result = {"success": False, "error_message":
+                                      f"Lease expired {expiries} times, workers keep dying"}
+                            db.execute(
+                                "UPDATE jobs SET status = 'failed', expiries = ?, result = ?, "
+                                "finished_at = ? WHERE id = ?",
+                                (expiries, json.dumps(result), now, row["id"]),
+                            )
+                            continue
+                        db.execute("UPDATE jobs SET expiries = ? WHERE id = ?", (expiries, row["id"]))
+                    db.execute(
+                        "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, "
+                        "started_at = ? WHERE id = ?",
+                        (worker_id, now + self.lease_seconds, now, row["id"]),
+                    )
+                    db.execute("COMMIT")
+                    return dict(row)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+    
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Renew a lease. False means the job was cancelled or taken over."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("UPDATE workers SET last_seen = ? WHERE id = ?", (now, worker_id))
+            return db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + self.lease_seconds, job_id, worker_id),
+            ).rowcount == 1
+    
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        with self._connect() as db:
+            return db.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                ("done" if result["success"] else "failed", json.dumps(result), time.time(),
+                 job_id, worker_id),
+            ).rowcount == 1
+    
+    def cancel(self, job_id: str):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                       "WHERE id = ? AND status IN ('queued', 'leased')", (time.time(), job_id))
+    
+    def leave(self, worker_id: str):
+        with self._connect() as db:
+            db.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+    
+    def live_workers(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM workers WHERE last_seen > ?",
+                              (time.time() - 2 * self.lease_seconds,)).fetchone()[0]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = [dict(r) for r in db.execute(
+                "SELECT id, host, pid, last_seen FROM workers WHERE last_seen > ? ORDER BY id",
+                (time.time() - 2 * self.lease_seconds,))]
+        return {"jobs": counts, "workers": workers}
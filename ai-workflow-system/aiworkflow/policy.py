@@ -0,0 +1,356 @@
+"""Host slots, retry policy, circuit breakers and API rate limiting."""
+
+import json
+import time
+import math
+import random
+import re
+import heapq
+import asyncio
+import itertools
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .core import HISTORY_FILE, RATE_LIMIT_FILE, SLOTS_DIR, atomic_write_text
+from .telemetry import METRICS, log
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# HOST SLOTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class HostSlots:
+    """Host-wide cap on concurrent agent processes, shared by every orchestrator.
+    
+    Each running agent holds an exclusive ``flock`` on one of ``limit`` slot
+    files under ``SLOTS_DIR``. Locks are released by the kernel if the holder
+    dies, so a crashed orchestrator never leaks a slot. Without ``fcntl`` the
+    cap only applies within this process.
+    """
+    
+    def __init__(self, limit: int, slots_dir: Path = SLOTS_DIR, poll_interval: float = 0.25):
+        self.limit = max(1, limit)
+        self.slots_dir = slots_dir
+        self.poll_interval = poll_interval
+        self.local = asyncio.Semaphore(self.limit) if fcntl is None else None
+    
+    def _try_acquire(self) -> Optional[Any]:
+        self.slots_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(self.limit):
+            handle = open(self.slots_dir / f"slot-{i}.lock", "a")
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except OSError:
+                handle.close()
+        return None
+    
+    async def acquire(self) -> Optional[Any]:
+        """Wait for a free slot. Returns a handle to pass to ``release``."""
+        if self.local is not None:
+            await self.local.acquire()
+            return None
+        while True:
+            handle = self._try_acquire()
+            if handle is not None:
+                return handle
+            await asyncio.sleep(self.poll_interval)
+    
+    def release(self, handle: Optional[Any]):
+        if self.local is not None:
+            self.local.release()
+        elif handle is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            handle.close()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RETRY POLICY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# stderr patterns for failures that no amount of retrying will fix
+FATAL_ERROR_PATTERNS = [
+    r"invalid api key",
+    r"authentication",
+    r"unauthori[sz]ed",
+    r"credit balance",
+    r"prompt is too long",
+    r"context (length|window)",
+    r"unknown (option|argument)",
+]
+
+# Exit codes from the shell when the command cannot run at all
+FATAL_EXIT_CODES = {126, 127}
+
+# stderr patterns for provider rate limiting, which pause every caller
+RATE_LIMIT_PATTERNS = [
+    r"rate.?limit",
+    r"too many requests",
+    r"\b429\b",
+    r"overloaded",
+]
+
+
+def nearest_rank(samples: List[float], q: float) -> Optional[float]:
+    """The ``q`` quantile of already sorted samples, by the nearest-rank method."""
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+
+class DurationHistory:
+    """Rolling per-agent record of successful claude call durations.
+    
+    Stored in one JSON file shared by every workflow on the host, so timeouts
+    and hedging thresholds learn from all runs.
+    """
+    
+    def __init__(self, path: Path = HISTORY_FILE, keep: int = 50):
+        self.path = path
+        self.keep = keep
+        self.samples: Dict[str, List[float]] = self._load()
+    
+    def _load(self) -> Dict[str, List[float]]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+    
+    def record(self, agent_name: str, seconds: float):
+        # Re-read first so concurrent workflows mostly keep each other's samples
+        self.samples = self._load()
+        samples = self.samples.setdefault(agent_name, [])
+        samples.append(round(seconds, 2))
+        del samples[:-self.keep]
+        try:
+            atomic_write_text(self.path, json.dumps(self.samples))
+        except OSError:
+            pass
+    
+    def count(self, agent_name: str) -> int:
+        return len(self.samples.get(agent_name, []))
+    
+    def percentile(self, agent_name: str, q: float) -> Optional[float]:
+        return nearest_rank(sorted(self.samples.get(agent_name, [])), q)
+
+
+class CircuitBreaker:
+    """Trips after ``threshold`` consecutive failed attempts across all agents.
+    
+    Once open, further attempts fail immediately so a broken or exhausted
+    claude CLI stops the run instead of burning every agent's retries.
+    """
+    
+    def __init__(self, threshold: int = 5):
+        self.threshold = threshold
+        self.failures = 0
+        self.lock = threading.Lock()  # shared by the threads of concurrent workflows
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+    
+    @property
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.threshold > 0 and self.failures >= self.threshold
+
+
+class RetryPolicy:
+    """Timeouts, backoff, error classification and hedging for agent calls."""
+    
+    def __init__(self, config: Dict, history: Optional[DurationHistory] = None):
+        system = config.get("system", {})
+        retry = config.get("retry", {})
+        self.agents_config = config.get("agents", {}) or {}
+        self.history = history or DurationHistory()
+        
+        self.max_retries = system.get("max_retries", 3)
+        self.default_timeout = system.get("timeout_seconds", 300)
+        self.base_delay = system.get("retry_delay_seconds", 5)
+        self.max_delay = retry.get("backoff_max_seconds", 120)
+        self.timeout_multiplier = retry.get("timeout_multiplier", 2.0)
+        self.min_timeout = retry.get("min_timeout_seconds", 60)
+        self.max_timeout = retry.get("max_timeout_seconds", 1800)
+        self.min_samples = retry.get("history_min_samples", 5)
+        self.breaker_threshold = retry.get("circuit_breaker_threshold", 5)
+        self.hedge = retry.get("hedge", False)
+    
+    def configured_timeout(self, agent_name: str) -> float:
+        agent_name = agent_name.split(":")[0]  # "frontend_developer:shard" times like its agent
+        agent_config = (self.agents_config.get(agent_name) or {}).get("config", {}) or {}
+        return agent_config.get("timeout_seconds", self.default_timeout)
+    
+    def timeout_for(self, agent_name: str) -> float:
+        """Timeout for one attempt: observed p95 times the multiplier once there is
+        enough history, otherwise the configured value."""
+        if self.history.count(agent_name) < self.min_samples:
+            return self.configured_timeout(agent_name)
+        p95 = self.history.percentile(agent_name, 0.95)
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_multiplier))
+    
+    def hedge_after(self, agent_name: str) -> Optional[float]:
+        """Seconds after which to launch a duplicate attempt, or None."""
+        if not self.hedge or self.history.count(agent_name) < self.min_samples:
+            return None
+        return self.history.percentile(agent_name, 0.95)
+    
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    @staticmethod
+    def is_retryable(returncode: int, stderr: str) -> bool:
+        if returncode in FATAL_EXIT_CODES:
+            return False
+        return not any(re.search(p, stderr, re.IGNORECASE) for p in FATAL_ERROR_PATTERNS)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RATE LIMITING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class RateLimiter:
+    """Token buckets for claude requests and estimated prompt tokens per minute.
+    
+    Each bucket holds one minute of budget and refills continuously. Levels
+    live in ``RATE_LIMIT_FILE`` under an exclusive ``flock``, so every
+    orchestrator and worker on the host draws from the same budget; without
+    ``fcntl`` they are kept in memory. Callers short of budget queue instead
+    of failing, served in priority order: agents with the longest chain of
+    dependents, the critical path, go first.
+    """
+    
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        cooldown_seconds: float = 30,
+        max_requeues: int = 10,
+        path: Path = RATE_LIMIT_FILE,
+        poll_interval: float = 0.25,
+    ):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.cooldown = cooldown_seconds
+        self.max_requeues = max_requeues
+        self.path = path
+        self.poll_interval = poll_interval
+        self.memory: Optional[Dict[str, float]] = {} if fcntl is None else None
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def _buckets(self):
+        """The current bucket levels, refilled; changes are saved on exit."""
+        handle = None
+        if self.memory is not None:
+            buckets = self.memory
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handle = open(self.path, "a+")
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            handle.seek(0)
+            try:
+                buckets = json.loads(handle.read() or "{}")
+            except ValueError:
+                buckets = {}
+        try:
+            now = time.time()
+            elapsed = max(0.0, now - buckets.get("at", now))
+            buckets["requests"] = min(self.rpm, buckets.get("requests", self.rpm) + elapsed * self.rpm / 60)
+            buckets["tokens"] = min(self.tpm, buckets.get("tokens", self.tpm) + elapsed * self.tpm / 60)
+            buckets["at"] = now
+            yield buckets
+            if handle is not None:
+                handle.seek(0)
+                handle.truncate()
+                handle.write(json.dumps(buckets))
+                handle.flush()
+        finally:
+            if handle is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                handle.close()
+    
+    def _try_take(self, tokens: float) -> float:
+        """Take one request and ``tokens``, or return seconds until they are available."""
+        tokens = min(tokens, self.tpm)  # a prompt over a minute's budget waits for a full bucket
+        with self._buckets() as buckets:
+            paused = buckets.get("paused_until", 0) - buckets["at"]
+            if paused > 0:
+                return paused
+            wait = max(
+                (1 - buckets["requests"]) * 60 / self.rpm if self.rpm else 0,
+                (tokens - buckets["tokens"]) * 60 / self.tpm if self.tpm else 0,
+            )
+            if wait > 0:
+                return wait
+            if self.rpm:
+                buckets["requests"] -= 1
+            if self.tpm:
+                buckets["tokens"] -= tokens
+            return 0
+    
+    async def acquire(self, tokens: float, priority: int = 0, label: str = "claude") -> float:
+        """Wait for budget for one call of ``tokens`` prompt tokens. Returns the seconds waited."""
+        entry = (-priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiters, entry)
+        started = time.time()
+        METRICS.inc("orchestrator_rate_limit_waiters")
+        logged = False
+        try:
+            while True:
+                with self._lock:
+                    first = self._waiters[0] == entry
+                wait = self._try_take(tokens) if first else self.poll_interval
+                if wait <= 0:
+                    return time.time() - started
+                if first and not logged and wait >= 1:
+                    logged = True
+                    log("INFO", f"{label} queued {wait:.0f}s for rate limit budget")
+                await asyncio.sleep(min(wait, self.poll_interval))
+        finally:
+            with self._lock:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            METRICS.inc("orchestrator_rate_limit_waiters", -1)
+            METRICS.inc("orchestrator_rate_limit_wait_seconds_total", time.time() - started)
+    
+    def pause(self, seconds: float):
+        """Hold every caller for ``seconds`` after the provider rejected a call."""
+        with self._buckets() as buckets:
+            buckets["paused_until"] = max(buckets.get("paused_until", 0), buckets["at"] + seconds)
+    
+    @staticmethod
+    def is_rate_limited(stderr: str) -> bool:
+        return any(re.search(p, stderr, re.IGNORECASE) for p in RATE_LIMIT_PATTERNS)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter(config: Dict) -> Optional[RateLimiter]:
+    """The process-wide limiter when ``rate_limit.enabled`` is set, else None."""
+    global _rate_limiter
+    rate_config = config.get("rate_limit", {})
+    if not rate_config.get("enabled", False):
+        return None
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(
+            rate_config.get("requests_per_minute", 50),
+            rate_config.get("tokens_per_minute", 400000),
+            cooldown_seconds=rate_config.get("cooldown_seconds", 30),
+            max_requeues=rate_config.get("max_requeues", 10),
+        )
+    return _rate_limiter
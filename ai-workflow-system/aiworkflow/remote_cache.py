@@ -0,0 +1,432 @@
+"""Content-addressed remote cache, its backends and ``--cache-server``."""
+
+import os
+import hmac
+import json
+import queue
+import atexit
+import time
+import uuid
+import re
+import hashlib
+import urllib.error
+import urllib.request
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .core import REMOTE_CACHE_DIR, SCRIPT_DIR, atomic_write_text
+from .telemetry import METRICS, log
+from .cache import ArtifactCache
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REMOTE CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Cache keys and blob digests are SHA-256 hex digests, and nothing else is a valid path
+HEX64 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class CasStore:
+    """Content-addressed blobs plus an index from cache key to blob digest, on disk.
+    
+    Blobs live in ``cas/<digest[:2]>/<digest>`` and index records in
+    ``ac/<key>``. A blob is checked against its digest when written and when
+    read. Past ``max_bytes``, the least recently read blobs are evicted;
+    index records left pointing at them read as misses.
+    """
+    
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+    
+    def blob_path(self, digest: str) -> Path:
+        return self.root / "cas" / digest[:2] / digest
+    
+    def has_blob(self, digest: str) -> bool:
+        return self.blob_path(digest).is_file()
+    
+    def get_blob(self, digest: str) -> Optional[bytes]:
+        path = self.blob_path(digest)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            log("WARN", f"Dropping corrupt cache blob {digest[:12]}")
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+    
+    def put_blob(self, digest: str, data: bytes):
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError("content does not match its digest")
+        path = self.blob_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{digest}.{uuid.uuid4().hex}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self.evict()
+    
+    def get_ref(self, key: str) -> Optional[str]:
+        if not HEX64.match(key):
+            return None
+        try:
+            digest = json.loads((self.root / "ac" / key).read_text())["digest"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return digest if isinstance(digest, str) and HEX64.match(digest) else None
+    
+    def put_ref(self, key: str, digest: str):
+        if not HEX64.match(key) or not HEX64.match(digest):
+            raise ValueError("cache keys and digests must be SHA-256 hex digests")
+        atomic_write_text(self.root / "ac" / key, json.dumps({"digest": digest}))
+    
+    def evict(self):
+        with self.lock:
+            blobs = []
+            for path in (self.root / "cas").glob("*/*"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in blobs)
+            for _, size, path in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+
+class CacheBackend(ABC):
+    """A shared tier for packed cache entries, read and written by cache key.
+    
+    Implementations verify content against its SHA-256 both ways. Errors
+    other than a plain miss are raised as ``OSError``.
+    """
+    
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """The entry stored under ``key``, or None on a miss."""
+    
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Store ``data`` under ``key``."""
+    
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+class DirectoryCacheBackend(CacheBackend):
+    """A ``CasStore`` on a directory every machine mounts, e.g. a CI volume."""
+    
+    def __init__(self, path: Path, max_bytes: int):
+        self.store = CasStore(path, max_bytes)
+    
+    def get(self, key: str) -> Optional[bytes]:
+        digest = self.store.get_ref(key)
+        return self.store.get_blob(digest) if digest else None
+    
+    def put(self, key: str, data: bytes):
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.store.has_blob(digest):
+            self.store.put_blob(digest, data)
+        self.store.put_ref(key, digest)
+    
+    def exists(self, key: str) -> bool:
+        digest = self.store.get_ref(key)
+        return digest is not None and self.store.has_blob(digest)
+
+
+class HttpCacheBackend(CacheBackend):
+    """Client for a cache server (``orchestrator.py --cache-server``).
+    
+    ``GET /ac/<key>`` returns the digest of the entry stored under a cache
+    key and ``GET /cas/<digest>`` the entry itself, checked against that
+    digest. Writes upload the blob unless the server has it, then the key.
+    """
+    
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 10):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+    
+    def request(self, method: str, path: str, data: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Optional[bytes]:
+        """Body of the response, or None on a 404."""
+        headers = dict(headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(f"{self.url}{path}", data=data, method=method,
+                                         headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise OSError(f"{method} {path}: HTTP {e.code}") from e
+    
+    @staticmethod
+    def check_key(key: str):
+        if not HEX64.match(key):
+            raise ValueError(f"invalid cache key: {key!r}")
+    
+    def get(self, key: str) -> Optional[bytes]:
+        self.check_key(key)
+        ref = self.request("GET", f"/ac/{key}")
+        if ref is None:
+            return None
+        try:
+            digest = json.loads(ref)["digest"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise OSError(f"bad index record for {key[:12]}") from e
+        # The digest comes from the server and goes into the next URL
+        if not isinstance(digest, str) or not HEX64.match(digest):
+            raise OSError(f"bad index record for {key[:12]}: invalid digest")
+        data = self.request("GET", f"/cas/{digest}")
+        if data is not None and hashlib.sha256(data).hexdigest() != digest:
+            raise OSError(f"blob {digest[:12]} does not match its digest")
+        return data
+    
+    def put(self, key: str, data: bytes):
+        self.check_key(key)
+        digest = hashlib.sha256(data).hexdigest()
+        if self.request("HEAD", f"/cas/{digest}") is None:
+            self.request("PUT", f"/cas/{digest}", data, {"Content-Type": "application/octet-stream"})
+        self.request("PUT", f"/ac/{key}", json.dumps({"digest": digest}).encode(),
+                     {"Content-Type": "application/json"})
+    
+    def exists(self, key: str) -> bool:
+        self.check_key(key)
+        return self.request("HEAD", f"/ac/{key}") is not None
+
+
+class RemoteCache:
+    """Read-through, write-back remote tier behind the local ``ArtifactCache``.
+    
+    A lookup that misses locally fetches the entry from the backend and
+    unpacks it into the local cache, which then serves it. Saved entries are
+    uploaded by a background thread, so a run never waits on the network;
+    pending uploads are flushed at exit for up to ``flush_timeout`` seconds.
+    After a backend error the tier is skipped for ``retry_after`` seconds.
+    """
+    
+    def __init__(self, backend: CacheBackend, retry_after: float = 60, flush_timeout: float = 60):
+        self.backend = backend
+        self.retry_after = retry_after
+        self.flush_timeout = flush_timeout
+        self.down_until = 0.0
+        self.uploads: "queue.Queue[Tuple[ArtifactCache, str, str]]" = queue.Queue()
+        self.pending = 0
+        self.idle = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+    
+    @property
+    def available(self) -> bool:
+        return time.time() >= self.down_until
+    
+    def failed(self, action: str, error: Exception):
+        METRICS.inc("orchestrator_remote_cache_errors_total")
+        if self.available:
+            log("WARN", f"Remote cache {action} failed, skipping it for "
+                        f"{self.retry_after:.0f}s: {error}")
+        self.down_until = time.time() + self.retry_after
+    
+    def fetch(self, cache: ArtifactCache, agent_name: str, key: str) -> bool:
+        """Make sure the local cache has the entry, fetching it if needed."""
+        if cache.peek(agent_name, key) is not None:
+            return True
+        if not self.available:
+            return False
+        try:
+            data = self.backend.get(key)
+        except OSError as e:
+            self.failed("read", e)
+            return False
+        if data is None or not cache.import_entry(agent_name, key, data):
+            METRICS.inc("orchestrator_remote_cache_misses_total")
+            return False
+        METRICS.inc("orchestrator_remote_cache_hits_total")
+        log("INFO", f"Fetched {agent_name} from the remote cache ({len(data) / 1024:.0f} KB)")
+        return True
+    
+    def exists(self, key: str) -> bool:
+        try:
+            return self.available and self.backend.exists(key)
+        except OSError as e:
+            self.failed("read", e)
+            return False
+    
+    def upload(self, cache: ArtifactCache, agent_name: str, key: str):
+        """Queue a local entry for upload."""
+        with self.idle:
+            self.pending += 1
+        self.uploads.put((cache, agent_name, key))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="remote-cache", daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+    
+    def flush(self, timeout: Optional[float] = None):
+        """Wait for queued uploads to finish."""
+        deadline = time.time() + (self.flush_timeout if timeout is None else timeout)
+        with self.idle:
+            while self.pending and time.time() < deadline:
+                self.idle.wait(deadline - time.time())
+            if self.pending:
+                log("WARN", f"{self.pending} remote cache uploads still pending at exit")
+    
+    def _run(self):
+        while True:
+            cache, agent_name, key = self.uploads.get()
+            try:
+                data = cache.export_entry(agent_name, key) if self.available else None
+                if data is not None:
+                    self.backend.put(key, data)
+                    METRICS.inc("orchestrator_remote_cache_uploads_total")
+            except OSError as e:
+                self.failed("write", e)
+            except ValueError as e:
+                log("WARN", f"Not uploading {agent_name} entry {key[:12]}: {e}")
+            finally:
+                with self.idle:
+                    self.pending -= 1
+                    self.idle.notify_all()
+
+
+_remote_cache: Optional[RemoteCache] = None
+
+
+def get_remote_cache(config: Dict) -> Optional[RemoteCache]:
+    """The process-wide remote tier when ``remote_cache.enabled`` is set, else None."""
+    global _remote_cache
+    remote = config.get("remote_cache", {})
+    if not remote.get("enabled", False):
+        return None
+    if _remote_cache is None:
+        max_bytes = int(remote.get("max_size_mb", 4096) * 1024 * 1024)
+        if remote.get("backend", "http") == "directory":
+            backend: CacheBackend = DirectoryCacheBackend(Path(remote["path"]), max_bytes)
+        else:
+            backend = HttpCacheBackend(
+                remote.get("url", "http://127.0.0.1:8765"),
+                token=remote.get("token") or os.environ.get("ORCHESTRATOR_CACHE_TOKEN"),
+                timeout=remote.get("timeout_seconds", 10),
+            )
+        _remote_cache = RemoteCache(
+            backend,
+            retry_after=remote.get("retry_after_seconds", 60),
+            flush_timeout=remote.get("flush_timeout_seconds", 60),
+        )
+    return _remote_cache
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """``GET``/``HEAD``/``PUT`` on ``/cas/<digest>`` and ``/ac/<cache key>`` of the
+    server's ``CasStore``."""
+    
+    def route(self) -> Optional[Tuple[str, str]]:
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+            self.send_error(401)
+            return None
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) != 2 or parts[0] not in ("cas", "ac") or not HEX64.match(parts[1]):
+            self.send_error(404)
+            return None
+        return parts[0], parts[1]
+    
+    def lookup(self, kind: str, name: str) -> Optional[bytes]:
+        store = self.server.store
+        if kind == "cas":
+            return store.get_blob(name)
+        digest = store.get_ref(name)
+        return json.dumps({"digest": digest}).encode() if digest and store.has_blob(digest) else None
+    
+    def reply(self, body: Optional[bytes], head: bool = False):
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+    
+    def do_GET(self):
+        route = self.route()
+        if route:
+            self.reply(self.lookup(*route))
+    
+    def do_HEAD(self):
+        route = self.route()
+        if route:
+            self.reply(self.lookup(*route), head=True)
+    
+    def do_PUT(self):
+        route = self.route()
+        if route is None:
+            return
+        kind, name = route
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.store.max_bytes:
+            self.send_error(413)
+            return
+        data = self.rfile.read(length)
+        
+        store = self.server.store
+        if kind == "cas":
+            try:
+                store.put_blob(name, data)
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+        else:
+            try:
+                digest = json.loads(data)["digest"]
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400, "expected {\"digest\": ...}")
+                return
+            if not isinstance(digest, str) or not store.has_blob(digest):
+                self.send_error(409, "unknown digest")
+                return
+            store.put_ref(name, digest)
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    
+    def log_message(self, format, *args):
+        pass  # one line per lookup would flood the console
+
+
+def run_cache_server(config: Dict, address: Optional[str] = None):
+    """Serve a ``CasStore`` over HTTP until interrupted."""
+    server_config = config.get("remote_cache", {}).get("server", {})
+    host, port = server_config.get("host", "127.0.0.1"), server_config.get("port", 8765)
+    if address:
+        host, _, port = address.rpartition(":")
+        host = host or "127.0.0.1"
+    storage = SCRIPT_DIR / server_config["storage"] if server_config.get("storage") else REMOTE_CACHE_DIR
+    
+    httpd = ThreadingHTTPServer((host, int(port)), CacheRequestHandler)
+    httpd.daemon_threads = True
+    httpd.store = CasStore(storage, int(server_config.get("max_size_mb", 4096) * 1024 * 1024))
+    httpd.token = server_config.get("token") or os.environ.get("ORCHESTRATOR_CACHE_TOKEN")
+    log("INFO", f"Cache server at http://{host}:{httpd.server_address[1]} storing in {storage}"
+                + (" (token required)" if httpd.token else ""))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
@@ -0,0 +1,359 @@
+"""Streaming handoff and the DAG scheduler."""
+
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional, Callable, Awaitable, Tuple
+
+from .core import AGENTS, CONTEXT_SOURCES, AgentResult, downstream_depth, file_digest
+from .telemetry import METRICS, log
+from .cancellation import SHUTDOWN
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STREAMING HANDOFF
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class HandoffWatcher:
+    """Lets an agent start before its dependencies exit, once the state files
+    it declared are complete.
+    
+    A declared artifact is complete when it was written after ``since``, has
+    not changed for ``settle_seconds``, and parses with the top-level keys
+    its schema requires. Files are polled; the scheduler re-checks their
+    digests when the dependencies finish and restarts the agent if an
+    artifact was rewritten in the meantime.
+    """
+    
+    def __init__(
+        self,
+        state_dir: Path,
+        artifacts: Dict[str, List[str]],
+        schemas: Optional[Dict[str, List[str]]] = None,
+        settle_seconds: float = 2.0,
+        poll_interval: float = 0.5,
+    ):
+        self.state_dir = state_dir
+        self.artifacts = {agent: list(files) for agent, files in artifacts.items() if files}
+        self.schemas = schemas or {}
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.since = time.time()
+        self.started_early: set = set()
+        self._seen: Dict[str, Tuple[Tuple[int, int], float, bool]] = {}
+    
+    @classmethod
+    def from_config(cls, config: Dict, state_dir: Path) -> Optional["HandoffWatcher"]:
+        streaming = config.get("streaming", {})
+        if not streaming.get("enabled", False):
+            return None
+        return cls(
+            state_dir,
+            streaming.get("agents") or {},
+            streaming.get("schemas") or {},
+            settle_seconds=streaming.get("settle_seconds", 2),
+            poll_interval=streaming.get("poll_interval_seconds", 0.5),
+        )
+    
+    def reset(self):
+        """Only accept artifacts written from now on."""
+        self.since = time.time()
+        self.started_early.clear()
+        self._seen.clear()
+    
+    def declares(self, agent_name: str) -> bool:
+        return agent_name in self.artifacts
+    
+    def _valid(self, path: Path) -> bool:
+        try:
+            text = path.read_text()
+        except (OSError, UnicodeDecodeError):
+            return False
+        if path.suffix != ".json":
+            return bool(text.strip())
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return False
+        required = self.schemas.get(path.name, [])
+        return isinstance(data, dict) and all(key in data for key in required)
+    
+    def complete(self, agent_name: str) -> bool:
+        """Whether every artifact ``agent_name`` declared is written and valid."""
+        now = time.time()
+        for name in self.artifacts.get(agent_name, []):
+            path = self.state_dir / name
+            try:
+                st = path.stat()
+            except OSError:
+                return False
+            if st.st_mtime < self.since:
+                return False  # left over from an earlier run
+            signature = (st.st_size, st.st_mtime_ns)
+            seen = self._seen.get(name)
+            if seen is None or seen[0] != signature:
+                self._seen[name] = (signature, now, False)
+                return False
+            if now - seen[1] < self.settle_seconds:
+                return False
+            if not seen[2]:
+                if not self._valid(path):
+                    return False
+                self._seen[name] = (signature, seen[1], True)
+        return True
+    
+    def digests(self, agent_name: str) -> Dict[str, str]:
+        """Digests of the declared artifacts and of every other file in the agent's context."""
+        names = list(self.artifacts.get(agent_name, []))
+        names += [f for f, _ in CONTEXT_SOURCES.get(agent_name, []) if f not in names]
+        digests = {}
+        for name in names:
+            try:
+                digests[name] = file_digest(self.state_dir / name)
+            except OSError:
+                digests[name] = "missing"
+        return digests
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SCHEDULING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class DagScheduler:
+    """Starts each agent as soon as its own dependencies have completed, or
+    earlier when a ``HandoffWatcher`` finds the artifacts it needs complete.
+    
+    After a failure no new agent starts; with ``fail_fast`` the running ones
+    are cancelled too instead of being left to finish. A SIGINT or SIGTERM
+    cancels them and sets ``interrupted``."""
+    
+    def __init__(
+        self,
+        run_agent: Callable[[str], Awaitable[AgentResult]],
+        max_concurrent: int = 4,
+        agents: Optional[Dict[str, Dict]] = None,
+        on_start: Optional[Callable[[str], None]] = None,
+        handoff: Optional[HandoffWatcher] = None,
+        fail_fast: bool = True,
+    ):
+        self.run_agent = run_agent
+        self.max_concurrent = max(1, max_concurrent)
+        self.agents = agents or AGENTS
+        self.on_start = on_start
+        self.handoff = handoff
+        self.fail_fast = fail_fast
+        self.interrupted = False
+        self.results: Dict[str, AgentResult] = {}
+        self.started_at: Dict[str, float] = {}
+        self.finished_at: Dict[str, float] = {}
+        self.streamed: set = set()  # started early, and their inputs held until the deps exited
+    
+    def ready(self, pending: List[str], done: set) -> List[str]:
+        """Pending agents whose dependencies are all done, longest chain first."""
+        depth = downstream_depth(self.agents)
+        ready = [a for a in pending if all(d in done for d in self.agents[a]["deps"])]
+        return sorted(ready, key=lambda a: -depth[a])
+    
+    def early_candidates(self, pending: List[str], done: set, running: set) -> List[str]:
+        """Pending agents that declared handoff artifacts and wait only on running agents."""
+        if self.handoff is None:
+            return []
+        depth = downstream_depth(self.agents)
+        candidates = [
+            a for a in pending
+            if self.handoff.declares(a)
+            and all(d in done or d in running for d in self.agents[a]["deps"])
+        ]
+        return sorted(candidates, key=lambda a: -depth[a])
+    
+    def run(self) -> List[AgentResult]:
+        """Run the whole graph, blocking until it finishes."""
+        return asyncio.run(self.run_async())
+    
+    async def run_async(self) -> List[AgentResult]:
+        """Run the whole graph. Stops launching new agents after a failure."""
+        if SHUTDOWN.requested:
+            self.interrupted = True
+            return []
+        task = asyncio.current_task()
+        SHUTDOWN.watch(task)
+        try:
+            return await self.schedule()
+        finally:
+            SHUTDOWN.unwatch(task)
+    
+    async def schedule(self) -> List[AgentResult]:
+        pending = list(self.agents)
+        done: set = set()
+        failed = False
+        running: Dict[asyncio.Task, str] = {}
+        early: Dict[str, Dict[str, str]] = {}  # agent started early -> digests of its artifacts
+        held: Dict[str, AgentResult] = {}  # early agents that finished before their deps
+        if self.handoff is not None:
+            self.handoff.reset()
+        
+        def start(agent: str):
+            pending.remove(agent)
+            if self.on_start:
+                self.on_start(agent)
+            self.started_at[agent] = time.time()
+            running[asyncio.ensure_future(self.run_agent(agent))] = agent
+        
+        async def stop(agent: str):
+            for task, name in list(running.items()):
+                if name == agent:
+                    del running[task]
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+        
+        async def abort(cause: str):
+            """Cancel every running agent, and fail those and the early starts
+            held for their dependencies."""
+            reason = f"Cancelled, {cause}"
+            if running or held:
+                log("WARN", f"Cancelling {', '.join(sorted(set(running.values()) | set(held)))}: {cause}")
+            tasks = dict(running)
+            running.clear()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for task, agent in tasks.items():
+                self.finished_at[agent] = time.time()
+                if not task.cancelled() and task.exception() is None and agent not in early:
+                    self.results[agent] = task.result()
+                    if self.results[agent].success:
+                        done.add(agent)
+                    continue
+                self.results[agent] = AgentResult(
+                    agent_name=agent,
+                    success=False,
+                    duration_seconds=self.finished_at[agent] - self.started_at[agent],
+                    output_files=[],
+                    error_message=reason
+                )
+            for agent in held:
+                self.results[agent] = AgentResult(
+                    agent_name=agent,
+                    success=False,
+                    duration_seconds=self.finished_at[agent] - self.started_at[agent],
+                    output_files=[],
+                    error_message=reason
+                )
+            early.clear()
+            held.clear()
+        
+        while pending or running:
+            if not failed:
+                for agent in self.ready(pending, done):
+                    if len(running) >= self.max_concurrent:
+                        break
+                    start(agent)
+                for agent in self.early_candidates(pending, done, set(running.values())):
+                    if len(running) >= self.max_concurrent:
+                        break
+                    if self.handoff.complete(agent):
+                        log("INFO", f"Starting {agent} early: "
+                                    f"{', '.join(self.handoff.artifacts[agent])} ready")
+                        early[agent] = self.handoff.digests(agent)
+                        self.handoff.started_early.add(agent)
+                        start(agent)
+            
+            METRICS.set("orchestrator_agents_pending", len(pending))
+            METRICS.set("orchestrator_agents_queued", 0 if failed else len(self.ready(pending, done)))
+            if not running:
+                break
+            
+            watching = not failed and self.early_candidates(pending, done, set(running.values()))
+            try:
+                finished, _ = await asyncio.wait(
+                    running,
+                    timeout=self.handoff.poll_interval if watching else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            except asyncio.CancelledError:
+                await abort(f"interrupted by {SHUTDOWN.name}" if SHUTDOWN.requested else "interrupted")
+                if not SHUTDOWN.requested:
+                    raise
+                self.interrupted = True
+                break
+            for task in finished:
+                agent = running.pop(task)
+                self.finished_at[agent] = time.time()
+                try:
+                    result = task.result()
+                except Exception as e:
+                    result = AgentResult(
+                        agent_name=agent,
+                        success=False,
+                        duration_seconds=self.finished_at[agent] - self.started_at[agent],
+                        output_files=[],
+                        error_message=str(e)
+                    )
+                if agent in early and result.success:
+                    held[agent] = result  # released once its dependencies finish
+                    continue
+                early.pop(agent, None)
+                self.results[agent] = result
+                if result.success:
+                    done.add(agent)
+                else:
+                    failed = True
+            
+            # Confirm early starts once their dependencies finish, or restart
+            # them if an artifact they started from was rewritten since
+            for agent in list(early):
+                deps = self.agents[agent]["deps"]
+                broken = [d for d in deps if d in self.results and not self.results[d].success]
+                if broken:
+                    early.pop(agent)
+                    held.pop(agent, None)
+                    await stop(agent)
+                    self.finished_at[agent] = time.time()
+                    self.results[agent] = AgentResult(
+                        agent_name=agent,
+                        success=False,
+                        duration_seconds=self.finished_at[agent] - self.started_at[agent],
+                        output_files=[],
+                        error_message=f"Cancelled, {', '.join(broken)} failed"
+                    )
+                    continue
+                if not all(d in done for d in deps):
+                    continue
+                
+                if self.handoff.digests(agent) == early.pop(agent):
+                    self.streamed.add(agent)
+                    if agent in held:
+                        self.results[agent] = held.pop(agent)
+                        done.add(agent)
+                    continue
+                log("WARN", f"Artifacts of {agent} changed after it started early, restarting it")
+                held.pop(agent, None)
+                await stop(agent)
+                pending.append(agent)
+            
+            if failed and self.fail_fast and (running or held):
+                failures = [a for a, r in self.results.items() if not r.success]
+                await abort(f"{', '.join(failures)} failed")
+        
+        METRICS.set("orchestrator_agents_pending", 0)
+        METRICS.set("orchestrator_agents_queued", 0)
+        return list(self.results.values())
+    
+    def critical_path(self) -> Tuple[List[str], float]:
+        """Longest duration-weighted dependency chain among completed agents."""
+        best: Dict[str, Tuple[float, List[str]]] = {}
+        
+        def visit(name: str) -> Tuple[float, List[str]]:
+            if name not in best:
+                upstream = [visit(d) for d in self.agents[name]["deps"] if d in self.results]
+                length, path = max(upstream, default=(0.0, []), key=lambda p: p[0])
+                start = self.started_at[name]
+                if path:  # an agent started early only adds the time it ran past its dependency
+                    start = max(start, self.finished_at[path[-1]])
+                best[name] = (length + max(0.0, self.finished_at[name] - start), path + [name])
+            return best[name]
+        
+        if not self.results:
+            return [], 0.0
+        length, path = max((visit(a) for a in self.results), key=lambda p: p[0])
+        return path, length
@@ -0,0 +1,559 @@
+"""Workflow state, its journal, checkpoints and input fingerprints."""
+
+import os
+import json
+import atexit
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any, Callable, Tuple
+import shutil
+
+from .core import (
+    AGENTS,
+    PROMPTS_DIR,
+    Workspace,
+    ancestors,
+    atomic_write_text,
+    clone_file,
+    file_digest,
+    topological_order,
+)
+from .telemetry import METRICS, log, trace_span
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DATA CLASSES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class WorkflowState:
+    workflow_id: str
+    started_at: str
+    current_phase: str
+    current_agent: Optional[str]
+    completed_agents: List[str]
+    failed_agents: List[str]
+    status: str
+    user_request: str
+    
+    @classmethod
+    def new(cls, user_request: str = "") -> "WorkflowState":
+        return cls(
+            workflow_id=f"wf-{int(time.time())}-{uuid.uuid4().hex[:8]}",
+            started_at=datetime.utcnow().isoformat() + "Z",
+            current_phase="init",
+            current_agent=None,
+            completed_agents=[],
+            failed_agents=[],
+            status="running",
+            user_request=user_request
+        )
+    
+    @classmethod
+    def load(cls, path: Path) -> "WorkflowState":
+        with open(path) as f:
+            data = json.load(f)
+        data.pop("journal_seq", None)  # StateStore bookkeeping
+        return cls(**data)
+    
+    def save(self, path: Path):
+        atomic_write_text(path, json.dumps(asdict(self), indent=2))
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STATE PERSISTENCE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class StateStore:
+    """Thread-safe owner of the on-disk WorkflowState.
+    
+    Mutations are applied in memory under a lock and queued as journal
+    entries. A background flusher waits ``commit_interval`` after the first
+    entry of a burst, then appends the whole burst to
+    ``workflow_state.journal`` with a single fsync. Every ``compact_every``
+    entries, and on ``flush()``, the state is compacted into a snapshot
+    written with ``atomic_write_text`` and the journal is discarded.
+    Recovery loads the snapshot and replays the journal on top of it.
+    
+    Journal entries carry increasing sequence numbers and the snapshot
+    records the last one it covers, so a journal left behind by a crash
+    between the snapshot rename and its unlink is not replayed over the
+    newer snapshot.
+    """
+    
+    def __init__(
+        self,
+        state: WorkflowState,
+        path: Path,
+        commit_interval: float = 0.05,
+        compact_every: int = 50,
+    ):
+        self.state = state
+        self.path = path
+        self.journal_path = path.with_suffix(".journal")
+        self.commit_interval = commit_interval
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.pending = threading.Condition(self.lock)
+        self.entries: List[str] = []
+        self.journal_entries = 0
+        self.seq = StateStore.read(path)[1]  # continue numbering past what is on disk
+        # A new or recovered store must not append onto someone else's journal
+        self.needs_snapshot = True
+        self.closed = False
+        self.thread: Optional[threading.Thread] = None
+    
+    @classmethod
+    def from_config(cls, state: WorkflowState, path: Path, config: Dict) -> "StateStore":
+        state_config = config.get("state", {})
+        return cls(
+            state,
+            path,
+            commit_interval=state_config.get("commit_interval_ms", 50) / 1000,
+            compact_every=state_config.get("compact_every", 50),
+        )
+    
+    @staticmethod
+    def recover(path: Path) -> Optional[WorkflowState]:
+        """Rebuild the latest state from the snapshot plus its journal."""
+        return StateStore.read(path)[0]
+    
+    @staticmethod
+    def read(path: Path) -> Tuple[Optional[WorkflowState], int]:
+        """The recovered state, and the last sequence number found in the
+        snapshot or its journal."""
+        if not path.exists():
+            return None, 0
+        with open(path) as f:
+            data = json.load(f)
+        seq = covered = data.pop("journal_seq", 0)
+        state = WorkflowState(**data)
+        
+        journal_path = path.with_suffix(".journal")
+        if journal_path.exists():
+            for line in journal_path.read_text().splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn final write
+                if entry.get("seq", covered + 1) <= covered:
+                    continue  # already in the snapshot
+                seq = max(seq, entry.get("seq", 0))
+                StateStore.apply(state, entry)
+        return state, seq
+    
+    @staticmethod
+    def apply(state: WorkflowState, entry: Dict):
+        if entry["op"] == "set":
+            setattr(state, entry["field"], entry["value"])
+        elif entry["op"] == "append":
+            # Idempotent: journals written before sequence numbers may overlap the snapshot
+            values = getattr(state, entry["field"])
+            if entry["value"] not in values:
+                values.append(entry["value"])
+    
+    def update(self, **fields):
+        """Set state fields and journal the change."""
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self.state, name, value)
+                self._journal({"op": "set", "field": name, "value": value})
+    
+    def append(self, field_name: str, value: Any):
+        """Append to a list field and journal the change."""
+        with self.lock:
+            getattr(self.state, field_name).append(value)
+            self._journal({"op": "append", "field": field_name, "value": value})
+    
+    def flush(self):
+        """Write a compacted snapshot now, covering every mutation so far."""
+        self._commit(snapshot=True)
+    
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.pending.notify()
+        if self.thread:
+            self.thread.join()
+        if self.entries or self.journal_entries:
+            self.flush()
+    
+    def _journal(self, entry: Dict):
+        # Caller holds self.lock
+        self.seq += 1
+        self.entries.append(json.dumps({**entry, "seq": self.seq}))
+        if self.thread is None and not self.closed:
+            self.thread = threading.Thread(target=self._run, name="state-flusher", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+        self.pending.notify()
+    
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.entries and not self.closed:
+                    self.pending.wait()
+                if self.closed:
+                    return
+            time.sleep(self.commit_interval)  # let the rest of the burst arrive
+            self._commit()
+    
+    def _commit(self, snapshot: bool = False):
+        with self.io_lock:
+            with self.lock:
+                entries, self.entries = self.entries, []
+                snapshot = (
+                    snapshot
+                    or self.needs_snapshot
+                    or self.journal_entries + len(entries) >= self.compact_every
+                )
+                data = {**asdict(self.state), "journal_seq": self.seq} if snapshot else None
+                if snapshot:
+                    self.needs_snapshot = False
+            
+            if snapshot:
+                atomic_write_text(self.path, json.dumps(data, indent=2))
+                self.journal_path.unlink(missing_ok=True)
+                self.journal_entries = 0
+            elif entries:
+                with open(self.journal_path, "a") as f:
+                    f.write("\n".join(entries) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.journal_entries += len(entries)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CHECKPOINT MANAGEMENT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class CheckpointManager:
+    """Manages workflow checkpoints for recovery.
+    
+    A checkpoint is a manifest mapping project paths to SHA-256 digests. File
+    contents live once in a shared content-addressed blob store under
+    ``<checkpoints_dir>/blobs``, so files left unchanged between agents cost
+    nothing to checkpoint again.
+    """
+    
+    def __init__(self, workspace: Optional[Workspace] = None):
+        self.workspace = workspace or Workspace.default()
+        self._lock = threading.Lock()
+        self._hash_index: Optional[Dict[str, List]] = None  # rel path -> [mtime_ns, size, digest]
+    
+    def blob_path(self, digest: str) -> Path:
+        return self.workspace.checkpoints_dir / "blobs" / digest[:2] / digest
+    
+    def resolve(self, rel: str) -> Path:
+        """Map a manifest path back to its location in the project."""
+        if rel.startswith("state/"):
+            return self.workspace.state_dir / rel[len("state/"):]
+        return self.workspace.root / rel
+    
+    def tracked_files(self) -> Dict[str, Path]:
+        """State JSON files and generated sources, keyed by manifest path."""
+        files = {}
+        if self.workspace.state_dir.exists():
+            for f in self.workspace.state_dir.glob("*.json"):
+                files[f"state/{f.name}"] = f
+        src_dir = self.workspace.src_dir
+        if src_dir.exists():
+            for f in src_dir.rglob("*"):
+                if f.is_file():
+                    files[str(f.relative_to(self.workspace.root))] = f
+        return files
+    
+    def _index(self) -> Dict[str, List]:
+        if self._hash_index is None:
+            index_file = self.workspace.checkpoints_dir / "hash_index.json"
+            try:
+                self._hash_index = json.loads(index_file.read_text())
+            except (OSError, ValueError):
+                self._hash_index = {}
+        return self._hash_index
+    
+    def _save_index(self):
+        self.workspace.checkpoints_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.workspace.checkpoints_dir / "hash_index.json.tmp"
+        tmp.write_text(json.dumps(self._index()))
+        os.replace(tmp, self.workspace.checkpoints_dir / "hash_index.json")
+    
+    def digest(self, rel: str, path: Path) -> str:
+        """Digest of a project file, skipping the read if its stat is unchanged."""
+        st = path.stat()
+        index = self._index()
+        cached = index.get(rel)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        digest = file_digest(path)
+        index[rel] = [st.st_mtime_ns, st.st_size, digest]
+        return digest
+    
+    def store(self, rel: str, path: Path) -> Tuple[str, Optional[int]]:
+        """Put a project file in the blob store. Returns its digest and the size
+        of the new blob, or None if the blob already existed.
+        
+        The file is copied first and the copy hashed, so a blob always matches
+        its name even if an agent rewrites the file meanwhile. The indexed
+        digest is reused only when its blob exists, and indexed again only
+        when the file's stat did not change during the copy.
+        """
+        st = path.stat()
+        index = self._index()
+        cached = index.get(rel)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size \
+                and self.blob_path(cached[2]).exists():
+            return cached[2], None
+        
+        blobs_dir = self.workspace.checkpoints_dir / "blobs"
+        blobs_dir.mkdir(parents=True, exist_ok=True)
+        tmp = blobs_dir / f".{uuid.uuid4().hex}.tmp"
+        try:
+            clone_file(path, tmp)
+            digest = file_digest(tmp)
+            after = path.stat()
+            if (after.st_mtime_ns, after.st_size) == (st.st_mtime_ns, st.st_size):
+                index[rel] = [st.st_mtime_ns, st.st_size, digest]
+            else:
+                index.pop(rel, None)
+            blob = self.blob_path(digest)
+            if blob.exists():
+                return digest, None
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, blob)
+            return digest, blob.stat().st_size
+        finally:
+            tmp.unlink(missing_ok=True)
+    
+    def create(self, agent_name: str, state: WorkflowState, keep_last_n: Optional[int] = None) -> str:
+        """Create a checkpoint after an agent completes."""
+        checkpoint_id = f"chk-{agent_name}-{int(time.time())}"
+        checkpoint_dir = self.workspace.checkpoints_dir / checkpoint_id
+        
+        started = time.perf_counter()
+        with trace_span("checkpoint", category="checkpoint") as span, self._lock:
+            checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            
+            manifest = {}
+            new_blobs = 0
+            new_bytes = 0
+            for rel, path in self.tracked_files().items():
+                try:
+                    digest, written = self.store(rel, path)
+                except OSError:
+                    continue
+                manifest[rel] = digest
+                if written is not None:
+                    new_blobs += 1
+                    new_bytes += written
+            
+            self._save_index()
+            
+            # Save metadata
+            metadata = {
+                "checkpoint_id": checkpoint_id,
+                "agent": agent_name,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "workflow_id": state.workflow_id,
+                "files": manifest,
+            }
+            (checkpoint_dir / "checkpoint.json").write_text(json.dumps(metadata, indent=2))
+            
+            if keep_last_n:
+                self.gc(keep_last_n)
+            
+            if span:
+                span.args.update(files=len(manifest), new_blobs=new_blobs, new_bytes=new_bytes)
+        
+        METRICS.observe("orchestrator_checkpoint_duration_seconds", time.perf_counter() - started)
+        METRICS.inc("orchestrator_checkpoint_bytes_total", new_bytes)
+        
+        log("INFO", f"Checkpoint created: {checkpoint_id} "
+                    f"({len(manifest)} files, {new_blobs} new blobs, {new_bytes / 1024:.1f} KB)")
+        return checkpoint_id
+    
+    def restore(self, checkpoint_id: str) -> bool:
+        """Restore from a checkpoint, rewriting only files whose content differs."""
+        checkpoint_dir = self.workspace.checkpoints_dir / checkpoint_id
+        metadata_file = checkpoint_dir / "checkpoint.json"
+        
+        if not metadata_file.exists():
+            log("ERROR", f"Checkpoint not found: {checkpoint_id}")
+            return False
+        
+        log("INFO", f"Restoring checkpoint: {checkpoint_id}")
+        metadata = json.loads(metadata_file.read_text())
+        
+        # The restored snapshot supersedes any journal written after it
+        (self.workspace.state_dir / "workflow_state.journal").unlink(missing_ok=True)
+        
+        if "files" not in metadata:
+            return self._restore_full_copy(checkpoint_dir)
+        
+        changed = 0
+        with self._lock:
+            for rel, digest in metadata["files"].items():
+                target = self.resolve(rel)
+                if target.exists() and self.digest(rel, target) == digest:
+                    continue
+                
+                blob = self.blob_path(digest)
+                if not blob.exists():
+                    log("ERROR", f"Missing blob {digest} for {rel}")
+                    return False
+                
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_name(f".{target.name}.restore")
+                clone_file(blob, tmp)
+                os.replace(tmp, target)
+                st = target.stat()
+                self._index()[rel] = [st.st_mtime_ns, st.st_size, digest]
+                changed += 1
+            
+            self._save_index()
+        
+        log("INFO", f"Checkpoint restored: {checkpoint_id} ({changed} files updated)")
+        return True
+    
+    def _restore_full_copy(self, checkpoint_dir: Path) -> bool:
+        """Restore a checkpoint written before the blob store existed."""
+        # Restore state files
+        self.workspace.state_dir.mkdir(parents=True, exist_ok=True)
+        for f in checkpoint_dir.glob("*.json"):
+            if f.name != "checkpoint.json":
+                shutil.copy(f, self.workspace.state_dir)
+        
+        # Restore source files
+        src_backup = checkpoint_dir / "src"
+        if src_backup.exists():
+            shutil.copytree(src_backup, self.workspace.src_dir, dirs_exist_ok=True)
+        
+        log("INFO", f"Checkpoint restored: {checkpoint_dir.name}")
+        return True
+    
+    def gc(self, keep_last_n: int) -> int:
+        """Keep the newest checkpoints and drop blobs no manifest references."""
+        checkpoints = sorted(self.list_all(), key=lambda c: c["created_at"])
+        for cp in checkpoints[:-keep_last_n]:
+            shutil.rmtree(self.workspace.checkpoints_dir / cp["checkpoint_id"], ignore_errors=True)
+        
+        referenced = set()
+        for cp in checkpoints[-keep_last_n:]:
+            referenced.update(cp.get("files", {}).values())
+        
+        removed = 0
+        blobs_dir = self.workspace.checkpoints_dir / "blobs"
+        if blobs_dir.exists():
+            for blob in blobs_dir.glob("*/*"):
+                if blob.name not in referenced and not blob.name.endswith(".tmp"):
+                    blob.unlink()
+                    removed += 1
+        return removed
+    
+    def list_all(self) -> List[Dict]:
+        """List all available checkpoints."""
+        checkpoints = []
+        
+        if not self.workspace.checkpoints_dir.exists():
+            return checkpoints
+        
+        for d in sorted(self.workspace.checkpoints_dir.iterdir()):
+            if d.is_dir() and d.name.startswith("chk-"):
+                metadata_file = d / "checkpoint.json"
+                if metadata_file.exists():
+                    with open(metadata_file) as f:
+                        checkpoints.append(json.load(f))
+        
+        return checkpoints
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# INCREMENTAL REBUILD
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class FingerprintStore:
+    """What each agent last ran on, for make-style rebuilds.
+    
+    Every successful run records digests of the agent's inputs (its prompt
+    template, its rendered context and the files its upstream agents produced)
+    along with the files it produced itself. An agent is dirty when one of
+    those digests has changed or when an agent it depends on is dirty.
+    """
+    
+    def __init__(self, path: Path, root: Path):
+        self.path = path
+        self.root = root
+        self._records: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+    
+    def records(self) -> Dict[str, Dict]:
+        if self._records is None:
+            try:
+                self._records = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                self._records = {}
+        return self._records
+    
+    @staticmethod
+    def _digest(path: Path) -> str:
+        try:
+            return file_digest(path)
+        except OSError:
+            return "missing"
+    
+    def inputs(self, agent_name: str, context: str) -> Dict[str, str]:
+        """Current digests of everything ``agent_name`` reads."""
+        digests = {
+            "prompt": self._digest(PROMPTS_DIR / f"{agent_name}.md"),
+            "context": hashlib.sha256(context.encode()).hexdigest(),
+        }
+        records = self.records()
+        for upstream in sorted(ancestors(agent_name)):
+            for rel in records.get(upstream, {}).get("outputs", []):
+                digests[rel] = self._digest(self.root / rel)
+        return digests
+    
+    def reload(self):
+        """Forget the records read so far, so the next access reads the file again."""
+        with self._lock:
+            self._records = None
+    
+    def record(self, agent_name: str, inputs: Dict[str, str], outputs: List[str]):
+        with self._lock:
+            self.records()[agent_name] = {
+                "recorded_at": datetime.utcnow().isoformat() + "Z",
+                "inputs": inputs,
+                "outputs": sorted(outputs),
+            }
+            atomic_write_text(self.path, json.dumps(self._records, indent=2))
+    
+    def dirty(
+        self,
+        current_inputs: Callable[[str], Dict[str, str]],
+        completed: List[str],
+        agents: Dict[str, Dict] = AGENTS,
+    ) -> Dict[str, str]:
+        """Agents to rerun, in dependency order, mapped to the reason why."""
+        records = self.records()
+        dirty: Dict[str, str] = {}
+        
+        for agent in topological_order(agents):
+            upstream = [dep for dep in agents[agent]["deps"] if dep in dirty]
+            record = records.get(agent)
+            if upstream:
+                dirty[agent] = f"upstream {', '.join(upstream)} rerun"
+            elif agent not in completed:
+                dirty[agent] = "not completed"
+            elif record is None:
+                dirty[agent] = "no fingerprint recorded"
+            else:
+                now, then = current_inputs(agent), record["inputs"]
+                changed = sorted(k for k in now.keys() | then.keys() if now.get(k) != then.get(k))
+                if changed:
+                    more = f" (+{len(changed) - 3} more)" if len(changed) > 3 else ""
+                    dirty[agent] = f"changed {', '.join(changed[:3])}{more}"
+        
+        return dirty
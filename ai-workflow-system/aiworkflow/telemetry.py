@@ -0,0 +1,531 @@
+"""Logging, tracing and Prometheus metrics."""
+
+import sys
+import json
+import queue
+import atexit
+import time
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+from .core import LOGS_DIR, Colors, atomic_write_text, rotate_file
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LOGGING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class LogWriter:
+    """Background thread that owns every write to the logs directories.
+    
+    ``log()`` and the agent executor only enqueue work; the writer drains the
+    queue in batches, appends records to ``orchestrator.log`` through one open
+    handle per logs directory, and rotates it once it grows past ``max_bytes``.
+    Records are routed to the logs directory registered for their
+    workflow_id. Per-agent prompt and output files keep ``backup_count``
+    gzipped previous generations.
+    
+    Nothing here blocks on a full queue. While the disk stalls, records are
+    dropped and counted. Files, and records logged after ``close()``, are
+    written on the caller's thread instead.
+    """
+    
+    def __init__(
+        self,
+        logs_dir: Path,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        fmt: str = "json",
+        queue_size: int = 10000,
+    ):
+        self.logs_dir = logs_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.fmt = fmt
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.routes: Dict[str, Path] = {}
+        self.streams: Dict[Path, Any] = {}
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.closed = False
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+    
+    def route(self, workflow_id: str, logs_dir: Path):
+        """Send records tagged with ``workflow_id`` to ``logs_dir``."""
+        self.routes[workflow_id] = logs_dir
+    
+    def emit(self, record: Dict[str, Any]):
+        logs_dir = self.routes.get(record.get("workflow_id"), self.logs_dir)
+        item = ("record", logs_dir, record)
+        if self._put(item):
+            return
+        if self.closed and not self.thread.is_alive():
+            self._write_now(item)
+        else:
+            with self.lock:
+                self.dropped += 1
+            METRICS.inc("orchestrator_log_records_dropped_total")
+    
+    def write_file(self, name: str, text: str, logs_dir: Optional[Path] = None):
+        """Replace ``logs_dir/name``, rotating the previous version."""
+        item = ("file", logs_dir or self.logs_dir, name, text)
+        if not self._put(item):
+            self._write_now(item)  # prompts are kept for manual reruns, worth a blocking write
+    
+    def flush(self, timeout: float = 30):
+        """Wait, up to ``timeout`` seconds, until everything queued so far is on disk."""
+        if self.closed:
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(("flush", done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+    
+    def close(self, timeout: float = 10):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            sys.stderr.write("log writer: queue still full at exit, buffered records lost\n")
+            return
+        self.thread.join(timeout)
+        if self.dropped:
+            sys.stderr.write(f"log writer: dropped {self.dropped} records while the queue was full\n")
+    
+    def _put(self, item) -> bool:
+        """Queue ``item`` without blocking; False once closed or while the queue is full."""
+        with self.lock:
+            if self.closed:
+                return False
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                return False
+        return True
+    
+    def _write_now(self, item):
+        """Handle ``item`` on the caller's thread."""
+        with self.sync_lock:
+            try:
+                self._handle(item)
+            except OSError as e:
+                sys.stderr.write(f"log writer: {e}\n")
+            finally:
+                if item[0] == "record":
+                    self._close_streams()  # only reached once the writer thread is gone
+    
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            for item in batch:
+                if item is None:
+                    self._close_streams()
+                    return
+                try:
+                    self._handle(item)
+                except OSError as e:
+                    sys.stderr.write(f"log writer: {e}\n")
+            
+            for logs_dir, stream in list(self.streams.items()):
+                stream.flush()
+                if stream.tell() >= self.max_bytes:
+                    stream.close()
+                    del self.streams[logs_dir]
+                    rotate_file(logs_dir / "orchestrator.log", self.backup_count)
+    
+    def _handle(self, item):
+        kind = item[0]
+        if kind == "record":
+            _, logs_dir, record = item
+            stream = self.streams.get(logs_dir)
+            if stream is None:
+                logs_dir.mkdir(parents=True, exist_ok=True)
+                stream = self.streams[logs_dir] = open(logs_dir / "orchestrator.log", "a")
+            stream.write(self._format(record) + "\n")
+        elif kind == "file":
+            _, logs_dir, name, text = item
+            path = logs_dir / name
+            logs_dir.mkdir(parents=True, exist_ok=True)
+            rotate_file(path, self.backup_count)
+            path.write_text(text)
+        elif kind == "flush":
+            for stream in self.streams.values():
+                stream.flush()
+            item[1].set()
+    
+    def _format(self, record: Dict[str, Any]) -> str:
+        if self.fmt == "json":
+            return json.dumps(record, ensure_ascii=False)
+        context = " ".join(
+            f"{k}={record[k]}" for k in ("workflow_id", "agent", "attempt") if k in record
+        )
+        prefix = f"[{record['ts']}] [{record['level']}]"
+        return f"{prefix} [{context}] {record['message']}" if context else f"{prefix} {record['message']}"
+    
+    def _close_streams(self):
+        for stream in self.streams.values():
+            stream.close()
+        self.streams.clear()
+
+
+_log_writer: Optional[LogWriter] = None
+LOG_CONTEXT: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+# Extra destination for console lines, set while the daemon serves a client
+LOG_SINK: ContextVar[Optional[Callable[[str], None]]] = ContextVar("log_sink", default=None)
+_console_lock = threading.Lock()
+
+
+def configure_logging(config: Dict):
+    """Start the background log writer, or apply the ``logging`` config section to it."""
+    global _log_writer
+    logging_config = config.get("logging", {})
+    settings = {
+        "max_bytes": int(logging_config.get("max_size_mb", 10) * 1024 * 1024),
+        "backup_count": logging_config.get("backup_count", 5),
+        "fmt": logging_config.get("format", "json"),
+    }
+    if _log_writer is None:
+        _log_writer = LogWriter(LOGS_DIR, **settings)
+    else:
+        for name, value in settings.items():
+            setattr(_log_writer, name, value)
+
+
+def get_log_writer() -> LogWriter:
+    if _log_writer is None:
+        configure_logging({})
+    return _log_writer
+
+
+def set_log_context(**fields):
+    """Attach fields such as workflow_id, agent or attempt to this task's log records."""
+    context = {**LOG_CONTEXT.get(), **fields}
+    LOG_CONTEXT.set({k: v for k, v in context.items() if v is not None})
+
+
+@atexit.register
+def _close_log_writer():
+    if _log_writer is not None:
+        _log_writer.close()
+
+
+def log(level: str, message: str):
+    """Log a message with timestamp and color."""
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    
+    colors = {
+        "INFO": Colors.GREEN,
+        "WARN": Colors.YELLOW,
+        "ERROR": Colors.RED,
+        "AGENT": Colors.PURPLE,
+    }
+    
+    color = colors.get(level, Colors.NC)
+    line = f"{Colors.BLUE}[{timestamp}]{Colors.NC} {color}[{level}]{Colors.NC} {message}\n"
+    with _console_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    sink = LOG_SINK.get()
+    if sink is not None:
+        sink(line)
+    
+    # Also log to file, off the caller's thread
+    get_log_writer().emit({
+        "ts": now.isoformat(timespec="milliseconds"),
+        "level": level,
+        "message": message,
+        **LOG_CONTEXT.get(),
+    })
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TRACING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class Span:
+    """A timed stage of a workflow. ``lane`` is the row it is drawn on in the trace viewer."""
+    tracer: "Tracer"
+    span_id: int
+    parent_id: Optional[int]
+    name: str
+    category: str
+    lane: str
+    start: float
+    end: Optional[float] = None
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """Collects the spans of a workflow and exports them in Chrome trace format,
+    loadable in chrome://tracing or https://ui.perfetto.dev."""
+    
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.started_at = datetime.now()
+        self._origin = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def start(
+        self,
+        name: str,
+        category: str = "workflow",
+        lane: str = "workflow",
+        parent: Optional[Span] = None,
+        **args,
+    ) -> Span:
+        span = Span(
+            tracer=self,
+            span_id=next(self._ids),
+            parent_id=parent.span_id if parent else None,
+            name=name,
+            category=category,
+            lane=lane,
+            start=time.perf_counter(),
+            args={k: v for k, v in args.items() if v is not None},
+        )
+        with self._lock:
+            self.spans.append(span)
+        return span
+    
+    def finish(self, span: Span, **args):
+        span.end = time.perf_counter()
+        span.args.update({k: v for k, v in args.items() if v is not None})
+    
+    def to_chrome(self, **metadata) -> Dict[str, Any]:
+        """Complete ("X") events, one thread row per lane. Unfinished spans end now."""
+        now = time.perf_counter()
+        lanes: Dict[str, int] = {}
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+        
+        for span in spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self._origin) * 1e6),
+                "dur": round(((span.end or now) - span.start) * 1e6),
+                "pid": 1,
+                "tid": tid,
+                "args": {"span_id": span.span_id, "parent_id": span.parent_id, **span.args},
+            })
+        
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "orchestrator"}})
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}})
+            events.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid,
+                           "args": {"sort_index": tid}})
+        
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"started_at": self.started_at.isoformat(), **metadata},
+        }
+    
+    def export(self, path: Path, **metadata):
+        atomic_write_text(path, json.dumps(self.to_chrome(**metadata)))
+
+
+CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace_span(
+    name: str,
+    category: str = "orchestrator",
+    lane: Optional[str] = None,
+    parent: Optional[Span] = None,
+    **args,
+):
+    """Time a stage as a child of the current span. A no-op outside a traced run."""
+    parent = parent or CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+    
+    span = parent.tracer.start(name, category, lane or parent.lane, parent, **args)
+    token = CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.args["error"] = type(e).__name__
+        raise
+    finally:
+        CURRENT_SPAN.reset(token)
+        parent.tracer.finish(span)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# METRICS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+class Metrics:
+    """Process-wide counters, gauges and histograms in Prometheus text format."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        self._values: Dict[str, Dict[Tuple, Any]] = {}
+    
+    def describe(self, name: str, kind: str, help_text: str, buckets: Tuple[float, ...] = ()):
+        self._meta[name] = (kind, help_text, tuple(buckets))
+        self._values.setdefault(name, {})
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+    
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+    
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values[name].get(tuple(sorted(labels.items())), 0)
+    
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._meta[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values[name].get(key, ([0] * len(buckets), 0.0, 0))
+            counts = [c + (value <= le) for c, le in zip(counts, buckets)]
+            self._values[name][key] = (counts, total + value, count + 1)
+    
+    @staticmethod
+    def _labels(pairs) -> str:
+        if not pairs:
+            return ""
+        
+        def escape(value: Any) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+    
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{self._labels(key)} {value}")
+                        continue
+                    counts, total, count = value
+                    for le, c in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{self._labels(key + (('le', f'{le:g}'),))} {c}")
+                    lines.append(f"{name}_bucket{self._labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {total}")
+                    lines.append(f"{name}_count{self._labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+METRICS.describe("orchestrator_agent_duration_seconds", "histogram",
+                 "Wall time of an agent run, retries included.", DURATION_BUCKETS)
+METRICS.describe("orchestrator_agent_runs_total", "counter",
+                 "Finished agent runs by outcome (success, failure, cached).")
+METRICS.describe("orchestrator_agent_running", "gauge", "1 while the agent is running.")
+METRICS.describe("orchestrator_agent_started_timestamp_seconds", "gauge",
+                 "Unix time the agent's current or last run started.")
+METRICS.describe("orchestrator_agent_retries_total", "counter", "Attempts retried after a failure.")
+METRICS.describe("orchestrator_agent_timeouts_total", "counter", "Attempts that hit their timeout.")
+METRICS.describe("orchestrator_agent_output_bytes_total", "counter",
+                 "Bytes of claude output received, growing while an agent makes progress.")
+METRICS.describe("orchestrator_cache_hits_total", "counter", "Artifact cache hits.")
+METRICS.describe("orchestrator_cache_misses_total", "counter", "Artifact cache misses.")
+METRICS.describe("orchestrator_cache_hit_ratio", "gauge", "Cache hits over lookups in this process.")
+METRICS.describe("orchestrator_coalesced_runs_total", "counter",
+                 "Agent runs served by a concurrent run of the same cache key.")
+METRICS.describe("orchestrator_remote_cache_hits_total", "counter",
+                 "Local cache misses served by the remote cache.")
+METRICS.describe("orchestrator_remote_cache_misses_total", "counter",
+                 "Local cache misses the remote cache could not serve.")
+METRICS.describe("orchestrator_remote_cache_uploads_total", "counter",
+                 "Entries written back to the remote cache.")
+METRICS.describe("orchestrator_remote_cache_errors_total", "counter",
+                 "Remote cache requests that failed or returned corrupt data.")
+METRICS.describe("orchestrator_subprocesses_in_flight", "gauge", "claude processes currently running.")
+METRICS.describe("orchestrator_host_slot_waiters", "gauge",
+                 "Attempts waiting for a host-wide agent slot.")
+METRICS.describe("orchestrator_rate_limit_waiters", "gauge",
+                 "Attempts queued for request or token budget.")
+METRICS.describe("orchestrator_rate_limit_wait_seconds_total", "counter",
+                 "Time attempts spent queued for request or token budget.")
+METRICS.describe("orchestrator_rate_limited_total", "counter",
+                 "claude calls rejected by the provider's rate limit.")
+METRICS.describe("orchestrator_agents_queued", "gauge",
+                 "Agents whose dependencies are met, waiting for max_concurrent_agents.")
+METRICS.describe("orchestrator_agents_pending", "gauge", "Agents not started yet.")
+METRICS.describe("orchestrator_checkpoint_duration_seconds", "histogram",
+                 "Time to write a checkpoint.", (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60))
+METRICS.describe("orchestrator_checkpoint_bytes_total", "counter",
+                 "Bytes of new blobs written by checkpoints.")
+METRICS.describe("orchestrator_log_records_dropped_total", "counter",
+                 "Log records dropped because the log writer's queue was full.")
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass  # scrapes would flood the console
+
+
+def start_metrics_server(config: Dict) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics when ``metrics.enabled`` is set. One server per process."""
+    global _metrics_server
+    metrics_config = config.get("metrics", {})
+    if _metrics_server is not None or not metrics_config.get("enabled", False):
+        return _metrics_server
+    
+    host = metrics_config.get("host", "127.0.0.1")
+    port = metrics_config.get("port", 9464)
+    try:
+        _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        log("WARN", f"Metrics endpoint disabled, cannot bind {host}:{port}: {e}")
+        return None
+    _metrics_server.daemon_threads = True
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+    log("INFO", f"Metrics at http://{host}:{_metrics_server.server_address[1]}/metrics")
+    return _metrics_server
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# orchestrator_client.py sits next to the package, in the script directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from aiworkflow import telemetry  # noqa: E402
+
+
+@pytest.fixture(autouse=True, scope="session")
+def log_writer(tmp_path_factory):
+    """Keep test log records out of the script directory's logs."""
+    writer = telemetry.LogWriter(tmp_path_factory.mktemp("logs"))
+    telemetry._log_writer = writer
+    yield writer
+    writer.close()
+    telemetry._log_writer = None
@@ -0,0 +1,49 @@
+from aiworkflow.bus import Message, MessageBus
+
+
+def handoff(workflow_id, to_agent, version, timestamp):
+    return Message.handoff("architect", to_agent, {"artifact": "api_design.json", "version": version},
+                           workflow_id=workflow_id, timestamp=timestamp)
+
+
+def test_inbox_returns_latest_batch(tmp_path):
+    bus = MessageBus(tmp_path)
+    bus.publish([handoff("wf-1", "devops", 1, "2026-01-01T00:00:00Z")])
+    bus.publish([handoff("wf-1", "devops", 2, "2026-01-01T00:01:00Z")])
+
+    assert [m.payload["version"] for m in bus.inbox("wf-1", "devops")] == [2]
+    assert len(bus.query(to_agent="devops")) == 2
+
+
+def test_reopened_bus_reads_closed_segments(tmp_path):
+    bus = MessageBus(tmp_path, segment_bytes=1)
+    bus.publish([handoff("wf-1", "devops", 1, "2026-01-01T00:00:00Z")])
+    bus.publish([handoff("wf-1", "qa_tester", 1, "2026-01-01T00:01:00Z")])
+    bus.close()
+
+    reopened = MessageBus(tmp_path, segment_bytes=1)
+    assert [m.to_agent for m in reopened.query(workflow_id="wf-1")] == ["devops", "qa_tester"]
+
+
+def test_compaction_drops_superseded_messages(tmp_path):
+    bus = MessageBus(tmp_path, segment_bytes=1, max_segments=100, retain_workflows=2)
+    for minute, workflow_id in enumerate(["wf-1", "wf-2", "wf-2", "wf-3"]):
+        bus.publish([handoff(workflow_id, "devops", minute, f"2026-01-01T00:0{minute}:00Z")])
+    assert len(bus.segments()) == 4  # all closed, the next publish opens a fifth
+
+    bus.compact()
+
+    assert len(bus.segments()) == 1
+    kept = [(m.workflow_id, m.payload["version"]) for m in bus.query(to_agent="devops")]
+    assert kept == [("wf-2", 2), ("wf-3", 3)]
+    bus.close()
+    assert [m.payload["version"] for m in MessageBus(tmp_path).inbox("wf-2", "devops")] == [2]
+
+
+def test_compaction_runs_past_max_segments(tmp_path):
+    bus = MessageBus(tmp_path, segment_bytes=1, max_segments=3)
+    for minute in range(6):
+        bus.publish([handoff("wf-1", "devops", minute, f"2026-01-01T00:0{minute}:00Z")])
+
+    assert len(bus.segments()) <= 4
+    assert [m.payload["version"] for m in bus.inbox("wf-1", "devops")] == [5]
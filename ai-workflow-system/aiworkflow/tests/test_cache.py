@@ -0,0 +1,69 @@
+import json
+import time
+
+from aiworkflow.cache import ArtifactCache, cache_key_inputs, compute_cache_key, tree_digest
+from aiworkflow.context import ContextSection
+
+
+def key_for(template="You are the architect.", context='{"a": 1, "b": 2}', settings=None, trees=None):
+    sections = [ContextSection("specs.json", context)]
+    inputs = cache_key_inputs("architect", template, sections, settings or {"model": "x"}, trees)
+    return compute_cache_key(inputs)
+
+
+def make_cache(tmp_path, ttl_hours=24):
+    root = tmp_path / "project"
+    root.mkdir()
+    cache_dir = tmp_path / "cache"
+    return ArtifactCache(cache_dir, root, [cache_dir], max_bytes=10 * 1024 * 1024, ttl_hours=ttl_hours)
+
+
+def test_key_ignores_formatting():
+    assert key_for() == key_for()
+    assert key_for(context='{"b": 2,\n "a": 1}') == key_for()
+    assert key_for(template="You are the architect.  \r\n") == key_for()
+
+
+def test_key_changes_with_inputs():
+    base = key_for()
+    assert key_for(template="You are the devops engineer.") != base
+    assert key_for(context='{"a": 1, "b": 3}') != base
+    assert key_for(settings={"model": "y"}) != base
+    assert key_for(trees={"src": "0" * 64}) != base
+
+
+def test_tree_digest_tracks_contents(tmp_path):
+    (tmp_path / "app.py").write_text("print(1)\n")
+    before = tree_digest(tmp_path)
+    assert tree_digest(tmp_path) == before
+    (tmp_path / "app.py").write_text("print(2)\n")
+    assert tree_digest(tmp_path) != before
+
+
+def test_put_then_get_restores_files(tmp_path):
+    cache = make_cache(tmp_path)
+    (cache.root / "src").mkdir()
+    (cache.root / "src" / "app.py").write_text("v1")
+    key = key_for()
+    cache.put("architect", key, None, ["src/app.py"])
+
+    (cache.root / "src" / "app.py").write_text("edited")
+    manifest = cache.get("architect", key)
+    assert manifest["files"] == ["src/app.py"]
+    assert (cache.root / "src" / "app.py").read_text() == "v1"
+    assert cache.get("architect", key_for(context="{}")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_or_malformed_entries_miss(tmp_path):
+    cache = make_cache(tmp_path, ttl_hours=1)
+    key = key_for()
+    for created_at in (time.time() - 2 * 3600, "yesterday", None):
+        cache.put("architect", key, None, [])
+        manifest_file = cache.entry_dir("architect", key) / "entry.json"
+        manifest = json.loads(manifest_file.read_text())
+        manifest["created_at"] = created_at
+        manifest_file.write_text(json.dumps(manifest))
+
+        assert cache.get("architect", key) is None
+        assert not cache.entry_dir("architect", key).exists()
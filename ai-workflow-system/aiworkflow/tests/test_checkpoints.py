@@ -0,0 +1,58 @@
+from aiworkflow.core import Workspace
+from aiworkflow.state import CheckpointManager, WorkflowState
+
+
+def make_project(tmp_path):
+    workspace = Workspace(tmp_path)
+    workspace.create()
+    workspace.src_dir.mkdir()
+    (workspace.state_dir / "specs.json").write_text('{"v": 1}')
+    (workspace.src_dir / "app.py").write_text("v1")
+    (workspace.src_dir / "util.py").write_text("shared")
+    return workspace
+
+
+def test_restore_rewrites_changed_files(tmp_path):
+    workspace = make_project(tmp_path)
+    manager = CheckpointManager(workspace)
+    checkpoint_id = manager.create("architect", WorkflowState.new())
+
+    (workspace.src_dir / "app.py").write_text("broken")
+    (workspace.state_dir / "specs.json").unlink()
+    (workspace.state_dir / "workflow_state.journal").write_text("{}\n")
+
+    assert manager.restore(checkpoint_id)
+    assert (workspace.src_dir / "app.py").read_text() == "v1"
+    assert (workspace.state_dir / "specs.json").read_text() == '{"v": 1}'
+    assert not (workspace.state_dir / "workflow_state.journal").exists()
+    assert not manager.restore("chk-missing-0")
+
+
+def test_unchanged_files_share_blobs(tmp_path):
+    workspace = make_project(tmp_path)
+    manager = CheckpointManager(workspace)
+    manager.create("architect", WorkflowState.new())
+    (workspace.src_dir / "app.py").write_text("v2")
+    manager.create("devops", WorkflowState.new())
+
+    blobs = list((workspace.checkpoints_dir / "blobs").glob("*/*"))
+    assert len(blobs) == 4  # specs.json, util.py, and both versions of app.py
+
+
+def test_gc_keeps_blobs_of_retained_checkpoints(tmp_path):
+    workspace = make_project(tmp_path)
+    manager = CheckpointManager(workspace)
+    first = manager.create("architect", WorkflowState.new())
+    (workspace.src_dir / "app.py").write_text("v2")
+    manager.create("devops", WorkflowState.new())
+    (workspace.src_dir / "app.py").write_text("v3")
+    last = manager.create("integration", WorkflowState.new())
+
+    assert manager.gc(keep_last_n=2) == 1  # only v1 of app.py was unreferenced
+    assert [cp["agent"] for cp in manager.list_all()] == ["devops", "integration"]
+    assert not (workspace.checkpoints_dir / first).exists()
+
+    (workspace.src_dir / "app.py").write_text("v4")
+    assert manager.restore(last)
+    assert (workspace.src_dir / "app.py").read_text() == "v3"
+    assert (workspace.src_dir / "util.py").read_text() == "shared"
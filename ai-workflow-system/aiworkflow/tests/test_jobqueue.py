@@ -0,0 +1,62 @@
+import json
+import time
+
+from aiworkflow.jobqueue import JobQueue
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(tmp_path / "queue.db", **kwargs)
+
+
+def enqueue(jobs, label="architect", priority=0):
+    return jobs.enqueue({"workflow_id": "wf-1", "agent": label, "label": label, "priority": priority})
+
+
+def test_claim_leases_most_urgent_job(tmp_path):
+    jobs = make_queue(tmp_path)
+    enqueue(jobs, "devops")
+    urgent = enqueue(jobs, "backend_developer", priority=5)
+
+    job = jobs.claim("w1")
+    assert job["id"] == urgent
+    assert jobs.get(urgent)["status"] == "leased"
+    assert jobs.complete(urgent, "w1", {"success": True})
+    assert jobs.get(urgent)["status"] == "done"
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    jobs = make_queue(tmp_path, lease_seconds=0.05)
+    job_id = enqueue(jobs)
+    assert jobs.claim("w1")["id"] == job_id
+    assert jobs.claim("w2") is None  # lease still held
+
+    time.sleep(0.1)
+    assert jobs.claim("w2")["id"] == job_id
+    # The lost worker can no longer renew or complete the job
+    assert not jobs.heartbeat(job_id, "w1")
+    assert not jobs.complete(job_id, "w1", {"success": True})
+    assert jobs.complete(job_id, "w2", {"success": True})
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    jobs = make_queue(tmp_path, lease_seconds=0.2)
+    job_id = enqueue(jobs)
+    jobs.claim("w1")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert jobs.heartbeat(job_id, "w1")
+    assert jobs.claim("w2") is None
+
+
+def test_job_fails_after_max_expiries(tmp_path):
+    jobs = make_queue(tmp_path, lease_seconds=0.02, max_expiries=2)
+    job_id = enqueue(jobs)
+    jobs.claim("w1")
+    time.sleep(0.05)
+    jobs.claim("w2")
+    time.sleep(0.05)
+
+    assert jobs.claim("w3") is None
+    job = jobs.get(job_id)
+    assert job["status"] == "failed"
+    assert not json.loads(job["result"])["success"]
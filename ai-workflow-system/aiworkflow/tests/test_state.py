@@ -0,0 +1,62 @@
+import json
+
+from aiworkflow.state import StateStore, WorkflowState
+
+
+def test_journal_replays_over_snapshot(tmp_path):
+    path = tmp_path / "workflow_state.json"
+    store = StateStore(WorkflowState.new("todo app"), path, commit_interval=0, compact_every=100)
+    store.flush()
+    store.needs_snapshot = False
+    store.update(current_agent="architect")
+    store.append("completed_agents", "product_manager")
+    store._commit()
+
+    assert store.journal_path.exists()
+    assert json.loads(path.read_text())["completed_agents"] == []
+    recovered = StateStore.recover(path)
+    assert recovered.current_agent == "architect"
+    assert recovered.completed_agents == ["product_manager"]
+    assert recovered.user_request == "todo app"
+
+
+def test_torn_journal_line_is_ignored(tmp_path):
+    path = tmp_path / "workflow_state.json"
+    store = StateStore(WorkflowState.new(), path, commit_interval=0, compact_every=100)
+    store.flush()
+    store.needs_snapshot = False
+    store.update(status="completed")
+    store._commit()
+    with open(store.journal_path, "a") as f:
+        f.write('{"op": "set", "field": "status", "val')
+
+    assert StateStore.recover(path).status == "completed"
+
+
+def test_stale_journal_is_not_replayed(tmp_path):
+    path = tmp_path / "workflow_state.json"
+    store = StateStore(WorkflowState.new(), path, commit_interval=0, compact_every=100)
+    store.flush()
+    store.needs_snapshot = False
+    store.update(status="failed")
+    store._commit()
+    stale = store.journal_path.read_text()
+
+    # A crash between the snapshot rename and the journal unlink leaves the
+    # old journal behind the newer snapshot
+    store.update(status="completed")
+    store.flush()
+    store.journal_path.write_text(stale)
+
+    assert StateStore.recover(path).status == "completed"
+    assert StateStore(WorkflowState.new(), path).seq == store.seq
+
+
+def test_close_compacts_into_snapshot(tmp_path):
+    path = tmp_path / "workflow_state.json"
+    store = StateStore(WorkflowState.new(), path, commit_interval=0.01, compact_every=100)
+    store.append("completed_agents", "architect")
+    store.close()
+
+    assert not store.journal_path.exists()
+    assert WorkflowState.load(path).completed_agents == ["architect"]
@@ -0,0 +1,108 @@
+"""Worker process that claims jobs from the queue and runs them."""
+
+import os
+import json
+import time
+import socket
+import asyncio
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+from .core import Workspace
+from .telemetry import get_log_writer, log, set_log_context
+from .policy import HostSlots
+from .executor import AgentExecutor
+from .jobqueue import JobQueue
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DISTRIBUTED WORKERS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Worker:
+    """Claims claude jobs from the queue and runs them under the retry policy."""
+    
+    def __init__(
+        self,
+        jobs: JobQueue,
+        config: Dict,
+        worker_id: Optional[str] = None,
+        concurrency: int = 1,
+        idle_exit: Optional[float] = None,
+    ):
+        self.jobs = jobs
+        self.config = config
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = max(1, concurrency)
+        self.idle_exit = idle_exit
+        self.slots = HostSlots(config.get("system", {}).get("max_host_agents", 8))
+        self.executors: Dict[str, AgentExecutor] = {}
+        self.last_active = time.time()
+    
+    def run(self):
+        asyncio.run(self.run_async())
+    
+    async def run_async(self):
+        log("INFO", f"Worker {self.worker_id} polling {self.jobs.path} "
+                    f"({self.concurrency} concurrent jobs)")
+        try:
+            await asyncio.gather(*(self.loop() for _ in range(self.concurrency)))
+        finally:
+            self.jobs.leave(self.worker_id)
+    
+    async def loop(self):
+        while True:
+            job = await asyncio.to_thread(self.jobs.claim, self.worker_id)
+            if job is None:
+                if self.idle_exit is not None and time.time() - self.last_active > self.idle_exit:
+                    return
+                await asyncio.sleep(self.jobs.poll_interval)
+                continue
+            await self.run_job(job)
+            self.last_active = time.time()
+    
+    async def run_job(self, job: Dict[str, Any]):
+        workspace = Workspace(Path(job["workspace"]))
+        executor = self.executors.get(job["workspace"])
+        if executor is None:
+            executor = AgentExecutor(None, self.config, workspace, self.slots)
+            self.executors[job["workspace"]] = executor
+        get_log_writer().route(job["workflow_id"], workspace.logs_dir)
+        set_log_context(workflow_id=job["workflow_id"], agent=job["agent"], attempt=None)
+        log("INFO", f"Running job {job['id']} ({job['label']})")
+        
+        started = time.time()
+        task = asyncio.ensure_future(executor.run_with_retries(
+            job["agent"], job["prompt"], Path(job["output_log"]), job["label"],
+            job["history_key"], job["max_retries"] or None,
+        ))
+        lost = False
+        while not task.done():
+            await asyncio.wait({task}, timeout=self.jobs.lease_seconds / 3)
+            if not task.done() and not await asyncio.to_thread(
+                self.jobs.heartbeat, job["id"], self.worker_id
+            ):
+                lost = True
+                task.cancel()
+        
+        try:
+            success, error_message, executed = task.result()
+        except asyncio.CancelledError:
+            success, error_message, executed = False, "cancelled", True
+        except Exception as e:
+            success, error_message, executed = False, str(e), True
+        
+        if lost:
+            log("WARN", f"Job {job['id']} was cancelled or taken over, dropping its result")
+            return
+        
+        missing = [f for f in json.loads(job["expected"] or "[]")
+                   if success and not (workspace.state_dir / f).exists()]
+        await asyncio.to_thread(self.jobs.complete, job["id"], self.worker_id, {
+            "success": success,
+            "error_message": error_message,
+            "executed": executed,
+            "duration_seconds": time.time() - started,
+            "missing_artifacts": missing,
+        })
+        log("INFO", f"Job {job['id']} {'done' if success else 'failed'}")
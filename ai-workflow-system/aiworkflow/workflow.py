@@ -0,0 +1,434 @@
+"""The workflow orchestrator that runs the agents phase by phase."""
+
+import time
+import asyncio
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+from .core import (
+    AGENTS,
+    CONTEXT_SOURCES,
+    PHASE_NAMES,
+    SCRIPT_DIR,
+    TREE_INPUTS,
+    AgentResult,
+    Colors,
+    Workspace,
+    load_config,
+    print_banner,
+    print_phase,
+)
+from .telemetry import (
+    CURRENT_SPAN,
+    METRICS,
+    Span,
+    Tracer,
+    configure_logging,
+    get_log_writer,
+    log,
+    set_log_context,
+    start_metrics_server,
+    trace_span,
+)
+from .cancellation import SHUTDOWN
+from .policy import HostSlots
+from .state import CheckpointManager, FingerprintStore, StateStore, WorkflowState
+from .executor import AgentExecutor
+from .jobqueue import JobQueue
+from .scheduler import DagScheduler, HandoffWatcher
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# WORKFLOW ORCHESTRATOR
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class WorkflowOrchestrator:
+    """Main orchestrator that coordinates all agents."""
+    
+    def __init__(
+        self,
+        user_request: str = "",
+        workspace: Optional[Workspace] = None,
+        isolated: bool = False,
+        distributed: Optional[bool] = None,
+        config: Optional[Dict] = None,
+    ):
+        self.config = config if config is not None else load_config()
+        configure_logging(self.config)
+        start_metrics_server(self.config)
+        state = WorkflowState.new(user_request)
+        
+        if workspace is None:
+            isolated = isolated or self.config.get("workspaces", {}).get("isolated", False)
+            workspace = Workspace.isolated(state.workflow_id) if isolated else Workspace.default()
+        self.workspace = workspace
+        self.workspace.create()
+        get_log_writer().route(state.workflow_id, self.workspace.logs_dir)
+        
+        self.slots = HostSlots(self.config.get("system", {}).get("max_host_agents", 8))
+        self.store = StateStore.from_config(state, self.workspace.state_file, self.config)
+        if distributed is None:
+            distributed = self.config.get("workers", {}).get("enabled", False)
+        self.jobs = JobQueue.from_config(self.config) if distributed else None
+        self.executor = AgentExecutor(
+            self.store, self.config, self.workspace, self.slots, self.jobs
+        )
+        self.checkpoint_manager = CheckpointManager(self.workspace)
+        self.fingerprints = FingerprintStore(
+            self.workspace.state_dir / "fingerprints.json", self.workspace.root
+        )
+        self.handoff = HandoffWatcher.from_config(self.config, self.workspace.state_dir)
+        self.tracing = self.config.get("tracing", {}).get("enabled", True)
+        self.tracer: Optional[Tracer] = None
+    
+    @property
+    def state(self) -> WorkflowState:
+        return self.store.state
+    
+    @property
+    def max_concurrent(self) -> int:
+        system = self.config.get("system", {})
+        if not system.get("parallel_execution", True):
+            return 1
+        return system.get("max_concurrent_agents", 4)
+    
+    @contextmanager
+    def traced(self, name: str):
+        """Trace a run under a root span, unless one is already open, and write it to
+        logs/trace_<workflow_id>_<time>.json when it ends."""
+        if not self.tracing or CURRENT_SPAN.get() is not None:
+            yield
+            return
+        
+        self.tracer = Tracer()
+        span = self.tracer.start(name, workflow_id=self.state.workflow_id)
+        token = CURRENT_SPAN.set(span)
+        try:
+            yield
+        finally:
+            CURRENT_SPAN.reset(token)
+            self.tracer.finish(span)
+            stamp = self.tracer.started_at.strftime("%Y%m%d-%H%M%S")
+            trace_file = self.workspace.logs_dir / f"trace_{self.state.workflow_id}_{stamp}.json"
+            try:
+                self.tracer.export(trace_file, workflow_id=self.state.workflow_id)
+                log("INFO", f"Trace written to {trace_file}")
+            except OSError as e:
+                log("WARN", f"Could not write trace: {e}")
+    
+    @contextmanager
+    def recorded(self, kind: str):
+        """Add this run to the run history when it ends; it succeeded if it left the
+        workflow completed."""
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            if self.executor.history is not None:
+                self.executor.history.record_run(
+                    workflow_id=self.state.workflow_id,
+                    kind=kind,
+                    workspace=str(self.workspace.root),
+                    started_at=started_at,
+                    duration_seconds=round(time.time() - started_at, 3),
+                    success=int(self.state.status == "completed"),
+                )
+    
+    def load_existing_state(self) -> bool:
+        """Load existing workflow state if available."""
+        state_file = self.workspace.state_file
+        self.store.close()
+        state = StateStore.recover(state_file)
+        loaded = state is not None
+        self.store = StateStore.from_config(state if loaded else self.state, state_file, self.config)
+        self.executor.store = self.store
+        get_log_writer().route(self.state.workflow_id, self.workspace.logs_dir)
+        return loaded
+    
+    def current_inputs(self, agent_name: str) -> Dict[str, str]:
+        return self.fingerprints.inputs(agent_name, self.executor.build_context(agent_name))
+    
+    def changed_outside_key(self, agent_name: str, inputs: Dict[str, str]) -> List[str]:
+        """Fingerprint inputs changed since the agent's last run that its cache
+        key does not cover, so a cache hit would not reflect them."""
+        record = self.fingerprints.records().get(agent_name)
+        if record is None:
+            return ["no fingerprint recorded"]
+        then = record["inputs"]
+        state = self.workspace.state_dir.relative_to(self.workspace.root)
+        keyed = {"prompt", "context"} | {
+            str(state / file) for file, _ in CONTEXT_SOURCES.get(agent_name, [])
+        }
+        trees = tuple(f"{d}/" for d in TREE_INPUTS.get(agent_name, []))
+        return sorted(
+            name for name in inputs.keys() | then.keys()
+            if inputs.get(name) != then.get(name) and name not in keyed and not name.startswith(trees)
+        )
+    
+    def settle_streamed(self, scheduler: "DagScheduler", results: List[AgentResult]):
+        """After a run with early starts, drop agents whose early run was cancelled or
+        restarted from the completed list, and refingerprint the confirmed ones,
+        whose upstream outputs were not final yet when they ran."""
+        if self.handoff is None:
+            return
+        failed = [r.agent_name for r in results if not r.success]
+        self.store.update(
+            completed_agents=list(dict.fromkeys(
+                a for a in self.state.completed_agents if a not in failed
+            )),
+            failed_agents=list(dict.fromkeys(self.state.failed_agents + failed)),
+        )
+        self.refresh_fingerprints(scheduler.streamed)
+    
+    def interrupted(self, results: List[AgentResult]):
+        """Record a run stopped by SIGINT or SIGTERM, so it can be resumed."""
+        cancelled = [r.agent_name for r in results if not r.success]
+        self.store.update(status="interrupted", current_agent=None)
+        self.store.flush()
+        log("ERROR", f"Workflow interrupted by {SHUTDOWN.name} in phase {self.state.current_phase}"
+                     + (f", cancelled {', '.join(cancelled)}" if cancelled else ""))
+    
+    def refresh_fingerprints(self, agents: set):
+        records = self.fingerprints.records()
+        for agent_name in agents:
+            if agent_name in records:
+                self.fingerprints.record(
+                    agent_name, self.current_inputs(agent_name), records[agent_name]["outputs"]
+                )
+    
+    def run_agent(self, agent_name: str) -> AgentResult:
+        """Run a single agent."""
+        with self.traced(f"run {agent_name}"):
+            return asyncio.run(self.run_agent_async(agent_name))
+    
+    async def run_agent_async(self, agent_name: str) -> AgentResult:
+        """Run a single agent on the running event loop."""
+        set_log_context(workflow_id=self.state.workflow_id, agent=agent_name, attempt=None)
+        
+        # Check dependencies
+        deps = AGENTS[agent_name]["deps"]
+        early = self.handoff is not None and agent_name in self.handoff.started_early
+        for dep in deps:
+            if dep not in self.state.completed_agents and not early:
+                log("WARN", f"Dependency {dep} not completed for {agent_name}")
+        
+        METRICS.set("orchestrator_agent_running", 1, agent=agent_name)
+        METRICS.set("orchestrator_agent_started_timestamp_seconds", time.time(), agent=agent_name)
+        try:
+            with trace_span(agent_name, category="agent", lane=agent_name) as span:
+                with trace_span("fingerprint"):
+                    inputs = await asyncio.to_thread(self.current_inputs, agent_name)
+                if agent_name in self.executor.cache_bypass and not self.changed_outside_key(agent_name, inputs):
+                    # Everything that changed is part of the cache key, so a hit is still valid
+                    self.executor.cache_bypass.discard(agent_name)
+                result = await self.executor.execute_async(agent_name)
+                
+                if result.success:
+                    await asyncio.to_thread(
+                        self.fingerprints.record, agent_name, inputs, result.output_files
+                    )
+                    with trace_span("state_flush"):
+                        await asyncio.to_thread(self.store.flush)
+                    keep_last_n = self.config.get("checkpoints", {}).get("keep_last_n")
+                    await asyncio.to_thread(
+                        self.checkpoint_manager.create, agent_name, self.state, keep_last_n
+                    )
+                
+                if span:
+                    span.args["success"] = result.success
+            
+            outcome = "cached" if result.cached else "success" if result.success else "failure"
+            METRICS.inc("orchestrator_agent_runs_total", agent=agent_name, outcome=outcome)
+            METRICS.observe("orchestrator_agent_duration_seconds", result.duration_seconds,
+                            agent=agent_name, outcome=outcome)
+        finally:
+            METRICS.set("orchestrator_agent_running", 0, agent=agent_name)
+        
+        return result
+    
+    def run_phase(self, phase_num: int, parallel: bool = False) -> List[AgentResult]:
+        """Run all agents in a phase."""
+        with self.traced(f"run phase {phase_num}"):
+            return asyncio.run(self.run_phase_async(phase_num, parallel))
+    
+    async def run_phase_async(self, phase_num: int, parallel: bool = False) -> List[AgentResult]:
+        """Run all agents in a phase on the running event loop."""
+        phase_agents = [
+            name for name, info in AGENTS.items()
+            if info["phase"] == phase_num
+        ]
+        
+        results = []
+        
+        with trace_span(f"phase {phase_num}: {PHASE_NAMES[phase_num]}", category="phase",
+                        lane=f"phase {phase_num}"):
+            if parallel and len(phase_agents) > 1:
+                # Parallel execution, cancelling the others when one fails
+                scheduler = DagScheduler(
+                    self.run_agent_async, len(phase_agents),
+                    agents={name: {**AGENTS[name], "deps": []} for name in phase_agents},
+                    fail_fast=self.executor.fail_fast,
+                )
+                await scheduler.run_async()
+                results = [scheduler.results[a] for a in phase_agents if a in scheduler.results]
+            else:
+                # Sequential execution
+                for agent in phase_agents:
+                    results.append(await self.run_agent_async(agent))
+        
+        return results
+    
+    def run_full_workflow(self) -> bool:
+        """Run the complete workflow."""
+        with self.traced("workflow"), self.recorded("workflow"):
+            print_banner()
+            start_time = time.time()
+            set_log_context(workflow_id=self.state.workflow_id)
+            
+            log("INFO", f"Starting workflow: {self.state.workflow_id}")
+            log("INFO", f"User request: {self.state.user_request}")
+            if self.workspace.root != SCRIPT_DIR:
+                log("INFO", f"Workspace: {self.workspace.root}")
+            
+            self.store.flush()
+            self.executor.tracker.reset()
+            
+            announced = set()
+            
+            # Phases overlap under the DAG scheduler, so each phase span runs from
+            # its first agent's start to its last agent's end
+            workflow_span = CURRENT_SPAN.get()
+            phase_spans: Dict[int, Span] = {}
+            remaining = {n: sum(1 for a in AGENTS.values() if a["phase"] == n) for n in PHASE_NAMES}
+            
+            def on_start(agent_name: str):
+                phase_num = AGENTS[agent_name]["phase"]
+                if phase_num not in announced:
+                    announced.add(phase_num)
+                    print_phase(PHASE_NAMES[phase_num], phase_num)
+                    if workflow_span:
+                        phase_spans[phase_num] = self.tracer.start(
+                            f"phase {phase_num}: {PHASE_NAMES[phase_num]}", "phase",
+                            f"phase {phase_num}", workflow_span,
+                        )
+                self.store.update(current_phase=PHASE_NAMES[phase_num].lower())
+            
+            async def run_in_phase(agent_name: str) -> AgentResult:
+                phase_num = AGENTS[agent_name]["phase"]
+                if phase_num in phase_spans:
+                    CURRENT_SPAN.set(phase_spans[phase_num])  # local to this agent's task
+                try:
+                    return await self.run_agent_async(agent_name)
+                finally:
+                    remaining[phase_num] -= 1
+                    if not remaining[phase_num] and phase_num in phase_spans:
+                        self.tracer.finish(phase_spans[phase_num])
+            
+            scheduler = DagScheduler(
+                run_in_phase, self.max_concurrent, on_start=on_start, handoff=self.handoff,
+                fail_fast=self.executor.fail_fast,
+            )
+            results = scheduler.run()
+            self.settle_streamed(scheduler, results)
+            for span in phase_spans.values():
+                if span.end is None:
+                    self.tracer.finish(span)
+            
+            if scheduler.interrupted:
+                self.interrupted(results)
+                return False
+            
+            # Check for failures
+            failures = [r for r in results if not r.success]
+            if failures or len(results) < len(AGENTS):
+                log("ERROR", f"Workflow failed in phase {self.state.current_phase}")
+                for f in failures:
+                    log("ERROR", f"  - {f.agent_name}: {f.error_message}")
+                return False
+            
+            path, path_seconds = scheduler.critical_path()
+            log("INFO", f"Critical path: {' → '.join(path)} ({path_seconds:.1f}s)")
+            
+            cache_stats = self.executor.cache.stats()
+            log("INFO", f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                        f"{cache_stats['evictions']} evictions")
+            
+            # Complete
+            self.store.update(status="completed", current_phase="done")
+            self.store.flush()
+            
+            duration = time.time() - start_time
+            
+            print()
+            print(f"{Colors.GREEN}╔═══════════════════════════════════════════════════════════════════════════════╗{Colors.NC}")
+            print(f"{Colors.GREEN}║                                                                               ║{Colors.NC}")
+            print(f"{Colors.GREEN}║   ✅  WORKFLOW COMPLETED SUCCESSFULLY                                         ║{Colors.NC}")
+            print(f"{Colors.GREEN}║                                                                               ║{Colors.NC}")
+            print(f"{Colors.GREEN}║   Total time: {duration:.1f} seconds                                                   ║{Colors.NC}")
+            print(f"{Colors.GREEN}║                                                                               ║{Colors.NC}")
+            print(f"{Colors.GREEN}╚═══════════════════════════════════════════════════════════════════════════════╝{Colors.NC}")
+            print()
+            
+            return True
+    
+    def rebuild(self, user_request: Optional[str] = None, dry_run: bool = False) -> bool:
+        """Rerun only the agents whose inputs changed since their last run, plus
+        everything downstream of them. ``user_request`` replaces the stored one."""
+        with self.traced("rebuild"), nullcontext() if dry_run else self.recorded("rebuild"):
+            set_log_context(workflow_id=self.state.workflow_id)
+            if user_request and user_request != self.state.user_request:
+                if dry_run:
+                    self.state.user_request = user_request  # never journaled or flushed
+                else:
+                    self.store.update(user_request=user_request)
+            
+            dirty = self.fingerprints.dirty(self.current_inputs, self.state.completed_agents)
+            if not dirty:
+                log("INFO", "Nothing to rebuild, every agent is up to date")
+                return True
+            
+            log("INFO", f"Rebuilding {len(dirty)} of {len(AGENTS)} agents:")
+            for agent_name, reason in dirty.items():
+                log("INFO", f"  {AGENTS[agent_name]['emoji']} {agent_name}: {reason}")
+            if dry_run:
+                return True
+            
+            self.store.update(
+                status="running",
+                completed_agents=[a for a in self.state.completed_agents if a not in dirty],
+                failed_agents=[a for a in self.state.failed_agents if a not in dirty],
+            )
+            
+            # The cache key covers the context, the template and TREE_INPUTS, but
+            # not every upstream output an agent reads; run_agent_async lifts the
+            # bypass for agents whose changed inputs are all keyed
+            self.executor.cache_bypass = set(dirty)
+            self.executor.tracker.reset()
+            subgraph = {
+                name: {**AGENTS[name], "deps": [d for d in AGENTS[name]["deps"] if d in dirty]}
+                for name in dirty
+            }
+            scheduler = DagScheduler(
+                self.run_agent_async, self.max_concurrent, agents=subgraph, handoff=self.handoff,
+                fail_fast=self.executor.fail_fast,
+            )
+            results = scheduler.run()
+            self.settle_streamed(scheduler, results)
+            self.executor.cache_bypass = set()
+            
+            if scheduler.interrupted:
+                self.interrupted(results)
+                return False
+            
+            failures = [r for r in results if not r.success]
+            if failures or len(results) < len(dirty):
+                log("ERROR", "Rebuild failed")
+                for f in failures:
+                    log("ERROR", f"  - {f.agent_name}: {f.error_message}")
+                self.store.flush()
+                return False
+            
+            self.store.update(status="completed", current_phase="done")
+            self.store.flush()
+            log("INFO", f"Rebuilt {', '.join(dirty)}")
+            return True
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+⏱️ AI Multi-Agent Orchestrator - Benchmark Suite
+================================================
+
+Measures the overhead the orchestrator adds on top of the agents themselves:
+logging, state persistence, context assembly, caching and checkpointing.
+A stub `claude` executable with tunable latency, output size, failure rate
+and files written is put on PATH, so no LLM is ever called.
+
+Every scenario runs in a throwaway copy of the system, in its own process,
+and reports wall time, orchestrator CPU, bytes written and peak RSS.
+
+Usage:
+    python3 benchmark.py
+    python3 benchmark.py --sizes 0,1000,5000 --concurrency 1,4 --json results.json
+    python3 benchmark.py --mode phase --latency 0.5 --failure-rate 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import itertools
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).parent
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STUB CLAUDE CLI
+# ═══════════════════════════════════════════════════════════════════════════════
+
+STUB_CLAUDE = r'''#!/usr/bin/env python3
+import os, re, sys, time, random, hashlib
+
+prompt = sys.stdin.read()
+time.sleep(float(os.environ.get("BENCH_LATENCY", "0.1")))
+
+if random.random() < float(os.environ.get("BENCH_FAILURE_RATE", "0")):
+    sys.stderr.write("overloaded\n")
+    sys.exit(1)
+
+tag = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+workdir = re.search(r"^Working directory: (.*)$", prompt, re.M)
+statedir = re.search(r"^State directory: (.*)$", prompt, re.M)
+
+if statedir:
+    os.makedirs(statedir.group(1), exist_ok=True)
+    with open(os.path.join(statedir.group(1), f"bench_{tag}.json"), "w") as f:
+        f.write('{"generated_by": "%s"}' % tag)
+
+if workdir:
+    out = os.path.join(workdir.group(1), "src", "generated", tag)
+    os.makedirs(out, exist_ok=True)
+    for i in range(int(os.environ.get("BENCH_FILES", "10"))):
+        with open(os.path.join(out, f"file_{i}.ts"), "w") as f:
+            f.write(f"export const value{i} = '{tag}';\n" * 20)
+
+chunk = "x" * 1023 + "\n"
+remaining = int(os.environ.get("BENCH_OUTPUT_BYTES", "65536"))
+while remaining > 0:
+    sys.stdout.write(chunk[:remaining])
+    remaining -= len(chunk)
+'''
+
+
+def install_stub(bin_dir: Path) -> Path:
+    """Write the stub `claude` executable into ``bin_dir``."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    stub = bin_dir / "claude"
+    stub.write_text(STUB_CLAUDE)
+    stub.chmod(0o755)
+    return stub
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SCENARIO SETUP
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def prepare_sandbox(root: Path, project_files: int, concurrency: int, cache: bool):
+    """Copy the orchestrator, prompts and config into ``root`` and seed src/."""
+    import yaml
+
+    for script in ("orchestrator.py", "orchestrator_client.py"):
+        shutil.copy(SCRIPT_DIR / script, root / script)
+    shutil.copytree(SCRIPT_DIR / "aiworkflow", root / "aiworkflow",
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    workflow_dir = root / ".ai-workflow"
+    workflow_dir.mkdir()
+    shutil.copytree(SCRIPT_DIR / ".ai-workflow" / "prompts", workflow_dir / "prompts")
+
+    config = yaml.safe_load((SCRIPT_DIR / ".ai-workflow" / "config.yaml").read_text())
+    config["system"]["max_concurrent_agents"] = concurrency
+    config["system"]["max_host_agents"] = max(concurrency, 1)
+    config["system"]["retry_delay_seconds"] = 0
+    config["retry"]["circuit_breaker_threshold"] = 0
+    config["cache"]["enabled"] = cache
+    (workflow_dir / "config.yaml").write_text(yaml.safe_dump(config, allow_unicode=True))
+
+    # An existing project of the requested size, as on a later iteration
+    src = root / "src" / "existing"
+    for i in range(project_files):
+        module = src / f"module_{i // 100}"
+        module.mkdir(parents=True, exist_ok=True)
+        (module / f"component_{i}.tsx").write_text(f"export const C{i} = () => null;\n" * 10)
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def proc_write_chars() -> Optional[int]:
+    """Bytes this process has passed to write() so far (Linux only)."""
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CHILD PROCESS (ONE SCENARIO)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def run_child(scenario: Dict):
+    """Run one scenario inside the sandbox and print its measurements as JSON."""
+    root = Path(scenario["root"])
+    sys.path.insert(0, str(root))
+    result_stream = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    import orchestrator
+
+    wchar_before = proc_write_chars()
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+
+    orch = orchestrator.WorkflowOrchestrator("Benchmark: a task tracker with teams and comments")
+    if scenario["mode"] == "phase":
+        results = orch.run_phase(3, parallel=scenario["concurrency"] > 1)
+        success = all(r.success for r in results)
+    else:
+        success = orch.run_full_workflow()
+    orch.store.close()
+    orchestrator.get_log_writer().flush()
+
+    wall = time.perf_counter() - wall_before
+    cpu = time.process_time() - cpu_before
+    wchar_after = proc_write_chars()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    result = {
+        **{k: scenario[k] for k in ("mode", "project_files", "concurrency", "latency",
+                                    "output_bytes", "failure_rate", "files_per_agent", "cache")},
+        "success": success,
+        "wall_seconds": round(wall, 3),
+        "orchestrator_cpu_seconds": round(cpu, 3),
+        "agent_cpu_seconds": round(children.ru_utime + children.ru_stime, 3),
+        "bytes_written": (wchar_after - wchar_before) if wchar_before is not None else None,
+        "workflow_dir_bytes": dir_size(root / ".ai-workflow"),
+        # ru_maxrss is KB on Linux, bytes on macOS
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                          * (1 if sys.platform == "darwin" else 1024),
+    }
+    result_stream.write(json.dumps(result) + "\n")
+    result_stream.flush()
+
+
+def run_scenario(scenario: Dict, bin_dir: Path) -> Dict:
+    """Run one scenario in a fresh sandbox and child process."""
+    with tempfile.TemporaryDirectory(prefix="orchestrator-bench-") as tmp:
+        root = Path(tmp)
+        prepare_sandbox(root, scenario["project_files"], scenario["concurrency"], scenario["cache"])
+
+        env = {
+            **os.environ,
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "BENCH_LATENCY": str(scenario["latency"]),
+            "BENCH_OUTPUT_BYTES": str(scenario["output_bytes"]),
+            "BENCH_FAILURE_RATE": str(scenario["failure_rate"]),
+            "BENCH_FILES": str(scenario["files_per_agent"]),
+        }
+        proc = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--child",
+             json.dumps({**scenario, "root": str(root)})],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0 or not proc.stdout.strip():
+            return {**scenario, "success": False, "error": proc.stderr.strip()[-2000:]}
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPORTING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def print_table(results: List[Dict]):
+    header = f"{'mode':<6} {'files':>6} {'conc':>4} {'ok':>3} {'wall s':>8} {'cpu s':>7} " \
+             f"{'written MB':>11} {'dir MB':>8} {'rss MB':>7}"
+    print(header)
+    print("─" * len(header))
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<6} {r['project_files']:>6} {r['concurrency']:>4}  ✗  {r['error'][:60]}")
+            continue
+        written = r["bytes_written"] / 1e6 if r["bytes_written"] is not None else float("nan")
+        print(f"{r['mode']:<6} {r['project_files']:>6} {r['concurrency']:>4} "
+              f"{'✓' if r['success'] else '✗':>3} {r['wall_seconds']:>8.2f} "
+              f"{r['orchestrator_cpu_seconds']:>7.2f} {written:>11.2f} "
+              f"{r['workflow_dir_bytes'] / 1e6:>8.2f} {r['peak_rss_bytes'] / 1e6:>7.1f}")
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the AI workflow orchestrator")
+    parser.add_argument("--mode", choices=["full", "phase"], default="full",
+                        help="Run the full workflow or only the parallel development phase")
+    parser.add_argument("--sizes", type=int_list, default=[0, 1000],
+                        help="Comma-separated number of existing files in src/")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4],
+                        help="Comma-separated max_concurrent_agents values")
+    parser.add_argument("--latency", type=float, default=0.1, help="Stub claude latency (s)")
+    parser.add_argument("--output-kb", type=int, default=64, help="Stub claude stdout size (KB)")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Probability that a stub call fails (retryable)")
+    parser.add_argument("--files-per-agent", type=int, default=10,
+                        help="Files the stub writes into src/ per call")
+    parser.add_argument("--cache", action="store_true", help="Leave the artifact cache enabled")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="orchestrator-bench-bin-") as bin_tmp:
+        bin_dir = Path(bin_tmp)
+        install_stub(bin_dir)
+
+        for size, concurrency, _ in itertools.product(args.sizes, args.concurrency, range(args.repeat)):
+            scenario = {
+                "mode": args.mode,
+                "project_files": size,
+                "concurrency": concurrency,
+                "latency": args.latency,
+                "output_bytes": args.output_kb * 1024,
+                "failure_rate": args.failure_rate,
+                "files_per_agent": args.files_per_agent,
+                "cache": args.cache,
+            }
+            results.append(run_scenario(scenario, bin_dir))
+
+    if args.json == "-":
+        print(json.dumps(results, indent=2))
+        return
+
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+🤖 AI Multi-Agent Orchestrator - Daemon Client
+==============================================
+
+Thin client for a daemon started with `orchestrator.py --daemon`. It only
+imports the standard library pieces it needs, so scripted pipelines that
+call the CLI many times skip reloading the orchestrator, its config and
+its state on every call. Without a running daemon, or for flags it does
+not handle, it hands over to orchestrator.py.
+
+Usage:
+    python3 orchestrator_client.py --status
+    python3 orchestrator_client.py -a qa_tester
+    python3 orchestrator_client.py "Your project description"
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+SCRIPT_DIR = Path(__file__).parent
+DAEMON_SOCKET = SCRIPT_DIR / ".ai-workflow" / "orchestrator.sock"
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CLIENT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class DaemonClient:
+    """Sends one command per connection to a running daemon, relaying its log lines."""
+    
+    def __init__(self, path: Path = DAEMON_SOCKET):
+        self.path = path
+    
+    def call(self, command: str, **args) -> Optional[Dict[str, Any]]:
+        """The daemon's final reply, or None when no daemon is listening."""
+        if not hasattr(socket, "AF_UNIX") or not self.path.exists():
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError:
+            sock.close()
+            return None
+        
+        with sock, sock.makefile("r", encoding="utf-8") as replies:
+            sock.sendall((json.dumps({"command": command, "args": args}) + "\n").encode())
+            for line in replies:
+                reply = json.loads(line)
+                if "log" not in reply:
+                    return reply
+                sys.stdout.write(reply["log"])
+                sys.stdout.flush()
+        return {"ok": False, "error": "Daemon closed the connection"}
+
+
+def forward_to_daemon(args: argparse.Namespace, client: DaemonClient) -> Optional[int]:
+    """Serve a CLI invocation through the daemon. Returns the exit code, or None
+    when no daemon is running or the flags need a process of their own."""
+    common = {"workspace": args.workspace}
+    if args.status:
+        request = ("status", common)
+    elif args.list:
+        request = ("checkpoints", common)
+    elif args.restore:
+        request = ("restore", {**common, "checkpoint_id": args.restore})
+    elif args.workspaces:
+        request = ("workspaces", {})
+    elif args.rebuild:
+        request = ("rebuild", {**common, "request": args.request, "dry_run": args.dry_run,
+                               "distributed": args.distributed})
+    elif args.agent:
+        request = ("agent", {**common, "agent": args.agent, "request": args.request,
+                             "distributed": args.distributed})
+    elif args.request:
+        request = ("run", {**common, "request": args.request, "isolated": args.isolated,
+                           "distributed": args.distributed})
+    else:
+        return None
+    
+    command, params = request
+    reply = client.call(command, **params)
+    if reply is None:
+        return None
+    if not reply["ok"]:
+        print(reply["error"])
+        return 1
+    
+    result = reply["result"]
+    if command == "status":
+        print(json.dumps(result, indent=2) if result else "No workflow state found")
+    elif command == "checkpoints":
+        for cp in result:
+            print(f"{cp['checkpoint_id']} ({cp['agent']}) - {cp['created_at']}")
+    elif command == "workspaces":
+        for workflow_id in result:
+            print(workflow_id)
+    return 0
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Client for a running orchestrator daemon",
+                                     add_help=False)
+    parser.add_argument("request", nargs="?")
+    parser.add_argument("-a", "--agent")
+    parser.add_argument("-r", "--restore")
+    parser.add_argument("-s", "--status", action="store_true")
+    parser.add_argument("-l", "--list", action="store_true")
+    parser.add_argument("-w", "--workspace")
+    parser.add_argument("-n", "--dry-run", action="store_true")
+    parser.add_argument("--isolated", action="store_true")
+    parser.add_argument("--workspaces", action="store_true")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--distributed", action="store_true")
+    
+    args, rest = parser.parse_known_args()
+    code = None if rest else forward_to_daemon(args, DaemonClient())
+    if code is not None:
+        sys.exit(code)
+    
+    orchestrator = str(SCRIPT_DIR / "orchestrator.py")
+    os.execv(sys.executable, [sys.executable, orchestrator, *sys.argv[1:]])
+
+
+if __name__ == "__main__":
+    main()